@@ -0,0 +1,110 @@
+# Copyright (c) 2015 Jonathan M. Lange <jml@mumak.net>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Time the parsed log cache on a log of fifty thousand tests: parsing the log
+without it, building an entry, loading an entry that is up to date, with and
+without looking at the results, and reading a single task back.
+
+    $ python benchmarks/cache.py
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from eliotreporter._cache import load_parsed_log
+from eliotreporter._parse import iter_test_results, parse_json_stream
+
+
+TESTS = 50000
+
+# Log messages within each test, between its start and end.
+MESSAGES = 5
+
+RUNS = 5
+
+
+def make_log(path):
+    with open(path, 'wb') as f:
+        for i in xrange(TESTS):
+            task_uuid = u'0335b448-7689-4f9a-a94b-%012d' % (i,)
+            test = u'myapp.tests.test_db.TestQuery.test_%d' % (i,)
+            messages = [dict(
+                task_uuid=task_uuid, task_level=[1], test=test,
+                action_type=u'trial:test', action_status=u'started',
+                timestamp=1435250867.0 + i)]
+            for j in range(MESSAGES):
+                messages.append(dict(
+                    task_uuid=task_uuid, task_level=[2 + j],
+                    message_type=u'myapp:db:query',
+                    query=u'SELECT * FROM users WHERE id = %d' % (j,),
+                    timestamp=1435250867.0 + i))
+            messages.append(dict(
+                task_uuid=task_uuid, task_level=[2 + MESSAGES],
+                action_type=u'trial:test', action_status=u'succeeded',
+                timestamp=1435250867.5 + i))
+            for message in messages:
+                f.write(json.dumps(message) + '\n')
+    return u'0335b448-7689-4f9a-a94b-%012d' % (TESTS // 2,)
+
+
+def parse_uncached(path):
+    with open(path, 'rb') as f:
+        return list(iter_test_results(parse_json_stream(f)))
+
+
+def measure(function):
+    times = []
+    for i in range(RUNS):
+        start = time.time()
+        function()
+        times.append(time.time() - start)
+    return min(times)
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'run.log')
+        cache = os.path.join(directory, 'cache')
+        task_uuid = make_log(path)
+
+        def build():
+            shutil.rmtree(cache, ignore_errors=True)
+            load_parsed_log(path, cache)
+
+        timings = [
+            ('uncached', measure(lambda: parse_uncached(path))),
+            ('build', measure(build)),
+            ('load', measure(lambda: load_parsed_log(path, cache))),
+            ('load+results', measure(
+                lambda: load_parsed_log(path, cache).results)),
+            ('load+task', measure(
+                lambda: load_parsed_log(path, cache).tasks([task_uuid]))),
+        ]
+        [entry] = os.listdir(cache)
+        size = os.path.getsize(os.path.join(cache, entry))
+        print('{} tests, {} byte log, {} byte entry'.format(
+            TESTS, os.path.getsize(path), size))
+        for name, seconds in timings:
+            print('{:>12}: {:>8.1f}ms'.format(name, seconds * 1e3))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+# Copyright (c) 2015 Jonathan M. Lange <jml@mumak.net>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compare serializing each message once for all sinks with serializing it once
+per sink, as separate Eliot destinations would.
+
+    $ python benchmarks/fanout.py
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from eliotreporter._sinks import FanOut, FileSink
+
+
+MESSAGES = 100000
+
+
+def make_messages(count):
+    messages = []
+    for i in range(count):
+        messages.append({
+            u'task_uuid': u'0335b448-7689-4f9a-a94b-%012d' % (i,),
+            u'task_level': [1],
+            u'action_type': u'trial:test',
+            u'action_status': u'started',
+            u'test': u'twisted.trial.test.test_reporter.Tests.test_%d' % (i,),
+            u'timestamp': 1435250867.777076 + i,
+        })
+    return messages
+
+
+def make_sinks(directory, count):
+    return [FileSink(os.path.join(directory, 'sink-%d.log' % (i,)))
+            for i in range(count)]
+
+
+def encode_once(messages, sinks):
+    fan_out = FanOut(sinks)
+    for message in messages:
+        fan_out.write(json.dumps(message) + '\n')
+    fan_out.close()
+
+
+def encode_per_sink(messages, sinks):
+    for message in messages:
+        for sink in sinks:
+            sink.write(json.dumps(message) + '\n')
+    for sink in sinks:
+        sink.close()
+
+
+def measure(function, messages, sink_count):
+    directory = tempfile.mkdtemp()
+    try:
+        sinks = make_sinks(directory, sink_count)
+        start = time.time()
+        function(messages, sinks)
+        return time.time() - start
+    finally:
+        shutil.rmtree(directory)
+
+
+def main():
+    messages = make_messages(MESSAGES)
+    print('{:>5}  {:>12}  {:>12}'.format('sinks', 'per-sink', 'once'))
+    for sink_count in [1, 3, 5]:
+        per_sink = measure(encode_per_sink, messages, sink_count)
+        once = measure(encode_once, messages, sink_count)
+        print('{:>5}  {:>10.3f}us  {:>10.3f}us'.format(
+            sink_count,
+            per_sink / MESSAGES * 1e6,
+            once / MESSAGES * 1e6))
+
+
+if __name__ == '__main__':
+    main()
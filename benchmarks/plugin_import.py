@@ -0,0 +1,126 @@
+# Copyright (c) 2015 Jonathan M. Lange <jml@mumak.net>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compare how long trial takes to start with a plugin module that imports the
+whole reporter, as it used to, with one that only describes it.
+
+Each is timed in fresh processes with the plugin cache already built, for
+``trial --help`` and for ``trial --help-reporters``, which loads every
+reporter plugin. It is also timed rebuilding the plugin cache from scratch.
+
+    $ python benchmarks/plugin_import.py
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+
+RUNS = 10
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The plugin module as it was before it stopped importing the reporter.
+EAGER_PLUGIN = """\
+import eliotreporter
+
+EliotReporter = eliotreporter.eliot_plugin
+"""
+
+with open(os.path.join(ROOT, 'twisted', 'plugins', '_eliotreporter.py')) as f:
+    LAZY_PLUGIN = f.read()
+
+TRIAL_HELP = [sys.executable, '-m', 'twisted.trial', '--help']
+
+TRIAL_HELP_REPORTERS = [
+    sys.executable, '-m', 'twisted.trial', '--help-reporters']
+
+REBUILD_CACHE = [sys.executable, '-c', (
+    'from twisted.plugin import IPlugin, getPlugins\n'
+    'import twisted.plugins\n'
+    'list(getPlugins(IPlugin, twisted.plugins))\n'
+)]
+
+
+def make_tree(directory, plugin):
+    """
+    Make a directory that can go on ``sys.path`` instead of the checkout,
+    with ``plugin`` as the only plugin module in it.
+    """
+    os.symlink(
+        os.path.join(ROOT, 'eliotreporter'),
+        os.path.join(directory, 'eliotreporter'))
+    plugins = os.path.join(directory, 'twisted', 'plugins')
+    os.makedirs(plugins)
+    with open(os.path.join(plugins, '_eliotreporter.py'), 'w') as f:
+        f.write(plugin)
+    return os.path.join(plugins, 'dropin.cache')
+
+
+def environment(directory):
+    environ = dict(os.environ)
+    paths = [
+        path for path in environ.get('PYTHONPATH', '').split(os.pathsep)
+        if path and os.path.abspath(path) != ROOT
+    ]
+    environ['PYTHONPATH'] = os.pathsep.join([directory] + paths)
+    environ['PYTHONDONTWRITEBYTECODE'] = '1'
+    return environ
+
+
+def run(command, directory):
+    with open(os.devnull, 'w') as devnull:
+        start = time.time()
+        subprocess.check_call(
+            command, cwd=directory, env=environment(directory),
+            stdout=devnull)
+        return time.time() - start
+
+
+def measure(plugin):
+    """
+    :return: The best of ``RUNS`` times for ``trial --help``, for
+        ``trial --help-reporters`` and for rebuilding the plugin cache.
+    """
+    directory = tempfile.mkdtemp()
+    try:
+        cache = make_tree(directory, plugin)
+        run(REBUILD_CACHE, directory)
+        help_time = min(run(TRIAL_HELP, directory) for i in range(RUNS))
+        reporters_time = min(
+            run(TRIAL_HELP_REPORTERS, directory) for i in range(RUNS))
+        rebuild_times = []
+        for i in range(RUNS):
+            os.remove(cache)
+            rebuild_times.append(run(REBUILD_CACHE, directory))
+        return help_time, reporters_time, min(rebuild_times)
+    finally:
+        shutil.rmtree(directory)
+
+
+def main():
+    print('{:>8}  {:>10}  {:>16}  {:>10}'.format(
+        'plugin', '--help', '--help-reporters', 'rebuild'))
+    for name, plugin in [('before', EAGER_PLUGIN), ('after', LAZY_PLUGIN)]:
+        times = measure(plugin)
+        print('{:>8}  {:>8.1f}ms  {:>14.1f}ms  {:>8.1f}ms'.format(
+            name, *[t * 1e3 for t in times]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+# Copyright (c) 2015 Jonathan M. Lange <jml@mumak.net>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compare getting test results from a log by parsing every line with parsing
+only the lines that could matter, on a log where 90% of the lines are
+messages logged by the code under test.
+
+    $ python benchmarks/pushdown.py
+"""
+
+import json
+import time
+
+from eliotreporter._parse import (
+    iter_test_results,
+    parse_json_stream,
+    parse_test_entries,
+)
+
+
+TESTS = 10000
+NOISE_PER_TEST = 18
+
+
+def make_lines(tests, noise_per_test):
+    lines = []
+    for i in range(tests):
+        task_uuid = u'0335b448-7689-4f9a-a94b-%012d' % (i,)
+        lines.append({
+            u'task_uuid': task_uuid,
+            u'task_level': [1],
+            u'action_type': u'trial:test',
+            u'action_status': u'started',
+            u'test': u'twisted.trial.test.test_reporter.Tests.test_%d' % (i,),
+            u'timestamp': 1435250867.777076 + i,
+        })
+        for j in range(noise_per_test):
+            lines.append({
+                u'task_uuid': u'd8f1c2e0-1b7a-4c4e-8f0e-%012d' % (j,),
+                u'task_level': [1, j],
+                u'message_type': u'myapp:db:query',
+                u'query': u'SELECT * FROM users WHERE id = %d' % (j,),
+                u'rows': [{u'id': j, u'name': u'user %d' % (j,)}],
+                u'timestamp': 1435250867.777076 + i,
+            })
+        lines.append({
+            u'task_uuid': task_uuid,
+            u'task_level': [2],
+            u'action_type': u'trial:test',
+            u'action_status': u'succeeded',
+            u'timestamp': 1435250868.777076 + i,
+        })
+    return [json.dumps(line) + '\n' for line in lines]
+
+
+def measure(parse, lines):
+    start = time.time()
+    results = list(iter_test_results(parse(lines)))
+    elapsed = time.time() - start
+    assert len(results) == TESTS
+    return elapsed
+
+
+def main():
+    lines = make_lines(TESTS, NOISE_PER_TEST)
+    full = measure(parse_json_stream, lines)
+    filtered = measure(parse_test_entries, lines)
+    print('{} lines, {} tests'.format(len(lines), TESTS))
+    print('parse_json_stream:  {:.3f}s'.format(full))
+    print('parse_test_entries: {:.3f}s ({:.1f}x)'.format(
+        filtered, full / filtered))
+
+
+if __name__ == '__main__':
+    main()
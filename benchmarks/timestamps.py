@@ -0,0 +1,80 @@
+# Copyright (c) 2015 Jonathan M. Lange <jml@mumak.net>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compare building a million ``Message`` objects when every timestamp is
+turned into a ``datetime`` straight away, as it used to be, with only
+turning it into one when it's looked up.
+
+    $ python benchmarks/timestamps.py
+"""
+
+from datetime import datetime
+import time
+
+from pyrsistent import m
+
+from eliotreporter._parse import Message, fmap, remove_fields
+
+
+MESSAGES = 1000000
+
+# Distinct messages to build them from, over and over.
+DISTINCT = 1000
+
+
+def make_contents(count):
+    return [
+        m(task_uuid=u'0335b448-7689-4f9a-a94b-%012d' % (i,),
+          task_level=[1, i % 7],
+          message_type=u'myapp:db:query',
+          query=u'SELECT * FROM users WHERE id = %d' % (i,),
+          timestamp=1435250867.777076 + i)
+        for i in range(count)]
+
+
+def eager_new(contents):
+    """
+    ``Message.new`` as it was, turning the timestamp into a ``datetime``.
+    """
+    fields = remove_fields(contents, ['task_uuid', 'task_level', 'timestamp'])
+    return Message(
+        task_uuid=contents.get('task_uuid'),
+        task_level=contents.get('task_level'),
+        timestamp=fmap(datetime.fromtimestamp, contents.get('timestamp')),
+        fields=fields,
+    )
+
+
+def measure(new, contents):
+    distinct = len(contents)
+    start = time.time()
+    for i in xrange(MESSAGES):
+        new(contents[i % distinct])
+    return time.time() - start
+
+
+def main():
+    contents = make_contents(DISTINCT)
+    eager = measure(eager_new, contents)
+    lazy = measure(Message.new, contents)
+    print('{} messages'.format(MESSAGES))
+    print('eager: {:.3f}s ({:.2f}us each)'.format(
+        eager, eager * 1e6 / MESSAGES))
+    print('lazy:  {:.3f}s ({:.2f}us each, {:.2f}x)'.format(
+        lazy, lazy * 1e6 / MESSAGES, eager / lazy))
+
+
+if __name__ == '__main__':
+    main()
@@ -16,12 +16,20 @@
 Eliot reporter for Trial.
 """
 
+from ._phases import (
+    PhasesMixin,
+    SynchronousPhasesMixin,
+)
 from ._reporter import (
     EliotReporter,
+    SubunitReporter,
     eliot_plugin,
 )
 
 __all__ = [
     'EliotReporter',
+    'PhasesMixin',
+    'SubunitReporter',
+    'SynchronousPhasesMixin',
     'eliot_plugin',
 ]
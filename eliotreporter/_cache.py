@@ -0,0 +1,453 @@
+# Copyright (c) 2015 Jonathan M. Lange <jml@mumak.net>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Keep parsed reporter logs on disk, so that analysing the same log again
+doesn't mean parsing it again.
+
+A cache entry has every ``TestResult`` in the log, and a compact index of
+where each task's messages are in it: the offsets of its first line and of
+the end of its last, so that tasks can be read back without reading the rest
+of the log. The results are stored in compressed chunks, one for each time
+the log was parsed, and only decoded when they're looked at, so loading an
+entry that is up to date costs little more than reading it.
+
+An entry also records how far into the log it got, along with the log's size
+and mtime and hashes of the log's first block and of the block just before
+where the entry stops. If the log has only been appended to, just the new
+tail is parsed. If anything else about it changed, it's parsed from scratch.
+Hashing a couple of blocks, rather than the whole log, keeps checking the
+cache cheap for logs of any size.
+"""
+
+from array import array
+import hashlib
+import json
+import os
+import struct
+import zlib
+
+from pyrsistent import freeze, pmap, pvector, thaw
+
+from ._parse import (
+    Message,
+    TestResult,
+    TestResultCollector,
+    parse_json_stream,
+    to_tasks,
+)
+
+
+_CACHE_VERSION = 2
+
+_BLOCK_SIZE = 2 ** 16
+
+"""
+The default size, in bytes, that a cache directory is kept under.
+"""
+DEFAULT_MAX_BYTES = 2 ** 30
+
+_CACHE_SUFFIX = '.cache'
+
+# Offsets into the log are kept in arrays of doubles, which hold every
+# offset below 2 ** 53 exactly, as Python 2's ``array`` has no unsigned
+# 64-bit type.
+_OFFSET_TYPECODE = 'd'
+
+_OFFSET_SIZE = array(_OFFSET_TYPECODE).itemsize
+
+# An entry starts with the length of its header.
+_HEADER_LENGTH = struct.Struct('>Q')
+
+
+def default_cache_directory(path):
+    """
+    Get the cache directory for the log at ``path``, which is next to it.
+    """
+    return os.path.join(
+        os.path.dirname(os.path.abspath(path)), '.trial-eliot-cache')
+
+
+class ParsedLog(object):
+    """
+    Everything parsed from the reporter log at ``path``.
+
+    ``results`` is a sequence of every ``TestResult``, in the order that the
+    tests finished, decoded the first time it's looked at. ``running`` is the
+    ``task_uuid`` of each test that started but hadn't finished by the end
+    of the log.
+    """
+
+    def __init__(self, path, entry):
+        self.path = path
+        self.running = pvector(task_uuid for task_uuid, _ in entry['running'])
+        self._entry = entry
+        self._index = None
+        self._results = None
+
+    @property
+    def results(self):
+        if self._results is None:
+            self._results = pvector(
+                TestResult(**dict(result, details=freeze(result['details'])))
+                for chunk in self._entry['results']
+                for result in json.loads(zlib.decompress(chunk)))
+        return self._results
+
+    def _ranges(self, task_uuids):
+        """
+        Get ``(start, end)`` for where each of ``task_uuids`` is in the log.
+        """
+        if self._index is None:
+            self._index = dict(
+                (task_uuid, i)
+                for i, task_uuid in enumerate(_decode_uuids(self._entry)))
+        starts, ends = self._entry['starts'], self._entry['ends']
+        ranges = []
+        for task_uuid in task_uuids:
+            i = self._index.get(task_uuid)
+            if i is not None:
+                ranges.append((int(starts[i]), int(ends[i])))
+        return ranges
+
+    def running_test_ids(self):
+        """
+        Get the tests that hadn't finished by the end of the log, such as the
+        one that was running when trial crashed, in the order they started.
+
+        :return: A list of ``(task_uuid, test_id)``, with the test id taken
+            from the first message of each task.
+        """
+        starts = sorted(
+            (start, task_uuid) for task_uuid, start in self._entry['running'])
+        with open(self.path, 'rb') as f:
+            lines = _read_lines(f, [start for start, _ in starts])
+            return [
+                (task_uuid, json.loads(line).get('test'))
+                for (_, task_uuid), line in zip(starts, lines)
+            ]
+
+    def running_tests(self):
+        """
+        Get the ids of the tests that hadn't finished by the end of the log,
+        in the order they started.
+        """
+        return [test for _, test in self.running_test_ids()]
+
+    def line_offsets(self, task_uuids):
+        """
+        Get where each line of the tasks ``task_uuids`` starts in the log.
+
+        :return: A sorted list of offsets.
+        """
+        task_uuids = set(task_uuids)
+        with open(self.path, 'rb') as f:
+            return [
+                offset for offset, message in _scan_ranges(
+                    f, self._ranges(task_uuids), task_uuids)]
+
+    def tasks(self, task_uuids=None):
+        """
+        Read tasks back from the log.
+
+        :param task_uuids: The tasks to read, or ``None`` for all of them.
+        :return: The tasks, as returned by ``to_tasks``.
+        """
+        with open(self.path, 'rb') as f:
+            if task_uuids is None:
+                messages = parse_json_stream(
+                    line for _, line in _iter_lines(
+                        f, 0, self._entry['offset']))
+            else:
+                task_uuids = set(task_uuids)
+                messages = (
+                    message for _, message in _scan_ranges(
+                        f, self._ranges(task_uuids), task_uuids))
+            tasks = to_tasks(Message.new(x) for x in messages)
+        return tasks if tasks else pmap()
+
+
+def _read_lines(f, offsets):
+    for offset in offsets:
+        f.seek(offset)
+        yield f.readline()
+
+
+def _iter_lines(f, start, end):
+    """
+    Yield ``(offset, line)`` for each line of ``f`` that isn't blank, from
+    the one at ``start`` to the one that ends at ``end``.
+    """
+    f.seek(start)
+    offset = start
+    for line in f:
+        if offset >= end:
+            break
+        if line.strip():
+            yield offset, line
+        offset += len(line)
+
+
+def _merge_ranges(ranges):
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def _scan_ranges(f, ranges, task_uuids):
+    """
+    Yield ``(offset, message)`` for each message of ``task_uuids`` in
+    ``ranges`` of ``f``, in the order they are in the log.
+    """
+    for start, end in _merge_ranges(ranges):
+        for offset, line in _iter_lines(f, start, end):
+            message = freeze(json.loads(line))
+            if message.get('task_uuid') in task_uuids:
+                yield offset, message
+
+
+def _decode_uuids(entry):
+    if not entry['tasks']:
+        return []
+    # ``None`` is stored as an empty line.
+    return [
+        task_uuid or None for task_uuid in
+        zlib.decompress(entry['uuids']).decode('utf-8').split(u'\n')]
+
+
+def _encode_uuids(task_uuids):
+    return zlib.compress(
+        u'\n'.join(task_uuid or u'' for task_uuid in task_uuids)
+        .encode('utf-8'))
+
+
+def _cache_path(cache_directory, path):
+    key = hashlib.sha1(os.path.abspath(path)).hexdigest()[:16]
+    return os.path.join(
+        cache_directory,
+        '{}-{}{}'.format(os.path.basename(path), key, _CACHE_SUFFIX))
+
+
+def _hash_block(f, start, end):
+    f.seek(start)
+    return hashlib.sha1(f.read(end - start)).hexdigest()
+
+
+def _fingerprint(f, offset):
+    """
+    Get hashes of the first block of ``f`` and of the block that ends at
+    ``offset``.
+    """
+    head = min(offset, _BLOCK_SIZE)
+    return [
+        _hash_block(f, 0, head),
+        _hash_block(f, max(0, offset - _BLOCK_SIZE), offset),
+    ]
+
+
+# What's in an entry's header, as opposed to the blocks after it.
+_HEADER_KEYS = (
+    'version', 'size', 'mtime', 'offset', 'fingerprint', 'running', 'tasks')
+
+
+def _read_entry(cache_path):
+    """
+    Read a cache entry: a header, then the compressed task ids, the start
+    and end offsets of each task, and the compressed chunks of results.
+    """
+    try:
+        with open(cache_path, 'rb') as f:
+            data = f.read()
+        [length] = _HEADER_LENGTH.unpack_from(data)
+        position = _HEADER_LENGTH.size + length
+        header = json.loads(
+            zlib.decompress(data[_HEADER_LENGTH.size:position]))
+    except (IOError, ValueError, zlib.error, struct.error):
+        return None
+    if header.get('version') != _CACHE_VERSION:
+        return None
+    entry = dict((key, header[key]) for key in _HEADER_KEYS)
+    offsets = header['tasks'] * _OFFSET_SIZE
+    blocks = []
+    for size in [header['uuids'], offsets, offsets] + header['results']:
+        blocks.append(data[position:position + size])
+        position += size
+    if position != len(data):
+        # Cut short.
+        return None
+    entry['uuids'] = blocks[0]
+    entry['starts'] = array(_OFFSET_TYPECODE, blocks[1])
+    entry['ends'] = array(_OFFSET_TYPECODE, blocks[2])
+    entry['results'] = blocks[3:]
+    return entry
+
+
+def _write_entry(cache_path, entry):
+    header = dict((key, entry[key]) for key in _HEADER_KEYS)
+    header['uuids'] = len(entry['uuids'])
+    header['results'] = [len(chunk) for chunk in entry['results']]
+    header = zlib.compress(json.dumps(header, separators=(',', ':')))
+    temporary_path = cache_path + '.tmp'
+    with open(temporary_path, 'wb') as f:
+        f.write(_HEADER_LENGTH.pack(len(header)))
+        f.write(header)
+        f.write(entry['uuids'])
+        f.write(entry['starts'].tostring())
+        f.write(entry['ends'].tostring())
+        for chunk in entry['results']:
+            f.write(chunk)
+    os.rename(temporary_path, cache_path)
+
+
+def _empty_entry():
+    return {
+        'version': _CACHE_VERSION,
+        'size': 0,
+        'mtime': None,
+        'offset': 0,
+        'fingerprint': None,
+        # [task_uuid, start] of each test that hadn't finished.
+        'running': [],
+        'tasks': 0,
+        'uuids': _encode_uuids([]),
+        'starts': array(_OFFSET_TYPECODE),
+        'ends': array(_OFFSET_TYPECODE),
+        'results': [],
+    }
+
+
+def _usable(entry, f, stat):
+    """
+    Can ``entry`` be used for the log ``f``, whose ``os.stat`` is ``stat``,
+    either as is or by parsing what's been appended since?
+    """
+    if entry is None or stat.st_size < entry['offset']:
+        return False
+    return entry['fingerprint'] == _fingerprint(f, entry['offset'])
+
+
+def _parse_tail(entry, f):
+    """
+    Add the complete lines of ``f`` after the ones already in ``entry``.
+    """
+    task_uuids = _decode_uuids(entry)
+    index = dict((task_uuid, i) for i, task_uuid in enumerate(task_uuids))
+    starts, ends = entry['starts'], entry['ends']
+    collector = TestResultCollector()
+    # Bring the tests that were still running back to where they were.
+    running = set(task_uuid for task_uuid, _ in entry['running'])
+    ranges = [
+        (int(starts[index[task_uuid]]), int(ends[index[task_uuid]]))
+        for task_uuid in running]
+    for _, message in _scan_ranges(f, ranges, running):
+        collector.feed(message)
+    results = []
+    offset = entry['offset']
+    f.seek(offset)
+    for line in f:
+        if not line.endswith('\n'):
+            # Still being written.
+            break
+        if line.strip():
+            message = freeze(json.loads(line))
+            task_uuid = message.get('task_uuid')
+            i = index.get(task_uuid)
+            if i is None:
+                index[task_uuid] = len(task_uuids)
+                task_uuids.append(task_uuid)
+                starts.append(offset)
+                ends.append(offset + len(line))
+            else:
+                ends[i] = offset + len(line)
+            result = collector.feed(message)
+            if result is not None:
+                results.append(
+                    dict(result.serialize(), details=thaw(result.details)))
+        offset += len(line)
+    entry['offset'] = offset
+    entry['running'] = [
+        [running_uuid, int(starts[index[running_uuid]])]
+        for running_uuid in collector.running_tasks()]
+    if len(task_uuids) != entry['tasks']:
+        entry['tasks'] = len(task_uuids)
+        entry['uuids'] = _encode_uuids(task_uuids)
+    if results:
+        entry['results'].append(
+            zlib.compress(json.dumps(results, separators=(',', ':'))))
+
+
+def _evict(cache_directory, max_bytes, keep):
+    """
+    Remove the least recently used cache entries until the ones left take
+    up no more than ``max_bytes``, never removing ``keep``.
+    """
+    entries = []
+    for name in os.listdir(cache_directory):
+        if not name.endswith(_CACHE_SUFFIX):
+            continue
+        path = os.path.join(cache_directory, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        try:
+            os.unlink(path)
+        except OSError:
+            continue
+        total -= size
+
+
+def load_parsed_log(path, cache_directory=None, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Parse a reporter log, using and updating the cache.
+
+    :param path: Path to a reporter log.
+    :param cache_directory: Where to keep parsed logs. Defaults to
+        ``default_cache_directory(path)``.
+    :param max_bytes: Remove the least recently used entries from
+        ``cache_directory`` once they take up more than this.
+    :return: A ``ParsedLog``.
+    """
+    if cache_directory is None:
+        cache_directory = default_cache_directory(path)
+    if not os.path.isdir(cache_directory):
+        os.makedirs(cache_directory)
+    cache_path = _cache_path(cache_directory, path)
+    entry = _read_entry(cache_path)
+    with open(path, 'rb') as f:
+        stat = os.fstat(f.fileno())
+        if not _usable(entry, f, stat):
+            entry = _empty_entry()
+        if (entry['size'], entry['mtime']) == (stat.st_size, stat.st_mtime):
+            # Mark it as recently used.
+            os.utime(cache_path, None)
+        else:
+            _parse_tail(entry, f)
+            entry['size'] = stat.st_size
+            entry['mtime'] = stat.st_mtime
+            entry['fingerprint'] = _fingerprint(f, entry['offset'])
+            _write_entry(cache_path, entry)
+            _evict(cache_directory, max_bytes, cache_path)
+    return ParsedLog(path, entry)
@@ -0,0 +1,259 @@
+# Copyright (c) 2015 Jonathan M. Lange <jml@mumak.net>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Group test failures by their likely root cause.
+
+Each error or failure is reduced to a signature: the exception type plus the
+frames of its traceback, with memory addresses, line numbers and temporary
+paths normalized away. Failures with the same signature are in the same
+cluster. Clusters whose signatures are merely similar are then merged, using
+MinHash with locality-sensitive hashing so that signatures are only ever
+compared with likely matches, never with every other signature.
+"""
+
+import argparse
+from collections import OrderedDict
+import hashlib
+import random
+import re
+import sys
+import zlib
+
+from pyrsistent import PClass, field, pvector
+
+from ._parse import iter_test_results, parse_test_entries
+from ._types import ERROR, FAILURE
+
+
+_FAILURE_MESSAGE_TYPES = frozenset([
+    ERROR.message_type,
+    FAILURE.message_type,
+])
+
+_PATH_CHARACTER = r'[^\s\'":,()]'
+_TEMP_PATH = re.compile(
+    r'(?:/private)?(?:/tmp|/var/tmp|/var/folders)/{0}*'
+    r'|{0}*_trial_temp{0}*'.format(_PATH_CHARACTER))
+_ADDRESS = re.compile(r'0x[0-9a-fA-F]+')
+_LINE_NUMBER = re.compile(r'(\bline |:)\d+\b')
+_NUMBER = re.compile(r'\d+')
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+
+def normalize(text):
+    """
+    Remove the parts of a traceback that differ between otherwise identical
+    failures.
+    """
+    text = _TEMP_PATH.sub(u'<tmp>', text)
+    text = _ADDRESS.sub(u'0x?', text)
+    return _LINE_NUMBER.sub(r'\1?', text)
+
+
+def get_frames(traceback):
+    """
+    Get the normalized frames of a traceback, as a list of strings.
+    """
+    frames = []
+    for line in normalize(traceback).splitlines():
+        line = line.strip()
+        # The header line repeats the exception, reason and all.
+        if line and not line.startswith(u'Traceback'):
+            frames.append(line)
+    return frames
+
+
+def get_signature(exception, frames):
+    data = u'\n'.join([exception] + frames).encode('utf-8')
+    return hashlib.sha1(data).hexdigest()
+
+
+def iter_failures(results):
+    """
+    Get every error and failure from a stream of ``TestResult``.
+
+    :return: An iterator of ``(test_id, message)``.
+    """
+    for result in results:
+        for detail in result.details:
+            if detail.get('message_type') in _FAILURE_MESSAGE_TYPES:
+                yield result.test, detail
+
+
+_PRIME = (1 << 61) - 1
+
+
+class _MinHasher(object):
+
+    def __init__(self, num_hashes, seed=0):
+        generator = random.Random(seed)
+        self._parameters = [
+            (generator.randrange(1, _PRIME), generator.randrange(0, _PRIME))
+            for i in range(num_hashes)
+        ]
+
+    def __call__(self, tokens):
+        hashes = [zlib.crc32(t.encode('utf-8')) & 0xffffffff for t in tokens]
+        if not hashes:
+            hashes = [0]
+        return tuple(
+            min((a * h + b) % _PRIME for h in hashes)
+            for a, b in self._parameters
+        )
+
+
+def _similarity(x, y):
+    """
+    Estimated Jaccard similarity of the token sets behind two MinHashes.
+    """
+    return sum(1 for a, b in zip(x, y) if a == b) / float(len(x))
+
+
+def _tokens(exception, reason, frames):
+    reason_words = _WORD.findall(_NUMBER.sub(u'#', normalize(reason)))
+    return set([exception] + frames + reason_words)
+
+
+class _UnionFind(object):
+
+    def __init__(self):
+        self._parents = {}
+
+    def find(self, x):
+        parents = self._parents
+        root = x
+        while parents.get(root, root) != root:
+            root = parents[root]
+        while x != root:
+            parent = parents[x]
+            parents[x] = root
+            x = parent
+        return root
+
+    def union(self, x, y):
+        x, y = self.find(x), self.find(y)
+        if x != y:
+            self._parents[y] = x
+
+
+class FailureCluster(PClass):
+    """
+    A group of failures that probably have the same root cause.
+
+    ``exception``, ``reason`` and ``frames`` are from one example failure.
+    ``signatures`` is the number of distinct signatures that were merged
+    into this cluster.
+    """
+
+    exception = field()
+    reason = field()
+    frames = field()
+    tests = field()
+    signatures = field()
+
+
+def cluster_failures(failures, threshold=0.6, num_hashes=32, bands=8):
+    """
+    Group failures by likely root cause.
+
+    :param failures: An iterable of ``(test_id, message)``, where each
+        message is a parsed error or failure message, as from
+        ``iter_failures``.
+    :param threshold: How similar two signatures must be, between 0 and 1,
+        for their clusters to be merged. 1 means only merge exact matches.
+    :param num_hashes: Number of MinHash functions. Must be a multiple of
+        ``bands``.
+    :param bands: Number of LSH bands. More bands find more near-duplicates,
+        at the cost of comparing more candidates.
+    :return: A list of ``FailureCluster``, biggest first.
+    """
+    exact = OrderedDict()
+    for test, message in failures:
+        exception = message.get('exception') or u''
+        reason = u'{}'.format(message.get('reason') or u'')
+        frames = get_frames(u'{}'.format(message.get('traceback') or u''))
+        signature = get_signature(exception, frames)
+        group = exact.get(signature)
+        if group is None:
+            group = exact[signature] = (exception, reason, frames, [])
+        group[3].append(test)
+
+    merged = _UnionFind()
+    if threshold < 1:
+        minhash = _MinHasher(num_hashes)
+        rows = num_hashes // bands
+        minhashes = {}
+        buckets = {}
+        for signature, (exception, reason, frames, _) in exact.items():
+            hashes = minhashes[signature] = minhash(
+                _tokens(exception, reason, frames))
+            for band in range(bands):
+                key = (band, hashes[band * rows:(band + 1) * rows])
+                candidate = buckets.setdefault(key, signature)
+                if (candidate != signature and
+                        _similarity(hashes, minhashes[candidate]) >=
+                        threshold):
+                    merged.union(candidate, signature)
+
+    clusters = OrderedDict()
+    for signature, group in exact.items():
+        clusters.setdefault(merged.find(signature), []).append(group)
+    result = []
+    for groups in clusters.values():
+        exception, reason, frames, _ = max(groups, key=lambda g: len(g[3]))
+        tests = [test for group in groups for test in group[3]]
+        result.append(FailureCluster(
+            exception=exception,
+            reason=reason,
+            frames=pvector(frames),
+            tests=pvector(tests),
+            signatures=len(groups),
+        ))
+    return sorted(result, key=lambda c: -len(c.tests))
+
+
+def format_clusters(clusters, max_tests=5):
+    lines = []
+    for i, cluster in enumerate(clusters, 1):
+        lines.append(u'#{}: {} failures, {} signatures'.format(
+            i, len(cluster.tests), cluster.signatures))
+        lines.append(u'  {}: {}'.format(cluster.exception, cluster.reason))
+        for frame in cluster.frames:
+            lines.append(u'    {}'.format(frame))
+        for test in cluster.tests[:max_tests]:
+            lines.append(u'  - {}'.format(test))
+        if len(cluster.tests) > max_tests:
+            lines.append(u'  ... and {} more'.format(
+                len(cluster.tests) - max_tests))
+        lines.append(u'')
+    return u'\n'.join(lines)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description='Group the failures in an Eliot reporter log by cause.')
+    parser.add_argument('log', help='Path to an Eliot reporter log.')
+    parser.add_argument(
+        '--threshold', type=float, default=0.6,
+        help=('How similar failures must be to be grouped together, '
+              'between 0 and 1. 1 means only group identical signatures.'))
+    parser.add_argument(
+        '--top', type=int, default=5, help='Show this many clusters.')
+    options = parser.parse_args(args)
+    with open(options.log) as f:
+        failures = iter_failures(iter_test_results(parse_test_entries(f)))
+        clusters = cluster_failures(failures, options.threshold)
+    output = format_clusters(clusters[:options.top])
+    sys.stdout.write(output.encode('utf-8'))
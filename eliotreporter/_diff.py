@@ -0,0 +1,230 @@
+# Copyright (c) 2015 Jonathan M. Lange <jml@mumak.net>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compare the outcomes and durations of two test runs.
+
+Only one of the runs is held in memory, as a summary of each test's outcome
+and duration. The other is streamed past it.
+"""
+
+import argparse
+import os
+import sys
+
+from pyrsistent import PClass, field, pvector
+
+from ._parse import (
+    FAILING_OUTCOMES,
+    SKIP,
+    iter_test_results,
+    parse_test_entries,
+)
+
+
+# A test that used to fail isn't fixed if it's still failing, or if it's gone.
+_NOT_FIXED = FAILING_OUTCOMES | frozenset([None])
+
+OLD = 'old'
+NEW = 'new'
+
+
+class TestChange(PClass):
+    """
+    How a single test differs between two runs.
+
+    Outcomes and durations are ``None`` for a run the test wasn't in.
+    """
+
+    test = field()
+    old_outcome = field()
+    new_outcome = field()
+    old_duration = field()
+    new_duration = field()
+
+
+class RunDiff(PClass):
+    """
+    The interesting differences between two runs.
+
+    Each field is a sequence of ``TestChange``, sorted by test id, except
+    for ``slower``, which is sorted with the biggest slowdown first.
+    """
+
+    new_failures = field()
+    fixed = field()
+    newly_skipped = field()
+    slower = field()
+
+
+def summarize(results):
+    """
+    Get the outcome and duration of each test.
+
+    :param results: An iterable of ``TestResult``.
+    :return: A ``dict`` mapping test id to ``(outcome, duration)``.
+    """
+    return dict(
+        (result.test, (result.outcome, result.duration()))
+        for result in results
+    )
+
+
+def _is_slower(old_duration, new_duration, ratio, minimum):
+    if old_duration is None or new_duration is None:
+        return False
+    return (new_duration - old_duration >= minimum and
+            new_duration >= old_duration * ratio)
+
+
+def diff_runs(old, new, smaller=OLD, ratio=1.5, minimum=0.1):
+    """
+    Find the differences between two runs.
+
+    :param old: An iterable of ``TestResult`` from the earlier run.
+    :param new: An iterable of ``TestResult`` from the later run.
+    :param smaller: Which of the runs, ``OLD`` or ``NEW``, to hold in
+        memory. The other is only iterated over.
+    :param ratio: A test counts as slower if it takes at least ``ratio``
+        times as long as it did...
+    :param minimum: ... and at least ``minimum`` seconds longer.
+    :return: A ``RunDiff``. A test that is in a run more than once, e.g.
+        because it was run again, is compared by its last result.
+    """
+    if smaller == OLD:
+        summary, streamed = summarize(old), new
+    else:
+        summary, streamed = summarize(new), old
+
+    # Each maps test id to its ``TestChange``, so that a later result for a
+    # test replaces an earlier one.
+    new_failures = {}
+    fixed = {}
+    newly_skipped = {}
+    slower = {}
+
+    def compare(test, old_outcome, old_duration, new_outcome, new_duration):
+        for section in (new_failures, fixed, newly_skipped, slower):
+            section.pop(test, None)
+        sections = []
+        if (new_outcome in FAILING_OUTCOMES and
+                old_outcome not in FAILING_OUTCOMES):
+            sections.append(new_failures)
+        if old_outcome in FAILING_OUTCOMES and new_outcome not in _NOT_FIXED:
+            sections.append(fixed)
+        if new_outcome == SKIP and old_outcome != SKIP:
+            sections.append(newly_skipped)
+        if _is_slower(old_duration, new_duration, ratio, minimum):
+            sections.append(slower)
+        if not sections:
+            return
+        change = TestChange(
+            test=test,
+            old_outcome=old_outcome,
+            new_outcome=new_outcome,
+            old_duration=old_duration,
+            new_duration=new_duration,
+        )
+        for section in sections:
+            section[test] = change
+
+    # Summaries of the tests that have been streamed past, moved out of
+    # ``summary`` so that what's left are the tests only in one run.
+    matched = {}
+    for result in streamed:
+        if result.test in summary:
+            matched[result.test] = summary.pop(result.test)
+        other_outcome, other_duration = matched.get(
+            result.test, (None, None))
+        if smaller == OLD:
+            compare(result.test, other_outcome, other_duration,
+                    result.outcome, result.duration())
+        else:
+            compare(result.test, result.outcome, result.duration(),
+                    other_outcome, other_duration)
+
+    # Tests that were only in the run we summarized.
+    for test, (outcome, duration) in summary.items():
+        if smaller == OLD:
+            compare(test, outcome, duration, None, None)
+        else:
+            compare(test, None, None, outcome, duration)
+
+    by_test = lambda change: change.test
+    return RunDiff(
+        new_failures=pvector(sorted(new_failures.values(), key=by_test)),
+        fixed=pvector(sorted(fixed.values(), key=by_test)),
+        newly_skipped=pvector(sorted(newly_skipped.values(), key=by_test)),
+        slower=pvector(sorted(
+            slower.values(),
+            key=lambda c: (c.old_duration - c.new_duration, c.test))),
+    )
+
+
+def format_diff(diff):
+    """
+    Format a ``RunDiff`` for humans.
+    """
+    lines = []
+
+    def section(title, changes, describe):
+        if not changes:
+            return
+        lines.append(u'{} ({}):'.format(title, len(changes)))
+        for change in changes:
+            lines.append(u'  {}{}'.format(change.test, describe(change)))
+        lines.append(u'')
+
+    def outcomes(change):
+        return u' ({} -> {})'.format(change.old_outcome, change.new_outcome)
+
+    def durations(change):
+        return u' ({:.3f}s -> {:.3f}s)'.format(
+            change.old_duration, change.new_duration)
+
+    section(u'New failures', diff.new_failures, outcomes)
+    section(u'Fixed', diff.fixed, outcomes)
+    section(u'Newly skipped', diff.newly_skipped, outcomes)
+    section(u'Slower', diff.slower, durations)
+    if not lines:
+        return u'No differences.\n'
+    return u'\n'.join(lines)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description='Compare two Eliot reporter logs.')
+    parser.add_argument('old', help='Reporter log of the earlier run.')
+    parser.add_argument('new', help='Reporter log of the later run.')
+    parser.add_argument(
+        '--ratio', type=float, default=1.5,
+        help=('Report tests that take at least this many times as long as '
+              'they used to...'))
+    parser.add_argument(
+        '--minimum', type=float, default=0.1,
+        help='... and at least this many seconds longer.')
+    options = parser.parse_args(args)
+    if os.path.getsize(options.old) <= os.path.getsize(options.new):
+        smaller = OLD
+    else:
+        smaller = NEW
+    with open(options.old) as old, open(options.new) as new:
+        diff = diff_runs(
+            iter_test_results(parse_test_entries(old)),
+            iter_test_results(parse_test_entries(new)),
+            smaller=smaller,
+            ratio=options.ratio,
+            minimum=options.minimum,
+        )
+    sys.stdout.write(format_diff(diff).encode('utf-8'))
@@ -0,0 +1,96 @@
+# Copyright (c) 2015 Jonathan M. Lange <jml@mumak.net>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Environment variables that turn on the Eliot reporter's optional features.
+
+They live here, apart from the features, so that the reporter can tell
+which features are on without importing the ones that are off.
+"""
+
+
+"""
+Environment variable listing files that the Eliot reporter should write its
+output to, as well as to its stream, separated by ``os.pathsep``. Files
+ending in ``.gz`` are compressed.
+"""
+FILES_ENVIRONMENT_VARIABLE = 'TRIAL_ELIOT_FILES'
+
+"""
+Environment variable naming a directory for the Eliot reporter to write its
+output to as a series of segments, as well as to its stream.
+"""
+SEGMENTS_ENVIRONMENT_VARIABLE = 'TRIAL_ELIOT_SEGMENTS'
+
+"""
+Environment variables with the size, in bytes, and number of tests after
+which to start a new segment.
+"""
+SEGMENT_BYTES_ENVIRONMENT_VARIABLE = 'TRIAL_ELIOT_SEGMENT_BYTES'
+SEGMENT_TESTS_ENVIRONMENT_VARIABLE = 'TRIAL_ELIOT_SEGMENT_TESTS'
+
+"""
+Environment variable naming a file for the Eliot reporter to also write
+subunit v2 to.
+"""
+SUBUNIT_ENVIRONMENT_VARIABLE = 'TRIAL_ELIOT_SUBUNIT'
+
+"""
+Environment variable that tells the Eliot reporter where to send its output,
+as well as to its stream. Either ``unix:<path>`` or ``tcp:<host>:<port>``.
+"""
+LIVE_FEED_ENVIRONMENT_VARIABLE = 'TRIAL_ELIOT_LIVE'
+
+"""
+Environment variable that tells the Eliot reporter to ship its output to a
+collector, as well as writing it to its stream. Either ``unix:<path>`` or
+``tcp:<host>:<port>``.
+"""
+SHIP_ENVIRONMENT_VARIABLE = 'TRIAL_ELIOT_SHIP'
+
+"""
+Environment variable with the most time, in seconds, that shipping may add
+to a test run.
+"""
+SHIP_BUDGET_ENVIRONMENT_VARIABLE = 'TRIAL_ELIOT_SHIP_BUDGET'
+
+"""
+Environment variable that turns on memory tracking. Its value is how many
+allocation sites to log for each test.
+"""
+MEMORY_ENVIRONMENT_VARIABLE = 'TRIAL_ELIOT_MEMORY'
+
+"""
+Environment variable with the fraction of tests to track memory for, between
+0 and 1. Defaults to 1.
+"""
+MEMORY_SAMPLE_ENVIRONMENT_VARIABLE = 'TRIAL_ELIOT_MEMORY_SAMPLE'
+
+"""
+Environment variable with the fraction of passing tests to log, between 0
+and 1. If it isn't set, every test is logged.
+"""
+SAMPLE_ENVIRONMENT_VARIABLE = 'TRIAL_ELIOT_SAMPLE'
+
+"""
+Environment variable with how many passing tests to drop before logging
+how many were dropped. Defaults to ``DEFAULT_COUNTS_INTERVAL`` in
+``_sampling``.
+"""
+COUNTS_INTERVAL_ENVIRONMENT_VARIABLE = 'TRIAL_ELIOT_SAMPLE_INTERVAL'
+
+"""
+Environment variable that, if set, turns on reactor instrumentation.
+"""
+REACTOR_ENVIRONMENT_VARIABLE = 'TRIAL_ELIOT_REACTOR'
@@ -0,0 +1,260 @@
+# Copyright (c) 2015 Jonathan M. Lange <jml@mumak.net>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Find flaky tests across many runs.
+
+A test is flaky if it both passes and fails (with an error or a failure)
+across runs of the same code. Nothing in a reporter log says which code was
+run, so it's up to the caller to only compare runs of the same code.
+
+Each log is boiled down to a summary of each test's outcome and duration,
+which is cached, so adding one more log only means parsing that one. The
+summaries are folded into the per-test counts one at a time, so only one is
+ever held in memory.
+"""
+
+import argparse
+from fnmatch import fnmatch
+from functools import partial
+import hashlib
+import json
+from multiprocessing import Pool
+import os
+import sys
+
+from pyrsistent import PClass, field
+
+from ._diff import summarize
+from ._parse import (
+    FAILING_OUTCOMES,
+    SUCCESS,
+    iter_test_results,
+    parse_test_entries,
+)
+
+
+_CACHE_VERSION = 2
+
+
+def summarize_log(path):
+    """
+    Get the outcome and duration of each test in a reporter log.
+
+    :return: A ``dict`` mapping test id to ``(outcome, duration)``.
+    """
+    with open(path) as f:
+        return summarize(iter_test_results(parse_test_entries(f)))
+
+
+def _fingerprint(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime]
+
+
+def _cache_path(cache_directory, path):
+    key = hashlib.sha1(os.path.abspath(path)).hexdigest()[:16]
+    return os.path.join(
+        cache_directory, '{}-{}.json'.format(os.path.basename(path), key))
+
+
+def _read_cached_summary(cache_directory, path):
+    try:
+        with open(_cache_path(cache_directory, path)) as f:
+            cached = json.load(f)
+    except (IOError, ValueError):
+        return None
+    if (cached.get('version') != _CACHE_VERSION or
+            cached.get('path') != os.path.abspath(path) or
+            cached.get('fingerprint') != _fingerprint(path)):
+        return None
+    return dict(
+        (test, tuple(summary)) for test, summary in cached['tests'].items())
+
+
+def _write_cached_summary(cache_directory, path, summary):
+    cache_path = _cache_path(cache_directory, path)
+    temporary_path = cache_path + '.tmp'
+    with open(temporary_path, 'w') as f:
+        json.dump({
+            'version': _CACHE_VERSION,
+            'path': os.path.abspath(path),
+            'fingerprint': _fingerprint(path),
+            'tests': summary,
+        }, f)
+    os.rename(temporary_path, cache_path)
+
+
+def load_summary(path, cache_directory=None):
+    """
+    Summarize a reporter log, using the cached summary if it's still good.
+
+    :param cache_directory: Where to keep summaries of logs that have already
+        been parsed, or ``None`` to not cache them.
+    :return: A summary, as returned by ``summarize_log``.
+    """
+    if cache_directory is None:
+        return summarize_log(path)
+    summary = _read_cached_summary(cache_directory, path)
+    if summary is None:
+        summary = summarize_log(path)
+        _write_cached_summary(cache_directory, path, summary)
+    return summary
+
+
+def iter_summaries(paths, cache_directory=None, processes=None):
+    """
+    Summarize many reporter logs, in parallel.
+
+    :param paths: Paths to reporter logs.
+    :param cache_directory: Where to keep summaries of logs that have already
+        been parsed, or ``None`` to not cache them.
+    :param processes: How many processes to parse logs with. ``None`` means
+        one per core.
+    :return: An iterator of summaries, as returned by ``summarize_log``, in
+        the same order as ``paths``.
+    """
+    if cache_directory is not None and not os.path.isdir(cache_directory):
+        os.makedirs(cache_directory)
+    load = partial(load_summary, cache_directory=cache_directory)
+    if len(paths) < 2 or processes == 1:
+        for path in paths:
+            yield load(path)
+        return
+    pool = Pool(processes)
+    try:
+        for summary in pool.imap(load, paths):
+            yield summary
+    finally:
+        pool.close()
+        pool.join()
+
+
+class FlakyTest(PClass):
+    """
+    A test that has both passed and failed.
+
+    ``flips`` is the number of times the test went from passing to failing,
+    or back, between consecutive runs it was in. ``wasted_time`` is the
+    total duration of its failing runs.
+    """
+
+    test = field()
+    runs = field()
+    passes = field()
+    failures = field()
+    flips = field()
+    wasted_time = field()
+
+    def flip_rate(self):
+        if self.runs < 2:
+            return 0.0
+        return self.flips / float(self.runs - 1)
+
+
+def find_flaky(summaries):
+    """
+    Find flaky tests.
+
+    :param summaries: An iterable of summaries of runs of the same code, as
+        returned by ``summarize_log``, oldest first. Each is only looked at
+        once, so it can be a stream of them.
+    :return: A list of ``FlakyTest``, most flaky first, with ties broken by
+        wasted time.
+    """
+    # test -> [runs, passes, failures, flips, wasted time, last outcome]
+    stats = {}
+    for summary in summaries:
+        for test, (outcome, duration) in summary.items():
+            if outcome in FAILING_OUTCOMES:
+                failed = True
+            elif outcome == SUCCESS:
+                failed = False
+            else:
+                # Skips and expected failures say nothing about flakiness.
+                continue
+            entry = stats.get(test)
+            if entry is None:
+                entry = stats[test] = [0, 0, 0, 0, 0.0, None]
+            entry[0] += 1
+            if failed:
+                entry[2] += 1
+                entry[4] += duration or 0.0
+            else:
+                entry[1] += 1
+            if entry[5] is not None and entry[5] != failed:
+                entry[3] += 1
+            entry[5] = failed
+    flaky = [
+        FlakyTest(
+            test=test,
+            runs=runs,
+            passes=passes,
+            failures=failures,
+            flips=flips,
+            wasted_time=wasted_time,
+        )
+        for test, (runs, passes, failures, flips, wasted_time, _)
+        in stats.items()
+        if passes and failures
+    ]
+    return sorted(
+        flaky, key=lambda t: (-t.flip_rate(), -t.wasted_time, t.test))
+
+
+def find_logs(directory, pattern='*'):
+    """
+    Find reporter logs in ``directory``, oldest first.
+    """
+    paths = [
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if fnmatch(name, pattern) and not name.startswith('.')
+    ]
+    paths = [path for path in paths if os.path.isfile(path)]
+    return sorted(paths, key=lambda path: (os.path.getmtime(path), path))
+
+
+def format_flaky(flaky):
+    lines = [u'{:>6} {:>5} {:>10}  {}'.format(
+        u'flips', u'runs', u'wasted', u'test')]
+    for test in flaky:
+        lines.append(u'{:>6.0%} {:>5} {:>9.3f}s  {}'.format(
+            test.flip_rate(), test.runs, test.wasted_time, test.test))
+    return u'\n'.join(lines) + u'\n'
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description='Find flaky tests in a directory of Eliot reporter logs.')
+    parser.add_argument('directory', help='Directory of reporter logs.')
+    parser.add_argument(
+        '--pattern', default='*',
+        help='Only look at logs whose names match this glob.')
+    parser.add_argument(
+        '--cache',
+        help=('Where to cache summaries of logs. Defaults to '
+              '.trial-eliot-cache in DIRECTORY.'))
+    parser.add_argument(
+        '--jobs', '-j', type=int, default=None,
+        help='Number of processes to parse logs with. Defaults to one per '
+             'core.')
+    parser.add_argument(
+        '--top', type=int, default=20, help='Show this many tests.')
+    options = parser.parse_args(args)
+    cache = options.cache
+    if cache is None:
+        cache = os.path.join(options.directory, '.trial-eliot-cache')
+    paths = find_logs(options.directory, options.pattern)
+    flaky = find_flaky(iter_summaries(paths, cache, options.jobs))
+    sys.stdout.write(format_flaky(flaky[:options.top]).encode('utf-8'))
@@ -0,0 +1,306 @@
+# Copyright (c) 2015 Jonathan M. Lange <jml@mumak.net>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Export where a test run spent its time, for flame graphs.
+
+Each test is placed in a tree by the parts of its dotted id, so that
+packages contain modules, which contain classes, which contain tests. Any
+actions logged inside a test, such as the phases from ``_phases``, go
+beneath it. The log is read once, adding each action's duration to the tree
+as soon as it finishes, so memory depends on the number of distinct tests
+and actions, not on the length of the log.
+
+The tree can be written as folded stacks, for ``flamegraph.pl`` and most
+other flame graph tools, or as speedscope JSON.
+"""
+
+import argparse
+import json
+import sys
+
+from ._parse import TEST_ACTION_TYPE
+from ._phases import PHASE_ACTION_TYPE
+
+
+SPEEDSCOPE_SCHEMA = u'https://www.speedscope.app/file-format-schema.json'
+
+
+def parse_action_entries(lines):
+    """
+    Parse only the start and end of actions in a stream of serialized JSON
+    objects, skipping everything else.
+
+    The messages are left as plain ``dict``, since freezing them would cost
+    as much again as decoding them.
+    """
+    for line in lines:
+        if '"action_status"' in line:
+            yield json.loads(line)
+
+
+def _get_name(entry):
+    if entry.get('action_type') == PHASE_ACTION_TYPE:
+        return entry.get('phase')
+    return entry.get('action_type')
+
+
+def iter_action_timings(entries):
+    """
+    Find how long each test and each action inside a test took.
+
+    :param entries: An iterable of parsed Eliot messages, as returned by
+        ``parse_action_entries``.
+    :return: An iterator of ``(path, duration)``, where ``path`` is a tuple
+        of the parts of the test's id followed by the names of the actions
+        the action is nested in and its own, in the order the actions
+        finished.
+    """
+    # task_uuid -> {action's parent task_level: (path, start_time)}
+    running = {}
+    for entry in entries:
+        status = entry.get('action_status')
+        task_level = entry.get('task_level')
+        if status is None or not task_level:
+            continue
+        task_uuid = entry.get('task_uuid')
+        timestamp = entry.get('timestamp')
+        # The start and end of an action share all but the last level.
+        key = tuple(task_level)[:-1]
+        actions = running.get(task_uuid)
+        if status == u'started':
+            # Actions that can't be timed, or placed, are skipped.
+            if timestamp is None:
+                continue
+            if entry.get('action_type') == TEST_ACTION_TYPE:
+                test = entry.get('test')
+                if actions is None and not key and test is not None:
+                    path = tuple(test.split(u'.'))
+                    running[task_uuid] = {key: (path, timestamp)}
+            elif actions is not None:
+                parent = key[:-1]
+                while parent not in actions:
+                    parent = parent[:-1]
+                path = actions[parent][0] + (_get_name(entry),)
+                actions[key] = (path, timestamp)
+        elif actions is not None and key in actions:
+            path, start_time = actions.pop(key)
+            if not key:
+                del running[task_uuid]
+            if timestamp is not None:
+                yield path, timestamp - start_time
+
+
+class _Node(object):
+
+    __slots__ = ('duration', 'total', 'children')
+
+    def __init__(self):
+        self.duration = None
+        self.total = 0.0
+        # Most nodes are tests without any actions, so only make a dict for
+        # those that need one.
+        self.children = None
+
+
+class TimeTree(object):
+    """
+    Durations, added up by path.
+
+    A path's total time is the time recorded for it, or, if none was, the
+    total time of its children. What a path spent outside its children is
+    its self time.
+    """
+
+    def __init__(self):
+        self._root = _Node()
+
+    def add(self, path, duration):
+        """
+        Add ``duration`` seconds to ``path``, a tuple of names.
+        """
+        node = self._root
+        for name in path:
+            if node.children is None:
+                node.children = {}
+            child = node.children.get(name)
+            if child is None:
+                child = node.children[name] = _Node()
+            node = child
+        node.duration = (node.duration or 0.0) + duration
+
+    def _add_up(self, node):
+        children = 0.0
+        if node.children is not None:
+            children = sum(
+                self._add_up(child) for child in node.children.values())
+        if node.duration is None:
+            node.total = children
+        else:
+            node.total = node.duration
+        return node.total
+
+    def total(self):
+        """
+        Get the total time of everything in the tree.
+        """
+        return self._add_up(self._root)
+
+    def iter_self_times(self):
+        """
+        Get the self time of every path, parents before children.
+
+        :return: An iterator of ``(path, self_time)``.
+        """
+        self._add_up(self._root)
+        stack = [((), self._root)]
+        while stack:
+            path, node = stack.pop()
+            if node.children is None:
+                yield path, node.total
+                continue
+            if path:
+                children = sum(
+                    child.total for child in node.children.values())
+                yield path, max(node.total - children, 0.0)
+            for name in sorted(node.children, reverse=True):
+                stack.append((path + (name,), node.children[name]))
+
+
+def build_tree(entries):
+    """
+    Add up the time spent in every test and action.
+
+    :param entries: An iterable of parsed Eliot messages.
+    :return: A ``TimeTree``.
+    """
+    tree = TimeTree()
+    for path, duration in iter_action_timings(entries):
+        tree.add(path, duration)
+    return tree
+
+
+def _frame_name(name):
+    return u'{}'.format(name).replace(u';', u',').replace(u'\n', u' ')
+
+
+def write_folded(tree, output):
+    """
+    Write a ``TimeTree`` as folded stacks, one line for each path with
+    self time, weighted in microseconds.
+
+    :param output: A binary file to write UTF-8 encoded text to.
+    """
+    for path, self_time in tree.iter_self_times():
+        microseconds = int(round(self_time * 1e6))
+        if microseconds > 0:
+            output.write(u'{} {}\n'.format(
+                u';'.join(_frame_name(name) for name in path),
+                microseconds).encode('utf-8'))
+
+
+def _write_json_list(output, items):
+    output.write(b'[')
+    for i, item in enumerate(items):
+        if i:
+            output.write(b',')
+        output.write(json.dumps(item))
+    output.write(b']')
+
+
+def write_speedscope(tree, output, name=u'trial'):
+    """
+    Write a ``TimeTree`` as a speedscope sampled profile, with a sample for
+    each path with self time, weighted in seconds.
+
+    The samples are written as the tree is walked, rather than built up as
+    a document.
+
+    :param output: A binary file to write JSON to.
+    :param name: The name of the profile.
+    """
+    frames = {}
+
+    def frame(name):
+        index = frames.get(name)
+        if index is None:
+            index = frames[name] = len(frames)
+        return index
+
+    def samples():
+        for path, self_time in tree.iter_self_times():
+            if self_time > 0:
+                yield [frame(_frame_name(part)) for part in path]
+
+    def weights():
+        for path, self_time in tree.iter_self_times():
+            if self_time > 0:
+                yield self_time
+
+    total = tree.total()
+    output.write(b'{"$schema": ' + json.dumps(SPEEDSCOPE_SCHEMA))
+    output.write(b', "exporter": "trial-eliot-flame"')
+    output.write(b', "name": ' + json.dumps(name))
+    output.write(b', "profiles": [{"type": "sampled", "name": ')
+    output.write(json.dumps(name))
+    output.write(b', "unit": "seconds", "startValue": 0, "endValue": ')
+    output.write(json.dumps(total))
+    output.write(b', "samples": ')
+    _write_json_list(output, samples())
+    output.write(b', "weights": ')
+    _write_json_list(output, weights())
+    output.write(b'}], "shared": {"frames": ')
+    _write_json_list(
+        output,
+        ({u'name': name}
+         for name, _ in sorted(frames.items(), key=lambda x: x[1])))
+    output.write(b'}}\n')
+
+
+_FORMATS = {
+    'folded': write_folded,
+    'speedscope': write_speedscope,
+}
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description=('Export the time spent in each test, and in the actions '
+                     'in each test, from an Eliot reporter log, for flame '
+                     'graphs.'))
+    parser.add_argument(
+        'log', nargs='?',
+        help='Path to an Eliot reporter log. Reads stdin if not given.')
+    parser.add_argument(
+        '--format', choices=sorted(_FORMATS), default='folded',
+        help=('Folded stacks, for flamegraph.pl, or speedscope JSON. '
+              'Defaults to folded.'))
+    parser.add_argument(
+        '-o', '--output', help='Where to write to. Defaults to stdout.')
+    options = parser.parse_args(args)
+    if options.log:
+        with open(options.log) as f:
+            tree = build_tree(parse_action_entries(f))
+    else:
+        tree = build_tree(parse_action_entries(sys.stdin))
+    output = sys.stdout
+    if options.output:
+        output = open(options.output, 'wb')
+    try:
+        _FORMATS[options.format](tree, output)
+    finally:
+        if options.output:
+            output.close()
+        else:
+            output.flush()
@@ -0,0 +1,211 @@
+# Copyright (c) 2015 Jonathan M. Lange <jml@mumak.net>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Turn Eliot reporter output into JUnit XML.
+
+Test cases are grouped into a ``testsuite`` for each class. A suite's
+counts have to come before its test cases, so the test cases of the suite
+being written are spooled, to disk if there are many of them, until the next
+test from a different class finishes. Trial runs a class's tests one after
+the other, so this normally gives one suite per class. If tests from a class
+are interleaved with others, the class gets more than one suite, which CI
+systems add up.
+
+JUnit has no expected failures or unexpected successes. Expected failures
+are reported as skipped, and unexpected successes as passing, with the
+reason in ``system-out``.
+"""
+
+import argparse
+import re
+import sys
+from tempfile import SpooledTemporaryFile
+from xml.sax.saxutils import escape, quoteattr
+
+from . import _types
+from ._parse import (
+    ERROR,
+    EXPECTED_FAILURE,
+    FAILURE,
+    SKIP,
+    iter_test_results,
+    parse_test_entries,
+)
+
+
+_SPOOL_SIZE = 2 ** 20
+
+# Characters that can't appear in XML 1.0 at all, even escaped.
+_INVALID_XML = re.compile(
+    u'[^\u0009\u000a\u000d\u0020-\ud7ff\ue000-\ufffd]', re.UNICODE)
+
+_ELEMENTS = {
+    _types.ERROR.message_type: u'error',
+    _types.FAILURE.message_type: u'failure',
+}
+
+"""
+The name given to a test case whose test id wasn't logged.
+"""
+UNKNOWN_TEST = u'<unknown>'
+
+
+def _text(value):
+    if value is None:
+        return u''
+    return _INVALID_XML.sub(u'\ufffd', u'{}'.format(value))
+
+
+def _attribute(value):
+    return quoteattr(_text(value))
+
+
+def split_test_id(test_id):
+    """
+    Split a test id into its class and method names.
+
+    A missing test id, ``None``, is split into an empty class name and
+    ``UNKNOWN_TEST``, so that such tests are still reported.
+    """
+    if test_id is None:
+        return u'', UNKNOWN_TEST
+    class_name, _, name = test_id.rpartition(u'.')
+    return class_name, name
+
+
+def format_testcase(result):
+    """
+    Format a ``TestResult`` as a JUnit ``testcase`` element.
+    """
+    class_name, name = split_test_id(result.test)
+    lines = [u'    <testcase classname={} name={} time={}>'.format(
+        _attribute(class_name), _attribute(name),
+        _attribute(u'{:.6f}'.format(result.duration() or 0.0)))]
+    for detail in result.details:
+        message_type = detail.get('message_type')
+        if message_type in _ELEMENTS:
+            lines.append(u'      <{0} type={1} message={2}>{3}</{0}>'.format(
+                _ELEMENTS[message_type],
+                _attribute(detail.get('exception')),
+                _attribute(detail.get('reason')),
+                escape(_text(detail.get('traceback')))))
+        elif message_type == _types.SKIP.message_type:
+            lines.append(u'      <skipped message={}/>'.format(
+                _attribute(detail.get('reason'))))
+        elif message_type == _types.EXPECTED_FAILURE.message_type:
+            lines.append(u'      <skipped message={}/>'.format(
+                _attribute(u'Expected failure: {}'.format(
+                    _text(detail.get('todo'))))))
+        elif message_type == _types.UNEXPECTED_SUCCESS.message_type:
+            lines.append(u'      <system-out>{}</system-out>'.format(
+                escape(u'Unexpected success: {}'.format(
+                    _text(detail.get('todo'))))))
+    lines.append(u'    </testcase>\n')
+    return u'\n'.join(lines)
+
+
+class _Suite(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.tests = 0
+        self.errors = 0
+        self.failures = 0
+        self.skipped = 0
+        self.time = 0.0
+        self._spool = SpooledTemporaryFile(_SPOOL_SIZE)
+
+    def add(self, result):
+        self.tests += 1
+        if result.outcome == ERROR:
+            self.errors += 1
+        elif result.outcome == FAILURE:
+            self.failures += 1
+        elif result.outcome in (SKIP, EXPECTED_FAILURE):
+            self.skipped += 1
+        self.time += result.duration() or 0.0
+        self._spool.write(format_testcase(result).encode('utf-8'))
+
+    def write_to(self, output):
+        output.write((
+            u'  <testsuite name={} tests="{}" errors="{}" failures="{}" '
+            u'skipped="{}" time="{:.6f}">\n'.format(
+                _attribute(self.name), self.tests, self.errors,
+                self.failures, self.skipped, self.time)).encode('utf-8'))
+        self._spool.seek(0)
+        while True:
+            data = self._spool.read(2 ** 16)
+            if not data:
+                break
+            output.write(data)
+        self._spool.close()
+        output.write(b'  </testsuite>\n')
+
+
+def write_junit(results, output):
+    """
+    Write test results as JUnit XML.
+
+    :param results: An iterable of ``TestResult``, as from
+        ``iter_test_results``.
+    :param output: A binary file to write UTF-8 encoded XML to.
+    """
+    output.write(b'<?xml version="1.0" encoding="UTF-8"?>\n<testsuites>\n')
+    suite = None
+    for result in results:
+        class_name, _ = split_test_id(result.test)
+        if suite is None or suite.name != class_name:
+            if suite is not None:
+                suite.write_to(output)
+            suite = _Suite(class_name)
+        suite.add(result)
+    if suite is not None:
+        suite.write_to(output)
+    output.write(b'</testsuites>\n')
+
+
+def convert(lines, output):
+    """
+    Convert Eliot reporter output to JUnit XML.
+
+    :param lines: An iterable of serialized Eliot messages.
+    :param output: A binary file to write XML to.
+    """
+    write_junit(iter_test_results(parse_test_entries(lines)), output)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description='Convert the output of the Eliot reporter to JUnit XML.')
+    parser.add_argument(
+        'log', nargs='?',
+        help='Path to an Eliot reporter log. Reads stdin if not given.')
+    parser.add_argument(
+        '-o', '--output', help='Where to write XML. Defaults to stdout.')
+    options = parser.parse_args(args)
+    output = sys.stdout
+    if options.output:
+        output = open(options.output, 'wb')
+    try:
+        if options.log:
+            with open(options.log) as f:
+                convert(f, output)
+        else:
+            convert(sys.stdin, output)
+    finally:
+        if options.output:
+            output.close()
+        else:
+            output.flush()
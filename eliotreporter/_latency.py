@@ -0,0 +1,170 @@
+# Copyright (c) 2015 Jonathan M. Lange <jml@mumak.net>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Measure what the reactor does while each test runs.
+
+When enabled, the reactor's ``runUntilCurrent``, which runs the timed calls
+that are due once per iteration, and ``_doReadOrWrite``, which dispatches
+each I/O event, are wrapped to count iterations and time callbacks. Nothing
+is wrapped when it isn't enabled, so it costs nothing then.
+
+The longest callback is the longest single step: either one I/O event, or
+one iteration's worth of timed calls, which are run together.
+
+Trial's janitor cancels the delayed calls a test leaves behind before the
+test is stopped, reporting them as a ``DirtyReactorAggregateError``. The
+calls in that error are counted as pending too, so that they're not lost.
+"""
+
+from timeit import default_timer
+
+from twisted.python.failure import Failure
+from twisted.trial.util import DirtyReactorAggregateError
+
+from ._environment import REACTOR_ENVIRONMENT_VARIABLE
+
+
+# How many pending delayed calls to describe.
+_MAX_PENDING = 10
+
+
+def _describe_selectable(args):
+    selectable = args[0] if args else None
+    return u'{}.{}'.format(
+        type(selectable).__module__, type(selectable).__name__)
+
+
+def _describe_timed_calls(args):
+    return u'timed calls'
+
+
+class ReactorMonitor(object):
+    """
+    Count reactor iterations and time the callbacks it runs.
+
+    :param reactor: A reactor with ``runUntilCurrent``, ``_doReadOrWrite``
+        and ``getDelayedCalls``, like all of Twisted's posix reactors.
+    :param timer: Returns the time, in seconds.
+    """
+
+    def __init__(self, reactor, timer=default_timer):
+        self._reactor = reactor
+        self._timer = timer
+        self._installed = []
+        self.start()
+
+    def install(self):
+        """
+        Start measuring the reactor.
+        """
+        if self._installed:
+            return
+        for name, describe, iteration in [
+                ('runUntilCurrent', _describe_timed_calls, True),
+                ('_doReadOrWrite', _describe_selectable, False)]:
+            original = getattr(self._reactor, name, None)
+            if original is None:
+                continue
+            # Remember whether it was already replaced on the instance.
+            self._installed.append((name, vars(self._reactor).get(name)))
+            setattr(self._reactor, name,
+                    self._wrap(original, describe, iteration))
+
+    def uninstall(self):
+        """
+        Stop measuring the reactor, putting it back as it was.
+        """
+        for name, previous in reversed(self._installed):
+            if previous is None:
+                delattr(self._reactor, name)
+            else:
+                setattr(self._reactor, name, previous)
+        self._installed = []
+
+    def _wrap(self, function, describe, iteration):
+        timer = self._timer
+
+        def wrapper(*args, **kwargs):
+            if iteration:
+                self._iterations += 1
+            start = timer()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = timer() - start
+                self._callback_time += elapsed
+                if elapsed > self._longest:
+                    self._longest = elapsed
+                    self._longest_source = describe(args)
+        return wrapper
+
+    def start(self):
+        """
+        Start counting afresh, for a new test.
+        """
+        self._iterations = 0
+        self._callback_time = 0.0
+        self._longest = 0.0
+        self._longest_source = None
+        self._cancelled = []
+
+    def add_error(self, error):
+        """
+        Note an error reported for the current test, in case it's trial's
+        janitor reporting the delayed calls it cancelled.
+
+        :param error: A ``Failure`` or an exception 3-tuple.
+        """
+        if isinstance(error, Failure):
+            value = error.value
+        else:
+            value = error[1]
+        if isinstance(value, DirtyReactorAggregateError):
+            self._cancelled.extend(
+                u'{}'.format(call) for call in value.delayedCalls)
+
+    def stop(self):
+        """
+        Get what the reactor did since ``start``.
+
+        :return: A ``dict`` with the fields of a ``trial:test:reactor``
+            message.
+        """
+        pending = self._reactor.getDelayedCalls()
+        described = self._cancelled[:_MAX_PENDING]
+        described.extend(
+            u'{}'.format(call)
+            for call in pending[:_MAX_PENDING - len(described)])
+        return {
+            u'iterations': self._iterations,
+            u'callback_time': self._callback_time,
+            u'longest_callback': self._longest,
+            u'longest_callback_source': self._longest_source,
+            u'pending_count': len(self._cancelled) + len(pending),
+            u'pending_calls': described,
+        }
+
+
+def open_reactor_monitor(environ):
+    """
+    Make and install a ``ReactorMonitor`` for the global reactor, if enabled
+    by environment variables, or return ``None``.
+    """
+    if not environ.get(REACTOR_ENVIRONMENT_VARIABLE):
+        return None
+    from twisted.internet import reactor
+    monitor = ReactorMonitor(reactor)
+    monitor.install()
+    return monitor
@@ -0,0 +1,348 @@
+# Copyright (c) 2015 Jonathan M. Lange <jml@mumak.net>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Live progress of a running test suite.
+
+The Eliot reporter sends its output over a socket to a ``LiveService``,
+which keeps running totals and pushes them out to any number of subscribers.
+However fast tests finish, subscribers get at most one update per
+``interval``.
+"""
+
+import argparse
+import json
+import socket
+import sys
+
+from twisted.internet.endpoints import serverFromString
+from twisted.internet.protocol import Factory, Protocol
+from twisted.protocols.basic import LineOnlyReceiver
+
+from ._environment import LIVE_FEED_ENVIRONMENT_VARIABLE
+from ._parse import (
+    ERROR,
+    FAILURE,
+    TEST_ACTION_TYPE,
+    TestResultCollector,
+    iter_test_results,
+    parse_json_stream,
+    parse_test_entries,
+)
+from ._ship import parse_address
+
+
+"""
+Seconds that connecting to, or sending to, a ``LiveService`` may block for
+before the feed gives up.
+"""
+DEFAULT_FEED_TIMEOUT = 1.0
+
+
+class LiveFeed(object):
+    """
+    Send reporter output to a ``LiveService``.
+
+    This is a plain socket with a timeout, because the reporter can't rely
+    on the reactor running between tests. If the service goes away, or
+    stops reading for longer than the timeout, the feed stops quietly rather
+    than breaking the test run.
+
+    :param sock: A connected socket.
+    :param timeout: Seconds that sending may block for.
+    """
+
+    def __init__(self, sock, timeout=DEFAULT_FEED_TIMEOUT):
+        sock.settimeout(timeout)
+        self._socket = sock
+
+    @classmethod
+    def connect(cls, description, timeout=DEFAULT_FEED_TIMEOUT, errors=None):
+        """
+        Connect to a ``LiveService``.
+
+        :param description: Either ``unix:<path>`` or ``tcp:<host>:<port>``.
+        :param timeout: Seconds that connecting, or sending, may block for.
+        :param errors: Where to say that the service couldn't be reached.
+            Defaults to ``sys.stderr``.
+        :return: A ``LiveFeed``, or ``None`` if the service couldn't be
+            reached.
+        """
+        family, address = parse_address(description)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        try:
+            sock.connect(address)
+        except socket.error as e:
+            sock.close()
+            (errors or sys.stderr).write(
+                'Eliot reporter: not sending live progress to {}: {}\n'.format(
+                    description, e))
+            return None
+        return cls(sock, timeout)
+
+    def write(self, data):
+        if self._socket is None:
+            return
+        try:
+            self._socket.sendall(data)
+        except socket.error:
+            self.close()
+
+    def close(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+
+class ProgressTracker(object):
+    """
+    Running totals for a test suite.
+
+    All times are taken from the log itself, not from the clock of whoever
+    is watching.
+
+    :param history: A mapping of test id to how long that test took in some
+        earlier run. Used to estimate how long is left.
+    """
+
+    def __init__(self, history=None):
+        self._collector = TestResultCollector()
+        self._history = dict(history or {})
+        self._historical_remaining = sum(self._history.values())
+        self._historical_done = 0.0
+        self.tests_run = 0
+        self.failures = 0
+        self.first_start = None
+        self.last_end = None
+
+    def feed(self, entry):
+        """
+        Add a parsed Eliot message.
+
+        :return: The ``TestResult`` if ``entry`` finished a test, ``None``
+            otherwise.
+        """
+        result = self._collector.feed(entry)
+        if result is None:
+            if entry.get('action_type') == TEST_ACTION_TYPE:
+                self._saw_time(entry.get('timestamp'))
+            return None
+        self.tests_run += 1
+        if result.outcome in (ERROR, FAILURE):
+            self.failures += 1
+        self._saw_time(result.end_time)
+        expected = self._history.pop(result.test, None)
+        if expected is not None:
+            self._historical_remaining -= expected
+            self._historical_done += expected
+        return result
+
+    def _saw_time(self, timestamp):
+        if timestamp is None:
+            return
+        if self.first_start is None:
+            self.first_start = timestamp
+        self.last_end = timestamp
+
+    def elapsed(self):
+        if self.first_start is None:
+            return 0.0
+        return self.last_end - self.first_start
+
+    def throughput(self):
+        """
+        Tests finished per second.
+        """
+        elapsed = self.elapsed()
+        if not elapsed:
+            return None
+        return self.tests_run / elapsed
+
+    def eta(self):
+        """
+        Estimated seconds until the run finishes, or ``None`` if there's no
+        history to go on.
+
+        Takes how long the remaining tests took last time, scaled by how
+        fast this run is going compared to last time.
+        """
+        if not self._historical_done:
+            return None
+        pace = self.elapsed() / self._historical_done
+        return max(0.0, self._historical_remaining) * pace
+
+    def as_dict(self):
+        return {
+            u'tests_run': self.tests_run,
+            u'failures': self.failures,
+            u'elapsed': self.elapsed(),
+            u'throughput': self.throughput(),
+            u'eta': self.eta(),
+        }
+
+
+def load_history(lines):
+    """
+    Get the duration of every test from an earlier reporter log.
+
+    :return: A ``dict`` mapping test id to duration in seconds.
+    """
+    return dict(
+        (result.test, result.duration())
+        for result in iter_test_results(parse_test_entries(lines))
+        if result.duration() is not None
+    )
+
+
+class LiveService(object):
+    """
+    Track the progress of a test run, and tell subscribers about it.
+
+    :param tracker: A ``ProgressTracker``.
+    :param clock: An ``IReactorTime`` provider.
+    :param interval: Minimum number of seconds between updates.
+    """
+
+    def __init__(self, tracker, clock, interval=0.5):
+        self.tracker = tracker
+        self._clock = clock
+        self._interval = interval
+        self._subscribers = set()
+        self._pending = None
+
+    def line_received(self, line):
+        if not line.strip():
+            return
+        try:
+            [entry] = parse_json_stream([line])
+        except ValueError:
+            return
+        if self.tracker.feed(entry) is not None:
+            self._changed()
+
+    def _changed(self):
+        if self._pending is None:
+            self._pending = self._clock.callLater(
+                self._interval, self._publish)
+
+    def _publish(self):
+        self._pending = None
+        for subscriber in list(self._subscribers):
+            self.send(subscriber)
+
+    def send(self, subscriber):
+        subscriber.transport.write(
+            json.dumps(self.tracker.as_dict()).encode('utf-8') + b'\n')
+
+    def subscribe(self, subscriber):
+        self._subscribers.add(subscriber)
+        self.send(subscriber)
+
+    def unsubscribe(self, subscriber):
+        self._subscribers.discard(subscriber)
+
+    def stop(self):
+        if self._pending is not None:
+            self._pending.cancel()
+            self._pending = None
+
+
+class FeedProtocol(LineOnlyReceiver):
+    """
+    Receive the output of an Eliot reporter.
+    """
+
+    delimiter = b'\n'
+    # Tracebacks can be long.
+    MAX_LENGTH = 2 ** 24
+
+    def __init__(self, service):
+        self._service = service
+
+    def lineReceived(self, line):
+        self._service.line_received(line)
+
+
+class SubscriberProtocol(Protocol):
+    """
+    Receive progress updates, one JSON object per line.
+    """
+
+    def __init__(self, service):
+        self._service = service
+
+    def connectionMade(self):
+        self._service.subscribe(self)
+
+    def connectionLost(self, reason):
+        self._service.unsubscribe(self)
+
+
+class _ServiceFactory(Factory):
+
+    def __init__(self, protocol, service):
+        self._protocol = protocol
+        self._service = service
+
+    def buildProtocol(self, addr):
+        protocol = self._protocol(self._service)
+        protocol.factory = self
+        return protocol
+
+
+def feed_factory(service):
+    return _ServiceFactory(FeedProtocol, service)
+
+
+def subscriber_factory(service):
+    return _ServiceFactory(SubscriberProtocol, service)
+
+
+def _run(reactor, options):
+    from twisted.internet.defer import Deferred, gatherResults
+    history = None
+    if options.history:
+        with open(options.history) as f:
+            history = load_history(f)
+    service = LiveService(ProgressTracker(history), reactor, options.interval)
+    d = gatherResults([
+        serverFromString(reactor, options.feed).listen(
+            feed_factory(service)),
+        serverFromString(reactor, options.listen).listen(
+            subscriber_factory(service)),
+    ])
+    d.addCallback(lambda ignored: Deferred())
+    return d
+
+
+def main(args=None):
+    from twisted.internet.task import react
+    parser = argparse.ArgumentParser(
+        description='Report the progress of a running test suite.')
+    parser.add_argument(
+        '--feed', default='tcp:8023:interface=127.0.0.1',
+        help=('Server endpoint to receive reporter output on. Point the '
+              'reporter at it with {}.'.format(
+                  LIVE_FEED_ENVIRONMENT_VARIABLE)))
+    parser.add_argument(
+        '--listen', default='tcp:8024:interface=127.0.0.1',
+        help='Server endpoint for subscribers to connect to.')
+    parser.add_argument(
+        '--history', help='Reporter log of an earlier run, used for the ETA.')
+    parser.add_argument(
+        '--interval', type=float, default=0.5,
+        help='Minimum number of seconds between updates.')
+    options = parser.parse_args(args)
+    react(_run, [options])
@@ -0,0 +1,270 @@
+# Copyright (c) 2015 Jonathan M. Lange <jml@mumak.net>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Find tests that leak memory.
+
+When enabled, the reporter measures what each sampled test allocated and
+didn't free, and logs it as a ``trial:test:memory`` message inside the test's
+action. With ``tracemalloc``, that's bytes and allocations by source line.
+Tracing is only switched on while a sampled test runs, so the rest of the
+suite runs at full speed. Without ``tracemalloc``, as on Python 2, it's the
+growth in the number of live objects of each type, as found by ``gc``.
+
+Tests are sampled by a hash of their id, so the same tests are measured on
+every run.
+"""
+
+import argparse
+from collections import Counter
+import gc
+import sys
+
+from ._environment import (
+    MEMORY_ENVIRONMENT_VARIABLE,
+    MEMORY_SAMPLE_ENVIRONMENT_VARIABLE,
+)
+from ._parse import (
+    MEMORY_MESSAGE_TYPE,
+    iter_test_results,
+    parse_test_entries,
+)
+from ._sampling import is_sampled
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+class _TracemallocBackend(object):
+    """
+    Measure memory with ``tracemalloc``, by source line.
+    """
+
+    def __init__(self, module=None):
+        self._tracemalloc = module or tracemalloc
+        self._before = None
+        self._started = False
+
+    def start(self):
+        if self._tracemalloc.is_tracing():
+            # Someone else is tracing, so leave it on, and compare.
+            self._before = self._take_snapshot()
+        else:
+            self._tracemalloc.start()
+            self._started = True
+
+    def _take_snapshot(self):
+        snapshot = self._tracemalloc.take_snapshot()
+        return snapshot.filter_traces([
+            self._tracemalloc.Filter(False, self._tracemalloc.__file__),
+            self._tracemalloc.Filter(False, __file__),
+        ])
+
+    def stop(self):
+        snapshot = self._take_snapshot()
+        if self._started:
+            self._tracemalloc.stop()
+            self._started = False
+            stats = snapshot.statistics('lineno')
+            sites = [(s.traceback, s.size, s.count) for s in stats]
+        else:
+            stats = snapshot.compare_to(self._before, 'lineno')
+            sites = [(s.traceback, s.size_diff, s.count_diff) for s in stats]
+        self._before = None
+        sites = [
+            (u'{}:{}'.format(frame.filename, frame.lineno), size, count)
+            for traceback, size, count in sites
+            for frame in [traceback[0]]
+        ]
+        return (
+            sum(size for _, size, _ in sites),
+            sum(count for _, _, count in sites),
+            sites,
+        )
+
+
+def _count_types():
+    counts = Counter()
+    for obj in gc.get_objects():
+        counts[type(obj)] += 1
+    return counts
+
+
+class _GCBackend(object):
+    """
+    Measure memory by counting the objects of each type that ``gc`` knows
+    about. Only objects that can be in reference cycles are counted, and
+    there are no sizes.
+    """
+
+    def __init__(self):
+        self._before = None
+
+    def start(self):
+        gc.collect()
+        self._before = _count_types()
+
+    def stop(self):
+        gc.collect()
+        after = _count_types()
+        after.subtract(self._before)
+        self._before = None
+        sites = [
+            (u'{}.{}'.format(type_.__module__, type_.__name__), None, count)
+            for type_, count in after.items() if count
+        ]
+        return None, sum(count for _, _, count in sites), sites
+
+
+def _default_backend():
+    if tracemalloc is not None:
+        return _TracemallocBackend()
+    return _GCBackend()
+
+
+class MemoryTracker(object):
+    """
+    Measure the memory that tests allocate and don't free.
+
+    :param limit: How many of the sites that retained the most to report.
+    :param sample: The fraction of tests to measure, between 0 and 1.
+    :param backend: How to measure. Defaults to ``tracemalloc`` if it's
+        available, and counting objects if it's not.
+    """
+
+    def __init__(self, limit=10, sample=1.0, backend=None):
+        self._limit = limit
+        self._sample = sample
+        self._backend = backend or _default_backend()
+        self._measuring = False
+
+    def start(self, test_id):
+        """
+        Start measuring, if ``test_id`` is sampled.
+        """
+        if is_sampled(u'{}'.format(test_id), self._sample):
+            self._backend.start()
+            self._measuring = True
+
+    def stop(self):
+        """
+        Stop measuring.
+
+        :return: A ``dict`` of ``net_size``, ``net_count`` and ``top``, the
+            fields of a ``trial:test:memory`` message, or ``None`` if the test
+            wasn't measured.
+        """
+        if not self._measuring:
+            return None
+        self._measuring = False
+        net_size, net_count, sites = self._backend.stop()
+        if net_size is None:
+            sites.sort(key=lambda site: -site[2])
+        else:
+            sites.sort(key=lambda site: -site[1])
+        top = [
+            {u'site': site, u'size': size, u'count': count}
+            for site, size, count in sites[:self._limit]
+            if (size if size is not None else count) > 0
+        ]
+        return {u'net_size': net_size, u'net_count': net_count, u'top': top}
+
+
+def open_memory_tracker(environ):
+    """
+    Make a ``MemoryTracker`` as configured by environment variables, or
+    return ``None`` if memory tracking isn't enabled.
+    """
+    limit = environ.get(MEMORY_ENVIRONMENT_VARIABLE)
+    if not limit:
+        return None
+    sample = float(environ.get(MEMORY_SAMPLE_ENVIRONMENT_VARIABLE) or 1)
+    return MemoryTracker(int(limit), sample)
+
+
+def get_retained(result):
+    """
+    Get the memory that a test retained, from its ``TestResult``.
+
+    :return: ``(net_size, net_count, top)``, or ``None`` if it wasn't
+        measured.
+    """
+    for detail in result.details:
+        if detail.get('message_type') == MEMORY_MESSAGE_TYPE:
+            return (
+                detail.get('net_size'),
+                detail.get('net_count'),
+                detail.get('top') or [],
+            )
+    return None
+
+
+def rank_by_memory(results):
+    """
+    Rank tests by how much memory they retained, most first.
+
+    Tests are ranked by bytes, if known, or else by number of objects.
+
+    :param results: An iterable of ``TestResult``.
+    :return: A list of ``(test_id, net_size, net_count, top)``.
+    """
+    ranked = []
+    for result in results:
+        retained = get_retained(result)
+        if retained is not None:
+            ranked.append((result.test,) + retained)
+    return sorted(
+        ranked, key=lambda r: -(r[1] if r[1] is not None else r[2]))
+
+
+def _format_size(size):
+    for unit in [u'B', u'KiB', u'MiB']:
+        if abs(size) < 1024:
+            return u'{:.1f}{}'.format(size, unit)
+        size /= 1024.0
+    return u'{:.1f}GiB'.format(size)
+
+
+def format_ranking(ranked, sites=3):
+    lines = []
+    for test, net_size, net_count, top in ranked:
+        if net_size is None:
+            lines.append(u'{}  {} objects'.format(test, net_count))
+        else:
+            lines.append(u'{}  {} in {} allocations'.format(
+                test, _format_size(net_size), net_count))
+        for site in top[:sites]:
+            if site.get('size') is None:
+                lines.append(u'    {}  {}'.format(
+                    site.get('site'), site.get('count')))
+            else:
+                lines.append(u'    {}  {}'.format(
+                    site.get('site'), _format_size(site.get('size'))))
+    return u'\n'.join(lines) + u'\n'
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description=('Rank the tests in an Eliot reporter log by how much '
+                     'memory they retained.'))
+    parser.add_argument('log', help='Path to an Eliot reporter log.')
+    parser.add_argument(
+        '--top', type=int, default=20, help='Show this many tests.')
+    options = parser.parse_args(args)
+    with open(options.log) as f:
+        ranked = rank_by_memory(iter_test_results(parse_test_entries(f)))
+    output = format_ranking(ranked[:options.top])
+    sys.stdout.write(output.encode('utf-8'))
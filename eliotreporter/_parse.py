@@ -16,9 +16,14 @@
 Take the output of an Eliot reporter and turn it into something useful.
 """
 
+import argparse
 from datetime import datetime
 import json
 from operator import attrgetter
+import os
+import re
+import sys
+import time
 
 from pyrsistent import PClass, field, freeze, ny, pvector
 from toolz.itertoolz import groupby
@@ -51,19 +56,20 @@ def remove_fields(d, fields):
     return e.persistent()
 
 
-def get_timestamp(contents):
-    return fmap(datetime.fromtimestamp, contents.get('timestamp'))
-
-
 class Message(PClass):
     """
     A parsed Eliot message.
+
+    ``Message.new`` keeps the timestamp as the float seconds since the epoch
+    that were logged, and only turns it into a ``datetime`` the first time
+    ``timestamp`` is looked up.
     """
 
     task_uuid = field()
     task_level = field()
     timestamp = field()
     fields = field()
+    _raw_timestamp = field(initial=None)
 
     @classmethod
     def new(klass, contents):
@@ -76,10 +82,19 @@ class Message(PClass):
         return klass(
             task_uuid=contents.get('task_uuid'),
             task_level=contents.get('task_level'),
-            timestamp=get_timestamp(contents),
+            _raw_timestamp=contents.get('timestamp'),
             fields=fields,
         )
 
+    def __getattr__(self, name):
+        # Only called when ``timestamp`` was never set, as by ``new``.
+        if name != 'timestamp':
+            raise AttributeError(name)
+        timestamp = fmap(
+            datetime.fromtimestamp, getattr(self, '_raw_timestamp', None))
+        object.__setattr__(self, 'timestamp', timestamp)
+        return timestamp
+
     def as_dict(self):
         fields = self.fields.evolver()
         fields['task_uuid'] = self.task_uuid
@@ -156,12 +171,485 @@ def parse_json_stream(lines):
         yield _parse_entry(line.strip())
 
 
+class Predicate(PClass):
+    """
+    A condition on parsed Eliot messages.
+
+    A message matches if it has every field that is not ``None``:
+    ``action_type``, ``message_type`` and ``task_uuid`` must be equal, and
+    ``test`` must start with ``test_prefix``.
+    """
+
+    action_type = field(initial=None)
+    message_type = field(initial=None)
+    task_uuid = field(initial=None)
+    test_prefix = field(initial=None)
+
+    def needles(self):
+        """
+        Get the substrings that a matching message must contain once
+        serialized.
+
+        Assumes the message was serialized with ``json.dumps``, as the
+        reporter does.
+        """
+        needles = [
+            json.dumps(value)
+            for value in [self.action_type, self.message_type, self.task_uuid]
+            if value is not None
+        ]
+        if self.test_prefix is not None:
+            # Leave off the closing quote, since it's only a prefix.
+            needles.append(json.dumps(self.test_prefix)[:-1])
+        return needles
+
+    def matches(self, entry):
+        """
+        Does the decoded message ``entry`` match?
+        """
+        for key in ['action_type', 'message_type', 'task_uuid']:
+            value = getattr(self, key)
+            if value is not None and entry.get(key) != value:
+                return False
+        if self.test_prefix is not None:
+            test = entry.get('test')
+            if not (isinstance(test, basestring) and
+                    test.startswith(self.test_prefix)):
+                return False
+        return True
+
+
+def parse_json_stream_filtered(lines, predicates, keys=None):
+    """
+    Parse only those JSON objects in a stream that match one of
+    ``predicates``.
+
+    Most lines can be ruled out by looking for the ``Predicate.needles`` in
+    the undecoded line, which is much cheaper than decoding it. Lines that
+    pass are then decoded and checked properly.
+
+    :param lines: An iterable of serialized JSON objects.
+    :param predicates: An iterable of ``Predicate``. A message is kept if it
+        matches any of them.
+    :param keys: If given, only keep these keys of each message. Freezing
+        a message costs as much as decoding it, so leaving out large values
+        like tracebacks helps.
+    """
+    checks = [
+        (predicate, predicate.needles()) for predicate in predicates]
+    # Rule out most lines with a single search, rather than one per needle.
+    screen = None
+    if all(needles for _, needles in checks):
+        screen = re.compile(u'|'.join(
+            re.escape(needles[0]) for _, needles in checks)).search
+    for line in lines:
+        if screen is not None and screen(line) is None:
+            continue
+        candidates = [
+            predicate for predicate, needles in checks
+            if all(needle in line for needle in needles)
+        ]
+        if not candidates:
+            continue
+        entry = json.loads(line)
+        if not any(predicate.matches(entry) for predicate in candidates):
+            continue
+        if keys is not None:
+            entry = dict((key, entry[key]) for key in keys if key in entry)
+        yield freeze(entry)
+
+
+def follow_lines(f, poll_interval=0.5, sleep=time.sleep):
+    """
+    Yield complete lines from a file that is still being written to.
+
+    Like ``tail -f``, this never finishes. When there is no more data, waits
+    ``poll_interval`` seconds and tries again. A trailing line without a
+    newline is held back until the rest of it has been written.
+    """
+    partial = ''
+    while True:
+        line = f.readline()
+        if not line:
+            sleep(poll_interval)
+            continue
+        partial += line
+        if partial.endswith('\n'):
+            if partial.strip():
+                yield partial
+            partial = ''
+
+
+TEST_ACTION_TYPE = u'trial:test'
+
+SUCCESS = u'success'
+ERROR = u'error'
+FAILURE = u'failure'
+SKIP = u'skip'
+EXPECTED_FAILURE = u'expected-failure'
+UNEXPECTED_SUCCESS = u'unexpected-success'
 
+"""
+Outcomes that make a run unsuccessful, as far as trial is concerned.
+"""
+FAILING_OUTCOMES = frozenset([ERROR, FAILURE])
+
+# Outcome for each message type the reporter logs inside a test action,
+# most important first.
+_OUTCOMES = [
+    (u'trial:test:error', ERROR),
+    (u'trial:test:failure', FAILURE),
+    (u'trial:test:unexpected-success', UNEXPECTED_SUCCESS),
+    (u'trial:test:expected-failure', EXPECTED_FAILURE),
+    (u'trial:test:skip', SKIP),
+]
+_OUTCOME_MESSAGE_TYPES = dict(_OUTCOMES)
+
+# Message types that mean a test didn't simply pass.
+OUTCOME_MESSAGE_TYPES = frozenset(_OUTCOME_MESSAGE_TYPES)
+
+MEMORY_MESSAGE_TYPE = u'trial:test:memory'
+REACTOR_MESSAGE_TYPE = u'trial:test:reactor'
+
+# Messages logged inside a test action that are kept as a result's details.
+_DETAIL_MESSAGE_TYPES = frozenset(
+    list(_OUTCOME_MESSAGE_TYPES) +
+    [MEMORY_MESSAGE_TYPE, REACTOR_MESSAGE_TYPE])
+
+# The only messages that ``iter_test_results`` looks at.
+TEST_RESULT_PREDICATES = pvector(
+    [Predicate(action_type=TEST_ACTION_TYPE)] +
+    [Predicate(message_type=message_type)
+     for message_type in sorted(_DETAIL_MESSAGE_TYPES)])
+
+
+def parse_test_entries(lines):
+    """
+    Parse only the messages in a stream of serialized JSON objects that
+    ``iter_test_results`` needs, skipping everything else.
+    """
+    return parse_json_stream_filtered(lines, TEST_RESULT_PREDICATES)
+
+
+class TestResult(PClass):
+    """
+    The result of a single test, as recorded by the Eliot reporter.
+
+    ``start_time`` and ``end_time`` are float seconds since the epoch.
+    ``details`` are the error, failure, skip, memory, etc. messages logged in
+    the test action, in the order they were logged.
+    """
+
+    test = field()
+    task_uuid = field()
+    outcome = field()
+    start_time = field()
+    end_time = field()
+    details = field()
+
+    def duration(self):
+        if self.start_time is None or self.end_time is None:
+            return None
+        return self.end_time - self.start_time
+
+
+def _get_outcome(details, action_status):
+    message_types = set(d.get('message_type') for d in details)
+    for message_type, outcome in _OUTCOMES:
+        if message_type in message_types:
+            return outcome
+    if action_status == u'failed':
+        return ERROR
+    return SUCCESS
+
+
+class TestResultCollector(object):
+    """
+    Assemble ``TestResult`` objects from parsed Eliot messages as they arrive.
+
+    Only messages belonging to tests that are currently running are kept, so
+    this works on logs of any length.
+    """
 
-def main():
+    def __init__(self):
+        self._running = {}
+
+    def feed(self, entry):
+        """
+        Add a parsed Eliot message.
+
+        :return: A ``TestResult`` if ``entry`` finished a test, ``None``
+            otherwise.
+        """
+        task_uuid = entry.get('task_uuid')
+        running = self._running
+        if entry.get('action_type') == TEST_ACTION_TYPE:
+            status = entry.get('action_status')
+            if status == u'started':
+                running[task_uuid] = (
+                    entry.get('test'), entry.get('timestamp'), [])
+            elif task_uuid in running:
+                test, start_time, details = running.pop(task_uuid)
+                return TestResult(
+                    test=test,
+                    task_uuid=task_uuid,
+                    outcome=_get_outcome(details, status),
+                    start_time=start_time,
+                    end_time=entry.get('timestamp'),
+                    details=pvector(details),
+                )
+        elif (task_uuid in running and
+              entry.get('message_type') in _DETAIL_MESSAGE_TYPES):
+            running[task_uuid][2].append(entry)
+
+    def running_tasks(self):
+        """
+        Get the ``task_uuid`` of every test that has started but not yet
+        finished.
+        """
+        return list(self._running)
+
+
+def iter_test_results(entries):
+    """
+    Turn a stream of parsed Eliot messages into a stream of test results.
+
+    Yields a ``TestResult`` as soon as each ``trial:test`` action finishes.
+    Tests that never finish are never yielded.
+
+    :param entries: An iterable of parsed Eliot messages, as returned by
+        ``parse_json_stream`` or, more quickly, ``parse_test_entries``.
+    """
+    collector = TestResultCollector()
+    for entry in entries:
+        result = collector.feed(entry)
+        if result is not None:
+            yield result
+
+
+def filter_tests(entries, test_prefix):
+    """
+    Keep only the messages of tests whose ids start with ``test_prefix``.
+
+    :param entries: An iterable of parsed Eliot messages.
+    """
+    matching = set()
+    for entry in entries:
+        task_uuid = entry.get('task_uuid')
+        if (entry.get('action_type') == TEST_ACTION_TYPE and
+                entry.get('action_status') == u'started' and
+                (entry.get('test') or u'').startswith(test_prefix)):
+            matching.add(task_uuid)
+        if task_uuid in matching:
+            yield entry
+
+
+"""
+Name of the manifest in a directory of log segments.
+"""
+MANIFEST_NAME = 'manifest.json'
+
+
+class Segment(PClass):
+    """
+    One file of a log that has been split into segments.
+
+    ``min_test`` and ``max_test`` are the lowest and highest test ids in the
+    segment, and ``start_time`` and ``end_time`` are the times the first test
+    started and the last test finished. All four are ``None`` if there are
+    no tests in the segment.
+
+    ``finished`` is ``False`` for a segment that was still being written
+    when the manifest was, in which case the rest say nothing about what's
+    in it.
+    """
+
+    path = field()
+    bytes = field()
+    tests = field()
+    min_test = field()
+    max_test = field()
+    start_time = field()
+    end_time = field()
+    finished = field(type=bool, initial=True)
+
+    def may_contain(self, test_prefix=None, since=None, until=None):
+        """
+        Might this segment have tests that match the query?
+
+        :param test_prefix: Only tests whose ids start with this.
+        :param since: Only tests that finished at or after this time.
+        :param until: Only tests that started at or before this time.
+        """
+        if not self.finished:
+            return True
+        if test_prefix is not None:
+            if self.min_test is None:
+                return False
+            k = len(test_prefix)
+            if not (self.min_test[:k] <= test_prefix <= self.max_test[:k]):
+                return False
+        if since is not None:
+            if self.end_time is None or self.end_time < since:
+                return False
+        if until is not None:
+            if self.start_time is None or self.start_time > until:
+                return False
+        return True
+
+
+def is_segmented(path):
+    """
+    Is ``path`` a directory of log segments, or the manifest of one?
+    """
+    return (os.path.isdir(path) or
+            os.path.basename(path) == MANIFEST_NAME)
+
+
+def read_manifest(path):
+    """
+    Read the manifest of a segmented log.
+
+    :param path: The manifest, or the directory it's in.
+    :return: A sequence of ``Segment``, in the order they were written, with
+        absolute paths.
+    """
+    if os.path.isdir(path):
+        path = os.path.join(path, MANIFEST_NAME)
+    directory = os.path.dirname(os.path.abspath(path))
+    with open(path) as f:
+        manifest = json.load(f)
+    segments = []
+    for segment in manifest['segments']:
+        segment = dict(segment)
+        segment['path'] = os.path.join(directory, segment['path'])
+        segments.append(Segment(**segment))
+    return pvector(segments)
+
+
+def iter_log_lines(path, test_prefix=None, since=None, until=None):
+    """
+    Yield the lines of an Eliot reporter log.
+
+    If ``path`` is a segmented log, only reads the segments that might match
+    the query. See ``Segment.may_contain`` for the meaning of the query
+    arguments. If it's a single file, reads all of it.
+    """
+    if not is_segmented(path):
+        paths = [path]
+    else:
+        paths = [
+            segment.path for segment in read_manifest(path)
+            if segment.may_contain(test_prefix, since, until)
+        ]
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                yield line
+
+
+def format_result(result):
+    """
+    Format a ``TestResult`` as a single line of text.
+    """
+    duration = result.duration()
+    if duration is None:
+        return u'{} ... [{}]\n'.format(result.test, result.outcome.upper())
+    return u'{} ... [{}] ({:.3f}s)\n'.format(
+        result.test, result.outcome.upper(), duration)
+
+
+def _follow(f, output, test_prefix=None):
+    lines = follow_lines(f)
+    try:
+        for result in iter_test_results(parse_test_entries(lines)):
+            if (test_prefix is not None and
+                    not (result.test or u'').startswith(test_prefix)):
+                continue
+            output.write(format_result(result).encode('utf-8'))
+            output.flush()
+    except KeyboardInterrupt:
+        pass
+
+
+def main(args=None):
     from pprint import pprint
     from pyrsistent import thaw
-    import sys
-    with open(sys.argv[1]) as f:
-        tasks = to_tasks(Message.new(x) for x in parse_json_stream(f))
-        pprint(thaw(tasks))
+    parser = argparse.ArgumentParser(
+        description='Parse the output of the Eliot reporter.')
+    parser.add_argument(
+        'log', nargs='+',
+        help=('Path to an Eliot reporter log, or to a directory of log '
+              'segments. With --summary, any number of them, or globs.'))
+    parser.add_argument(
+        '-f', '--follow', action='store_true',
+        help=('Keep reading the log as it grows, printing each test result '
+              'as soon as the test finishes.'))
+    parser.add_argument(
+        '--test',
+        help=('Only show tests whose ids start with this. Of a directory of '
+              'log segments, only reads the segments that might have them.'))
+    parser.add_argument(
+        '--cache', action='store_true',
+        help=('Keep the parsed log in a cache next to it, so that next time '
+              'only what has been added to the log since is parsed. With '
+              '--test, only the matching tests are read back from the log.'))
+    parser.add_argument(
+        '--counts', action='store_true',
+        help=('Only print how many tests had each outcome, including '
+              'passing tests that were sampled away.'))
+    parser.add_argument(
+        '--summary', action='store_true',
+        help=('Parse every log in parallel and print one summary of them '
+              'all, such as the shards of a CI run, saying which run and '
+              'shard each failure was in.'))
+    parser.add_argument(
+        '--jobs', '-j', type=int, default=None,
+        help=('Number of processes to parse logs with, with --summary. '
+              'Defaults to one per core.'))
+    options = parser.parse_args(args)
+    if options.summary:
+        from ._shards import (
+            find_shard_logs, format_run_summary, summarize_shards)
+        try:
+            paths = find_shard_logs(options.log)
+        except ValueError as e:
+            parser.error(str(e))
+        summary = summarize_shards(paths, options.jobs)
+        sys.stdout.write(format_run_summary(summary).encode('utf-8'))
+        return
+    if len(options.log) > 1:
+        parser.error('Only one log can be given without --summary.')
+    options.log = options.log[0]
+    if options.counts and options.test:
+        parser.error(
+            '--counts can\'t be used with --test, as passing tests that were '
+            'sampled away are only counted, not named.')
+    if options.counts:
+        from ._sampling import count_outcomes
+        counts = count_outcomes(
+            iter_log_lines(options.log, test_prefix=options.test))
+        for outcome, count in sorted(counts.items()):
+            sys.stdout.write('{} {}\n'.format(outcome, count))
+        return
+    if options.follow:
+        with open(options.log) as f:
+            _follow(f, sys.stdout, options.test)
+        return
+    if options.cache and not is_segmented(options.log):
+        from ._cache import load_parsed_log
+        parsed = load_parsed_log(options.log)
+        task_uuids = None
+        if options.test:
+            task_uuids = [
+                result.task_uuid for result in parsed.results
+                if result.test.startswith(options.test)
+            ]
+        tasks = parsed.tasks(task_uuids)
+    else:
+        lines = iter_log_lines(options.log, test_prefix=options.test)
+        entries = parse_json_stream(lines)
+        if options.test:
+            entries = filter_tests(entries, options.test)
+        tasks = to_tasks(Message.new(x) for x in entries)
+    pprint(thaw(tasks))
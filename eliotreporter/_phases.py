@@ -0,0 +1,280 @@
+# Copyright (c) 2015 Jonathan M. Lange <jml@mumak.net>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Break the time a test takes down into setUp, the test method, cleanups and
+tearDown.
+
+The reporter only sees when a test starts and stops, so this is done by the
+test case. Mix ``SynchronousPhasesMixin`` into a ``SynchronousTestCase``, or
+``PhasesMixin`` into a ``TestCase``, and each phase is logged as a
+``trial:test:phase`` action inside the test's ``trial:test`` action.
+Cleanups are only logged if there are any.
+"""
+
+import argparse
+from collections import defaultdict
+import sys
+
+from eliot.twisted import DeferredContext
+from pyrsistent import PClass, field, pmap
+from twisted.internet.defer import maybeDeferred
+
+from ._parse import (
+    Predicate,
+    TEST_ACTION_TYPE,
+    parse_json_stream_filtered,
+)
+from ._types import PHASE
+
+
+PHASE_ACTION_TYPE = PHASE.action_type
+
+SET_UP = u'setUp'
+TEST_METHOD = u'test'
+CLEANUP = u'cleanup'
+TEAR_DOWN = u'tearDown'
+
+# In the order they run.
+PHASES = (SET_UP, TEST_METHOD, CLEANUP, TEAR_DOWN)
+
+# Phases that belong to the test case's fixtures rather than to the test.
+FIXTURE_PHASES = frozenset([SET_UP, CLEANUP, TEAR_DOWN])
+
+# The only messages that ``iter_phase_timings`` looks at.
+PHASE_PREDICATES = (
+    Predicate(action_type=TEST_ACTION_TYPE),
+    Predicate(action_type=PHASE_ACTION_TYPE),
+)
+
+
+def _get_phase(method_name):
+    if method_name in (SET_UP, TEAR_DOWN):
+        return unicode(method_name)
+    return TEST_METHOD
+
+
+class SynchronousPhasesMixin(object):
+    """
+    Log each phase of a ``SynchronousTestCase`` as an action.
+
+    Must come before ``SynchronousTestCase`` in the bases.
+    """
+
+    def _run(self, suppress, todo, method, result):
+        phase = _get_phase(getattr(method, '__name__', None))
+        with PHASE(phase=phase):
+            return super(SynchronousPhasesMixin, self)._run(
+                suppress, todo, method, result)
+
+    def _runCleanups(self, result):
+        if not self._cleanups:
+            return super(SynchronousPhasesMixin, self)._runCleanups(result)
+        with PHASE(phase=CLEANUP):
+            return super(SynchronousPhasesMixin, self)._runCleanups(result)
+
+
+def _run_in_phase(phase, f, *args):
+    """
+    Call ``f``, which may return a ``Deferred``, in a ``PHASE`` action that
+    finishes when its result does.
+    """
+    action = PHASE(phase=phase)
+    with action.context():
+        d = DeferredContext(maybeDeferred(f, *args))
+        d.addActionFinish()
+        return d.result
+
+
+class PhasesMixin(object):
+    """
+    Log each phase of a ``TestCase`` as an action. Phases that return a
+    ``Deferred`` finish when it fires.
+
+    Must come before ``TestCase`` in the bases.
+    """
+
+    def _run(self, methodName, result):
+        return _run_in_phase(
+            _get_phase(methodName),
+            super(PhasesMixin, self)._run, methodName, result)
+
+    def _runCleanups(self):
+        if not self._cleanups:
+            return super(PhasesMixin, self)._runCleanups()
+        return _run_in_phase(CLEANUP, super(PhasesMixin, self)._runCleanups)
+
+
+class PhaseTiming(PClass):
+    """
+    How long one phase of one test took.
+
+    ``start_time`` and ``end_time`` are float seconds since the epoch.
+    ``status`` is the status the phase's action finished with.
+    """
+
+    test = field()
+    task_uuid = field()
+    phase = field()
+    start_time = field()
+    end_time = field()
+    status = field()
+
+    def duration(self):
+        return self.end_time - self.start_time
+
+
+def iter_phase_timings(entries):
+    """
+    Find every phase of every test in a stream of parsed Eliot messages.
+
+    Phases whose action never finishes, or that finish after their test, are
+    left out.
+
+    :param entries: An iterable of parsed Eliot messages, as returned by
+        ``parse_phase_entries``.
+    :return: An iterator of ``PhaseTiming``, in the order the phases
+        finished.
+    """
+    # task_uuid -> (test, {parent task_level: (phase, start_time)})
+    running = {}
+    for entry in entries:
+        task_uuid = entry.get('task_uuid')
+        status = entry.get('action_status')
+        action_type = entry.get('action_type')
+        if action_type == TEST_ACTION_TYPE:
+            if status == u'started':
+                running[task_uuid] = (entry.get('test'), {})
+            else:
+                running.pop(task_uuid, None)
+        elif action_type == PHASE_ACTION_TYPE and task_uuid in running:
+            test, phases = running[task_uuid]
+            # The start and end of an action share all but the last level.
+            key = tuple(entry.get('task_level'))[:-1]
+            if status == u'started':
+                phases[key] = (entry.get('phase'), entry.get('timestamp'))
+            elif key in phases:
+                phase, start_time = phases.pop(key)
+                yield PhaseTiming(
+                    test=test,
+                    task_uuid=task_uuid,
+                    phase=phase,
+                    start_time=start_time,
+                    end_time=entry.get('timestamp'),
+                    status=status,
+                )
+
+
+def parse_phase_entries(lines):
+    """
+    Parse only the messages in a stream of serialized JSON objects that
+    ``iter_phase_timings`` needs, skipping everything else.
+    """
+    return parse_json_stream_filtered(lines, PHASE_PREDICATES)
+
+
+class PhaseSummary(PClass):
+    """
+    Where the time went in a test run.
+
+    ``phases`` maps each phase to ``(seconds, count)``, over all tests.
+    ``fixtures`` maps ``(class_name, phase)`` to ``(seconds, count)``, for
+    the fixture phases of the tests in each class.
+    """
+
+    phases = field()
+    fixtures = field()
+
+    def total(self):
+        return sum(seconds for seconds, _ in self.phases.values())
+
+    def most_expensive_fixtures(self, limit=None):
+        """
+        Get the fixtures that took the most time in total.
+
+        :return: A list of ``(class_name, phase, seconds, count)``, most
+            expensive first.
+        """
+        ranked = sorted(
+            ((class_name, phase, seconds, count)
+             for (class_name, phase), (seconds, count)
+             in self.fixtures.items()),
+            key=lambda fixture: -fixture[2])
+        return ranked[:limit]
+
+
+def summarize_phases(timings):
+    """
+    Add up the time spent in each phase.
+
+    :param timings: An iterable of ``PhaseTiming``.
+    :return: A ``PhaseSummary``.
+    """
+    phases = defaultdict(lambda: [0.0, 0])
+    fixtures = defaultdict(lambda: [0.0, 0])
+    for timing in timings:
+        duration = timing.duration()
+        totals = phases[timing.phase]
+        totals[0] += duration
+        totals[1] += 1
+        if timing.phase in FIXTURE_PHASES:
+            class_name = timing.test.rpartition(u'.')[0]
+            totals = fixtures[(class_name, timing.phase)]
+            totals[0] += duration
+            totals[1] += 1
+    return PhaseSummary(
+        phases=pmap((k, tuple(v)) for k, v in phases.items()),
+        fixtures=pmap((k, tuple(v)) for k, v in fixtures.items()),
+    )
+
+
+def _phase_order(phase):
+    if phase in PHASES:
+        return (PHASES.index(phase), phase)
+    return (len(PHASES), phase)
+
+
+def format_summary(summary, top=10):
+    """
+    Format a ``PhaseSummary`` as text.
+    """
+    total = summary.total()
+    lines = []
+    for phase in sorted(summary.phases, key=_phase_order):
+        seconds, count = summary.phases[phase]
+        share = seconds / total * 100 if total else 0.0
+        lines.append(u'{:<10} {:>10.3f}s {:>5.1f}%  ({} runs)'.format(
+            phase, seconds, share, count))
+    fixtures = summary.most_expensive_fixtures(top)
+    if fixtures:
+        lines.append(u'')
+        lines.append(u'Most expensive fixtures:')
+        for class_name, phase, seconds, count in fixtures:
+            lines.append(u'{:>10.3f}s  {}.{}  ({} runs, {:.3f}s each)'.format(
+                seconds, class_name, phase, count, seconds / count))
+    return u'\n'.join(lines) + u'\n'
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description=('Show how much of a test run went on setUp, test '
+                     'methods, cleanups and tearDown, and which fixtures '
+                     'were the most expensive.'))
+    parser.add_argument('log', help='Path to an Eliot reporter log.')
+    parser.add_argument(
+        '--top', type=int, default=10, help='Show this many fixtures.')
+    options = parser.parse_args(args)
+    with open(options.log) as f:
+        summary = summarize_phases(iter_phase_timings(parse_phase_entries(f)))
+    sys.stdout.write(format_summary(summary, options.top).encode('utf-8'))
@@ -0,0 +1,302 @@
+# Copyright (c) 2015 Jonathan M. Lange <jml@mumak.net>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Find tests that have got slower than they used to be.
+
+The durations of passing tests in the last N runs are kept in a
+``DurationHistory``, a matrix with a row for each test and a column for each
+run, used as a ring buffer. A test in a new run is a regression if it took
+much longer than its median duration in the history, as measured in median
+absolute deviations (MAD). Both are robust to the occasional slow run, which
+means one bad run in the history doesn't hide the next.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+from pyrsistent import PClass, field
+
+from ._diff import summarize
+from ._parse import SUCCESS, iter_test_results, parse_test_entries
+
+
+_HISTORY_VERSION = 1
+_METADATA_NAME = 'history.json'
+_DURATIONS_NAME = 'durations.npy'
+
+DEFAULT_WINDOW = 100
+
+# Scales the MAD to estimate the standard deviation of normal data.
+_MAD_SCALE = 1.4826
+
+
+class Regression(PClass):
+    """
+    A test that took much longer than it normally does.
+
+    ``median`` and ``mad`` are of the test's durations in the history, over
+    ``runs`` runs. ``score`` is how many scaled MADs slower ``duration`` is
+    than the median, and is infinite if the test always took the same time.
+    """
+
+    test = field()
+    duration = field()
+    median = field()
+    mad = field()
+    score = field()
+    runs = field()
+
+    def slowdown(self):
+        return self.duration - self.median
+
+
+def _row_medians(a, counts):
+    """
+    Get the median of each row of ``a``, ignoring NaN.
+
+    Like ``numpy.nanmedian``, which is much slower when some rows have NaN
+    and others don't, as they will when tests come and go.
+
+    :param counts: The number of values in each row that aren't NaN. None
+        may be 0.
+    """
+    # NaN sorts last.
+    a = np.sort(a, axis=1)
+    rows = np.arange(len(a))
+    return (a[rows, (counts - 1) // 2] + a[rows, counts // 2]) / 2
+
+
+class DurationHistory(object):
+    """
+    The durations of each test over the last ``window`` runs.
+
+    :param tests: A list of test ids, one for each row of ``durations``.
+    :param durations: A 2-D ``float32`` array of durations in seconds, NaN
+        where a test didn't pass, or wasn't run.
+    :param runs: How many runs have ever been added. The next run goes in
+        column ``runs % window``.
+    """
+
+    def __init__(self, tests=(), durations=None, runs=0,
+                 window=DEFAULT_WINDOW):
+        self.tests = list(tests)
+        self._index = dict((test, i) for i, test in enumerate(self.tests))
+        if durations is None:
+            durations = np.full(
+                (len(self.tests), window), np.nan, dtype=np.float32)
+        self.durations = durations
+        self.runs = runs
+
+    @property
+    def window(self):
+        return self.durations.shape[1]
+
+    @classmethod
+    def load(cls, directory, window=DEFAULT_WINDOW):
+        """
+        Load the history kept in ``directory``, or make an empty one if there
+        isn't one. ``window`` is only used for an empty one.
+        """
+        try:
+            with open(os.path.join(directory, _METADATA_NAME)) as f:
+                metadata = json.load(f)
+        except IOError:
+            return cls(window=window)
+        if metadata.get('version') != _HISTORY_VERSION:
+            return cls(window=window)
+        tests = metadata['tests']
+        try:
+            durations = np.load(os.path.join(directory, _DURATIONS_NAME))
+        except IOError:
+            return cls(window=window)
+        if len(durations) < len(tests):
+            return cls(window=window)
+        # Rows are only ever added, so if saving was interrupted after the
+        # durations were written, the extra rows are for tests we don't
+        # know about yet. The column for the run that wasn't recorded will
+        # be overwritten by the next one.
+        return cls(tests, durations[:len(tests)], metadata['runs'])
+
+    def save(self, directory):
+        """
+        Save the history to ``directory``, replacing whatever was there.
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        durations_path = os.path.join(directory, _DURATIONS_NAME)
+        with open(durations_path + '.tmp', 'wb') as f:
+            np.save(f, self.durations)
+        metadata_path = os.path.join(directory, _METADATA_NAME)
+        with open(metadata_path + '.tmp', 'w') as f:
+            json.dump({
+                'version': _HISTORY_VERSION,
+                'runs': self.runs,
+                'tests': self.tests,
+            }, f)
+        # See ``load`` for what happens if we're stopped in between.
+        os.rename(durations_path + '.tmp', durations_path)
+        os.rename(metadata_path + '.tmp', metadata_path)
+
+    def _rows(self, tests):
+        """
+        Get the row of each of ``tests``, adding rows for new tests.
+        """
+        rows = []
+        new = 0
+        for test in tests:
+            row = self._index.get(test)
+            if row is None:
+                row = self._index[test] = len(self.tests)
+                self.tests.append(test)
+                new += 1
+            rows.append(row)
+        if new:
+            self.durations = np.vstack([
+                self.durations,
+                np.full((new, self.window), np.nan, dtype=np.float32)])
+        return np.array(rows, dtype=np.intp)
+
+    def add_run(self, durations):
+        """
+        Add a run, replacing the oldest if the history is full.
+
+        :param durations: A ``dict`` mapping the id of each test that passed
+            to its duration in seconds.
+        """
+        tests = list(durations)
+        rows = self._rows(tests)
+        column = self.runs % self.window
+        self.durations[:, column] = np.nan
+        self.durations[rows, column] = np.array(
+            [durations[test] for test in tests], dtype=np.float32)
+        self.runs += 1
+
+    def find_regressions(self, durations, threshold=3.5, minimum=0.1,
+                         min_runs=5):
+        """
+        Find the tests in a run that were much slower than they usually are.
+
+        :param durations: A ``dict`` mapping the id of each test that passed
+            to its duration in seconds.
+        :param threshold: How many scaled MADs slower than its median a test
+            must be to count.
+        :param minimum: How many seconds slower than its median a test must
+            be to count, so that tiny changes to fast, steady tests aren't
+            reported.
+        :param min_runs: How many times a test must have passed in the
+            history to be judged.
+        :return: A list of ``Regression``, with the most time lost first.
+        """
+        tests = [test for test in durations if test in self._index]
+        if not tests:
+            return []
+        rows = np.array([self._index[test] for test in tests], dtype=np.intp)
+        new = np.array([durations[test] for test in tests], dtype=np.float64)
+        history = self.durations[rows]
+        counts = np.sum(~np.isnan(history), axis=1)
+        judged = counts >= max(min_runs, 1)
+        history, new, counts = history[judged], new[judged], counts[judged]
+        tests = [test for test, j in zip(tests, judged) if j]
+        medians = _row_medians(history, counts)
+        mads = _row_medians(
+            np.abs(history - medians[:, np.newaxis]), counts)
+        slowdowns = new - medians
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scores = slowdowns / (_MAD_SCALE * mads)
+        regressed = np.flatnonzero(
+            (slowdowns >= minimum) & (scores >= threshold))
+        regressed = regressed[np.argsort(-slowdowns[regressed], kind='stable')]
+        return [
+            Regression(
+                test=tests[i],
+                duration=float(new[i]),
+                median=float(medians[i]),
+                mad=float(mads[i]),
+                score=float(scores[i]),
+                runs=int(counts[i]),
+            )
+            for i in regressed
+        ]
+
+
+def passing_durations(results):
+    """
+    Get the duration of each test that passed.
+
+    :param results: An iterable of ``TestResult``.
+    :return: A ``dict`` mapping test id to duration in seconds.
+    """
+    return dict(
+        (test, duration)
+        for test, (outcome, duration) in summarize(results).items()
+        if outcome == SUCCESS and duration is not None
+    )
+
+
+def format_regressions(regressions):
+    lines = [u'{:>9} {:>9} {:>7}  {}'.format(
+        u'median', u'now', u'score', u'test')]
+    for regression in regressions:
+        lines.append(u'{:>8.3f}s {:>8.3f}s {:>7.1f}  {}'.format(
+            regression.median, regression.duration, regression.score,
+            regression.test))
+    return u'\n'.join(lines) + u'\n'
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description=('Find tests in an Eliot reporter log that were much '
+                     'slower than in earlier runs. Exits with status 1 if '
+                     'there are any.'))
+    parser.add_argument(
+        'history', help='Directory where the history of durations is kept.')
+    parser.add_argument('log', help='Path to an Eliot reporter log.')
+    parser.add_argument(
+        '--record', action='store_true',
+        help='Add the run to the history, after comparing it.')
+    parser.add_argument(
+        '--window', type=int, default=DEFAULT_WINDOW,
+        help=('How many runs to keep in a new history. Defaults to '
+              '{}.'.format(DEFAULT_WINDOW)))
+    parser.add_argument(
+        '--threshold', type=float, default=3.5,
+        help=('Report tests that are at least this many scaled MADs slower '
+              'than their median...'))
+    parser.add_argument(
+        '--minimum', type=float, default=0.1,
+        help='... and at least this many seconds slower.')
+    parser.add_argument(
+        '--min-runs', type=int, default=5,
+        help='Only judge tests that passed in this many runs in the history.')
+    parser.add_argument(
+        '--top', type=int, default=20, help='Show this many tests.')
+    options = parser.parse_args(args)
+    with open(options.log) as f:
+        durations = passing_durations(
+            iter_test_results(parse_test_entries(f)))
+    history = DurationHistory.load(options.history, options.window)
+    regressions = history.find_regressions(
+        durations, options.threshold, options.minimum, options.min_runs)
+    if options.record:
+        history.add_run(durations)
+        history.save(options.history)
+    if regressions:
+        sys.stdout.write(
+            format_regressions(regressions[:options.top]).encode('utf-8'))
+        return 1
+    sys.stdout.write('No regressions.\n')
@@ -13,16 +13,38 @@
 # limitations under the License.
 
 import json
+import os
+import sys
+import traceback
+from weakref import WeakSet
 
-from eliot import add_destination
+from eliot import add_destination, remove_destination
 from pyrsistent import PClass, field
 from twisted.plugin import IPlugin
 from twisted.trial.itrial import IReporter
 from zope.interface import implementer
 
+# Optional features are only imported once they're turned on, so that the
+# reporter doesn't pay for the ones that are off.
+from ._environment import (
+    FILES_ENVIRONMENT_VARIABLE,
+    LIVE_FEED_ENVIRONMENT_VARIABLE,
+    MEMORY_ENVIRONMENT_VARIABLE,
+    REACTOR_ENVIRONMENT_VARIABLE,
+    SAMPLE_ENVIRONMENT_VARIABLE,
+    SEGMENTS_ENVIRONMENT_VARIABLE,
+    SHIP_BUDGET_ENVIRONMENT_VARIABLE,
+    SHIP_ENVIRONMENT_VARIABLE,
+    SUBUNIT_ENVIRONMENT_VARIABLE,
+)
+from ._sinks import FanOut
+from ._threads import ThreadMerger
 from ._types import (
+    COUNTS,
     ERROR,
     FAILURE,
+    MEMORY,
+    REACTOR,
     SKIP,
     TEST,
     UNEXPECTED_SUCCESS,
@@ -44,9 +66,8 @@ class InvalidStateError(Exception):
 # messages. Probably can't be done at the reporter level, but we can provide
 # functions for tests to be able to use that.
 
-# TODO: Should setUp, tearDown, the test itself and cleanup also be Eliot
-# actions? If so, that's a thing for the base test case rather than the
-# reporter.
+# setUp, tearDown, the test itself and cleanup are logged as actions by the
+# test case, if it uses the mixins in _phases, rather than by the reporter.
 
 # TODO: Currently Eliot has support for capturing the eliot logs and dumping
 # them to the Twisted log, which Trial stores as _trial_temp/test.log. If
@@ -69,6 +90,86 @@ class InvalidStateError(Exception):
 #   until the test completes, or that we would log duplicate actions
 
 
+class _Router(object):
+    """
+    The one Eliot destination for all reporters.
+
+    Passes each message to every reporter that is still running. Reporters
+    are removed when they are ``done``, or when they are garbage collected,
+    so the cost of a message doesn't depend on how many reporters there have
+    ever been. A reporter that raises is reported to ``errors`` and removed,
+    so that it can't stop the others getting messages.
+    """
+
+    def __init__(self, errors=None):
+        self._reporters = WeakSet()
+        self._registered = False
+        self._errors = errors
+
+    def add(self, reporter):
+        self._reporters.add(reporter)
+        if not self._registered:
+            add_destination(self)
+            self._registered = True
+
+    def remove(self, reporter):
+        self._reporters.discard(reporter)
+        if self._registered and not self._reporters:
+            remove_destination(self)
+            self._registered = False
+
+    def __call__(self, message):
+        for reporter in list(self._reporters):
+            try:
+                reporter._write_message(message)
+            except Exception:
+                self._failed(reporter)
+
+    def _failed(self, reporter):
+        errors = self._errors or sys.stderr
+        errors.write(
+            'Eliot reporter: no longer logging to {!r}\n'.format(reporter))
+        traceback.print_exc(file=errors)
+        self.remove(reporter)
+
+
+_router = _Router()
+
+
+def _open_outputs(environ):
+    """
+    Open the places, other than its stream, that the reporter should send
+    its output to, as configured by environment variables.
+    """
+    outputs = []
+    files = environ.get(FILES_ENVIRONMENT_VARIABLE)
+    if files:
+        from ._sinks import open_file_sinks
+        outputs.extend(open_file_sinks(files))
+    if environ.get(SEGMENTS_ENVIRONMENT_VARIABLE):
+        from ._sinks import open_segmented_sink
+        outputs.append(open_segmented_sink(environ))
+    subunit = environ.get(SUBUNIT_ENVIRONMENT_VARIABLE)
+    if subunit:
+        from ._subunit import SubunitSink
+        outputs.append(SubunitSink(subunit))
+    live_feed = environ.get(LIVE_FEED_ENVIRONMENT_VARIABLE)
+    if live_feed:
+        from ._live import LiveFeed
+        feed = LiveFeed.connect(live_feed)
+        if feed is not None:
+            outputs.append(feed)
+    ship = environ.get(SHIP_ENVIRONMENT_VARIABLE)
+    if ship:
+        from ._ship import ShippingDestination
+        kwargs = {}
+        budget = environ.get(SHIP_BUDGET_ENVIRONMENT_VARIABLE)
+        if budget:
+            kwargs['budget'] = float(budget)
+        outputs.append(ShippingDestination.from_description(ship, **kwargs))
+    return outputs
+
+
 @implementer(IReporter)
 class EliotReporter(object):
 
@@ -83,13 +184,38 @@ class EliotReporter(object):
         self.tbformat = tbformat
         self.shouldStop = False
         self.testsRun = 0
-        add_destination(self._write_message)
         self._current_test = None
         self._successful = True
         self._logger = logger
+        self._outputs = FanOut(_open_outputs(os.environ))
+        self._memory = self._reactor_monitor = self._sampler = None
+        if os.environ.get(MEMORY_ENVIRONMENT_VARIABLE):
+            from ._memory import open_memory_tracker
+            self._memory = open_memory_tracker(os.environ)
+        if os.environ.get(REACTOR_ENVIRONMENT_VARIABLE):
+            from ._latency import open_reactor_monitor
+            self._reactor_monitor = open_reactor_monitor(os.environ)
+        if os.environ.get(SAMPLE_ENVIRONMENT_VARIABLE):
+            from ._sampling import open_pass_sampler
+            self._sampler = open_pass_sampler(os.environ)
+        self._threads = ThreadMerger(self._handle_message)
+        # Last, so that a reporter that failed to start never gets messages.
+        _router.add(self)
 
     def _write_message(self, message):
-        self._stream.write(json.dumps(message) + "\n")
+        # Called by the router in whichever thread logged the message.
+        self._threads.write(message)
+
+    def _handle_message(self, message):
+        if self._sampler is not None and self._sampler.hold(message):
+            return
+        self._emit(message)
+
+    def _emit(self, message):
+        # Serialize once, however many places it's going.
+        data = json.dumps(message) + "\n"
+        self._stream.write(data)
+        self._outputs.write(data)
 
     def _ensure_test_running(self, expected_test):
         current = self._current_test
@@ -109,11 +235,18 @@ class EliotReporter(object):
                 'Trying to start {}, but {} already started'.format(
                     method, self._current_test))
         self._current_test = method
+        self.testsRun += 1
+        if self._sampler is not None:
+            self._sampler.start_test(method.id())
         self._action = TEST(test=method, logger=self._logger)
         # TODO: This isn't using Eliot the way it was intended. Probably a
         # better way is to have a test case (or a testtools-style TestCase
         # runner!) that does all of this.
         self._action.__enter__()
+        if self._memory is not None:
+            self._memory.start(method.id())
+        if self._reactor_monitor is not None:
+            self._reactor_monitor.start()
 
     def stopTest(self, method):
         """
@@ -126,7 +259,25 @@ class EliotReporter(object):
                 'Trying to stop {} without starting it first'.format(method))
         self._ensure_test_running(method)
         self._current_test = None
+        # Anything the test logged from other threads belongs inside it.
+        self._threads.drain()
+        if self._memory is not None:
+            retained = self._memory.stop()
+            if retained is not None:
+                MEMORY(**retained).write(self._logger)
+        if self._reactor_monitor is not None:
+            REACTOR(**self._reactor_monitor.stop()).write(self._logger)
         self._action.__exit__(None, None, None)
+        if self._sampler is not None:
+            for message in self._sampler.stop_test():
+                self._emit(message)
+            if self._sampler.counts_due():
+                self._write_counts()
+
+    def _write_counts(self):
+        counts = self._sampler.take_counts()
+        if counts is not None:
+            COUNTS(**counts).write(self._logger)
 
     def addSuccess(self, test):
         """
@@ -139,6 +290,8 @@ class EliotReporter(object):
         Record that a test has raised an unexpected exception.
         """
         self._ensure_test_running(test)
+        if self._reactor_monitor is not None:
+            self._reactor_monitor.add_error(error)
         make_error_message(ERROR, error).write(self._logger)
         self._successful = False
 
@@ -181,8 +334,42 @@ class EliotReporter(object):
         """
         Called when the test run is complete.
         """
+        self._threads.drain()
+        if self._sampler is not None:
+            self._write_counts()
+        _router.remove(self)
+        self._threads.close()
+        self._outputs.close()
+        if self._reactor_monitor is not None:
+            self._reactor_monitor.uninstall()
 
 
+class SubunitReporter(EliotReporter):
+    """
+    Like ``EliotReporter``, but writes subunit v2 to its stream instead of
+    Eliot messages.
+
+    Outputs configured by environment variables still get Eliot messages.
+    """
+
+    def __init__(self, stream, tbformat='default', realtime=False,
+                 publisher=None, logger=None):
+        from ._subunit import SubunitWriter
+        self._subunit = SubunitWriter(stream.write)
+        super(SubunitReporter, self).__init__(
+            stream, tbformat, realtime, publisher, logger)
+
+    def _emit(self, message):
+        self._subunit.feed(message)
+        if self._outputs.sinks:
+            self._outputs.write(json.dumps(message) + "\n")
+
+
+# Trial finds the reporter through twisted/plugins/_eliotreporter.py, which
+# describes it without importing this package, so that trial doesn't import
+# Eliot and friends every time it looks for plugins. That module isn't
+# installed as part of a package, so can't be imported from here. This is
+# kept for compatibility, and TestPlugin checks that the two match.
 @implementer(IReporter, IPlugin)
 class TrialReporter(PClass):
 
@@ -0,0 +1,175 @@
+# Copyright (c) 2015 Jonathan M. Lange <jml@mumak.net>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Run only the tests that failed last time.
+
+The tests to run again are the ones that ended with an error or a failure
+in the previous reporter log, and the ones that never finished, because
+trial crashed or was killed while they were running. The previous log is
+read through ``_cache``, so finding them in a log that has been looked at
+before only means reading the cache, and whatever has been appended since.
+
+Once they've run, the previous log and the new one are merged into a log
+with the latest result of every test. It's an ordinary reporter log, so
+it can be given to any of the other tools, or used to rerun again.
+"""
+
+import argparse
+import subprocess
+import sys
+
+from ._cache import load_parsed_log
+from ._diff import summarize
+from ._parse import (
+    ERROR,
+    FAILING_OUTCOMES,
+    iter_test_results,
+    parse_test_entries,
+)
+
+
+def find_tests_to_rerun(parsed):
+    """
+    Find the tests that failed or didn't finish.
+
+    A test that appears more than once is judged by its last result.
+
+    :param parsed: A ``ParsedLog``.
+    :return: A list of test ids, failures first, in the order they
+        finished, then the tests that didn't finish.
+    """
+    last = {}
+    for i, result in enumerate(parsed.results):
+        last[result.test] = (i, result.outcome)
+    failing = sorted(
+        (i, test) for test, (i, outcome) in last.items()
+        if outcome in FAILING_OUTCOMES)
+    tests = [test for _, test in failing]
+    seen = set(tests)
+    for test in parsed.running_tests():
+        if test is not None and test not in seen:
+            seen.add(test)
+            tests.append(test)
+    return tests
+
+
+def trial_command(tests, trial_args=(), python=sys.executable):
+    """
+    Get the command that runs ``tests`` with trial and the Eliot reporter.
+    """
+    return (
+        [python, '-m', 'twisted.trial', '--reporter=eliot'] +
+        list(trial_args) + list(tests))
+
+
+def merge_logs(parsed, rerun_path, output):
+    """
+    Write a log with the messages of the previous run, except those of
+    tests that were run again, followed by the messages of the new run.
+
+    :param parsed: The ``ParsedLog`` of the previous run.
+    :param rerun_path: Path to the log of the new run.
+    :param output: A binary file to write the merged log to.
+    :return: The results of the new run, as a ``dict`` mapping test id to
+        ``(outcome, duration)``.
+    """
+    with open(rerun_path, 'rb') as f:
+        rerun = summarize(iter_test_results(parse_test_entries(f)))
+    # Only replace the tests that finished this time, so that a test that
+    # didn't get to run again keeps what there was of it.
+    task_uuids = set(
+        result.task_uuid for result in parsed.results
+        if result.test in rerun)
+    if parsed.running:
+        task_uuids.update(
+            task_uuid for task_uuid, test in parsed.running_test_ids()
+            if test in rerun)
+    skipped = set(parsed.line_offsets(task_uuids))
+    with open(parsed.path, 'rb') as f:
+        offset = 0
+        for line in f:
+            if offset not in skipped and line.endswith('\n'):
+                output.write(line)
+            offset += len(line)
+    with open(rerun_path, 'rb') as f:
+        for line in f:
+            output.write(line)
+    return rerun
+
+
+def format_rerun(tests, rerun):
+    """
+    Say how the tests that were run again did.
+
+    :param tests: The ids of the tests that were run again.
+    :param rerun: The results of the new run, as returned by
+        ``merge_logs``.
+    """
+    fixed = [test for test in tests
+             if test in rerun and rerun[test][0] not in FAILING_OUTCOMES]
+    failing = [test for test in tests
+               if test in rerun and rerun[test][0] in FAILING_OUTCOMES]
+    missing = [test for test in tests if test not in rerun]
+    lines = [u'Ran {} tests again: {} fixed, {} still failing, '
+             u'{} did not finish.'.format(
+                 len(tests), len(fixed), len(failing), len(missing))]
+    for title, section in [(u'Still failing', failing),
+                           (u'Did not finish', missing)]:
+        if section:
+            lines.append(u'')
+            lines.append(u'{}:'.format(title))
+            lines.extend(u'  {}'.format(test) for test in section)
+    return u'\n'.join(lines) + u'\n'
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description=('Run the tests that failed, or did not finish, in an '
+                     'Eliot reporter log again, and merge the results. '
+                     'Arguments after -- are passed to trial. Exits with '
+                     'status 1 if any of them still fail.'))
+    parser.add_argument('log', help='Path to the previous reporter log.')
+    parser.add_argument(
+        '--output',
+        help='Where to write the log of the new run. Defaults to LOG.rerun.')
+    parser.add_argument(
+        '--merged',
+        help=('Where to write the merged log. Defaults to LOG.merged.'))
+    parser.add_argument(
+        '--list', action='store_true',
+        help='Only list the tests that would be run.')
+    parser.add_argument('trial_args', nargs=argparse.REMAINDER)
+    options = parser.parse_args(args)
+    trial_args = options.trial_args
+    if trial_args[:1] == ['--']:
+        trial_args = trial_args[1:]
+    parsed = load_parsed_log(options.log)
+    tests = find_tests_to_rerun(parsed)
+    if options.list:
+        sys.stdout.write(u''.join(
+            u'{}\n'.format(test) for test in tests).encode('utf-8'))
+        return
+    if not tests:
+        sys.stdout.write('Nothing to run again.\n')
+        return
+    output = options.output or options.log + '.rerun'
+    with open(output, 'wb') as f:
+        subprocess.call(trial_command(tests, trial_args), stdout=f)
+    with open(options.merged or options.log + '.merged', 'wb') as merged:
+        rerun = merge_logs(parsed, output, merged)
+    sys.stdout.write(format_rerun(tests, rerun).encode('utf-8'))
+    if any(rerun.get(test, (ERROR,))[0] in FAILING_OUTCOMES
+           for test in tests):
+        return 1
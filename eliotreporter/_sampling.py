@@ -0,0 +1,191 @@
+# Copyright (c) 2015 Jonathan M. Lange <jml@mumak.net>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Only log some of the tests that pass.
+
+When enabled, the reporter logs every test that errors, fails, is skipped,
+or has an expected failure or unexpected success, but only a sample of the
+tests that pass. Tests are sampled by a hash of their id, so the same tests
+are logged on every run, and a sampled test is logged as it runs, as usual.
+The messages of a test that isn't sampled are held until it finishes, then
+written if it didn't pass, and dropped if it did.
+
+The passing tests that were dropped are added up in ``trial:test:counts``
+messages, logged every so often and when the run is done, so that the
+number of tests that ran and passed can still be worked out from the log.
+"""
+
+from collections import Counter
+import zlib
+
+from ._environment import (
+    COUNTS_INTERVAL_ENVIRONMENT_VARIABLE,
+    SAMPLE_ENVIRONMENT_VARIABLE,
+)
+from ._parse import (
+    OUTCOME_MESSAGE_TYPES,
+    Predicate,
+    SUCCESS,
+    TEST_ACTION_TYPE,
+    TEST_RESULT_PREDICATES,
+    iter_test_results,
+    parse_json_stream_filtered,
+)
+from ._types import COUNTS
+
+
+DEFAULT_COUNTS_INTERVAL = 1000
+
+COUNTS_MESSAGE_TYPE = COUNTS.message_type
+
+
+def is_sampled(test_id, sample):
+    """
+    Is the test with id ``test_id`` in a sample of ``sample`` of all tests?
+
+    The same tests are always chosen for the same ``sample``, and the tests
+    in a smaller sample are also in every larger one.
+    """
+    if sample >= 1:
+        return True
+    bucket = zlib.crc32(test_id.encode('utf-8')) & 0xffffffff
+    return bucket < sample * 2 ** 32
+
+
+class PassSampler(object):
+    """
+    Hold back the messages of tests that aren't sampled until it's known
+    whether they passed.
+
+    :param sample: The fraction of passing tests to log, between 0 and 1.
+    :param interval: How many passing tests to drop between counts.
+    """
+
+    def __init__(self, sample, interval=DEFAULT_COUNTS_INTERVAL):
+        self._sample = sample
+        self._interval = interval
+        self._held = None
+        self._task_uuid = None
+        self._passed = 0
+        self._duration = 0.0
+
+    def start_test(self, test_id):
+        """
+        Called before the test with id ``test_id`` starts.
+        """
+        if not is_sampled(u'{}'.format(test_id), self._sample):
+            self._held = []
+            self._task_uuid = None
+
+    def hold(self, message):
+        """
+        Hold ``message`` back, if it belongs to a test that isn't sampled.
+
+        :return: ``True`` if it was held, ``False`` if it should be written
+            now.
+        """
+        if self._held is None:
+            return False
+        task_uuid = message.get('task_uuid')
+        if (self._task_uuid is None and
+                message.get('action_type') == TEST_ACTION_TYPE):
+            # The first message is the start of the test's action.
+            self._task_uuid = task_uuid
+        if task_uuid != self._task_uuid:
+            return False
+        self._held.append(message)
+        return True
+
+    def stop_test(self):
+        """
+        Called once the test's action has finished.
+
+        :return: The messages that were held back, which should now be
+            written, in the order they were logged.
+        """
+        held, self._held = self._held, None
+        if not held:
+            return []
+        for message in held:
+            if (message.get('message_type') in OUTCOME_MESSAGE_TYPES or
+                    message.get('action_status') == u'failed'):
+                return held
+        self._passed += 1
+        start, end = held[0].get('timestamp'), held[-1].get('timestamp')
+        if start is not None and end is not None:
+            self._duration += end - start
+        return []
+
+    def counts_due(self):
+        """
+        Have enough passing tests been dropped to log how many?
+        """
+        return self._passed >= self._interval
+
+    def take_counts(self):
+        """
+        Get the passing tests dropped since the counts were last taken.
+
+        :return: A ``dict`` of ``passed`` and ``duration``, or ``None`` if
+            none were dropped.
+        """
+        if not self._passed:
+            return None
+        counts = {u'passed': self._passed, u'duration': self._duration}
+        self._passed = 0
+        self._duration = 0.0
+        return counts
+
+
+def open_pass_sampler(environ):
+    """
+    Make a ``PassSampler`` as configured by environment variables, or return
+    ``None`` if every test should be logged.
+    """
+    sample = environ.get(SAMPLE_ENVIRONMENT_VARIABLE)
+    if not sample or float(sample) >= 1:
+        return None
+    interval = int(
+        environ.get(COUNTS_INTERVAL_ENVIRONMENT_VARIABLE) or
+        DEFAULT_COUNTS_INTERVAL)
+    return PassSampler(float(sample), interval)
+
+
+# The messages that ``count_outcomes`` looks at.
+_COUNT_PREDICATES = (
+    list(TEST_RESULT_PREDICATES) +
+    [Predicate(message_type=COUNTS_MESSAGE_TYPE)])
+
+
+def count_outcomes(lines):
+    """
+    Count the tests with each outcome in a reporter log, including the
+    passing tests that were sampled away.
+
+    :param lines: An iterable of serialized Eliot messages.
+    :return: A ``Counter`` mapping outcome to number of tests.
+    """
+    counts = Counter()
+
+    def entries():
+        for entry in parse_json_stream_filtered(lines, _COUNT_PREDICATES):
+            if entry.get('message_type') == COUNTS_MESSAGE_TYPE:
+                counts[SUCCESS] += entry.get('passed', 0)
+            else:
+                yield entry
+
+    for result in iter_test_results(entries()):
+        counts[result.outcome] += 1
+    return counts
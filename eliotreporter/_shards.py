@@ -0,0 +1,382 @@
+# Copyright (c) 2015 Jonathan M. Lange <jml@mumak.net>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Summarize a test run that was split into shards, each with its own log.
+
+Each log is parsed in a process of its own and boiled down to a small
+``ShardSummary``, and the summaries are added to a single ``RunSummary`` as
+they arrive. Neither keeps every test, only counts, totals, the slowest
+tests and up to a limit of failures, so summarizing a thousand shards takes
+no more memory than summarizing one.
+
+A log's shard is its file name, and its run is the name of the directory
+it's in, so ``ci/1234/shard-07.log`` is shard ``shard-07.log`` of run
+``1234``.
+"""
+
+from collections import Counter
+from functools import partial
+from glob import glob
+import heapq
+from multiprocessing import Pool
+import os
+
+from pyrsistent import PClass, field, pmap_field, pvector_field
+
+from ._parse import (
+    FAILING_OUTCOMES,
+    Predicate,
+    SUCCESS,
+    TEST_RESULT_PREDICATES,
+    iter_log_lines,
+    iter_test_results,
+    parse_json_stream_filtered,
+)
+from ._sampling import COUNTS_MESSAGE_TYPE
+
+
+DEFAULT_SLOWEST = 10
+
+DEFAULT_MAX_FAILURES = 100
+
+# Test results, and the passing tests that were sampled away.
+_SUMMARY_PREDICATES = (
+    list(TEST_RESULT_PREDICATES) +
+    [Predicate(message_type=COUNTS_MESSAGE_TYPE)])
+
+# All that a summary needs, leaving out tracebacks.
+_SUMMARY_KEYS = (
+    'task_uuid', 'action_type', 'action_status', 'message_type', 'test',
+    'timestamp', 'reason', 'passed', 'duration')
+
+
+class Failure(PClass):
+    """
+    A test that failed in one of the shards.
+
+    ``test`` is ``None`` if the log didn't say which test it was. ``reason``
+    is the first line of the reason given for the error or failure, if there
+    was one.
+    """
+
+    test = field()
+    outcome = field(type=unicode)
+    reason = field()
+    duration = field()
+    run = field()
+    shard = field()
+
+
+class ShardSummary(PClass):
+    """
+    What happened in a single shard.
+
+    ``test_time`` is the total duration of its tests, and ``start_time``
+    and ``end_time`` are when the first test started and the last one
+    finished, or ``None`` if no test finished. ``slowest`` has
+    ``(duration, test)`` for its slowest tests, slowest first. ``failures``
+    has at most the limit it was summarized with, and ``more_failures``
+    counts the rest.
+    """
+
+    run = field()
+    shard = field()
+    counts = pmap_field(unicode, int)
+    test_time = field(type=float, initial=0.0)
+    start_time = field(initial=None)
+    end_time = field(initial=None)
+    failures = pvector_field(Failure)
+    more_failures = field(type=int, initial=0)
+    slowest = pvector_field(tuple)
+
+    def tests(self):
+        return sum(self.counts.values())
+
+
+def shard_name(path):
+    """
+    Get the run and shard of the log at ``path``.
+
+    :return: ``(run, shard)``.
+    """
+    path = os.path.abspath(path.rstrip(os.sep))
+    run, shard = os.path.split(path)
+    return os.path.basename(run), shard
+
+
+def _first_line(text):
+    if not text:
+        return None
+    lines = text.strip().splitlines()
+    return lines[0] if lines else None
+
+
+def _reason(result):
+    for detail in result.details:
+        reason = detail.get('reason')
+        if reason:
+            return _first_line(reason)
+    return None
+
+
+def summarize_shard(path, slowest=DEFAULT_SLOWEST,
+                    max_failures=DEFAULT_MAX_FAILURES):
+    """
+    Summarize the reporter log at ``path``.
+
+    :param path: A reporter log, or a directory of log segments.
+    :param slowest: How many of the slowest tests to keep.
+    :param max_failures: How many failures to keep.
+    :return: A ``ShardSummary``.
+    """
+    run, shard = shard_name(path)
+    counts = Counter()
+    failures = []
+    more_failures = [0]
+    times = {'test_time': 0.0, 'start_time': None, 'end_time': None}
+    slowest_tests = []
+
+    def add_time(start, end):
+        if start is None or end is None:
+            return
+        times['test_time'] += end - start
+        if times['start_time'] is None or start < times['start_time']:
+            times['start_time'] = start
+        if times['end_time'] is None or end > times['end_time']:
+            times['end_time'] = end
+
+    def entries():
+        lines = iter_log_lines(path)
+        for entry in parse_json_stream_filtered(
+                lines, _SUMMARY_PREDICATES, _SUMMARY_KEYS):
+            if entry.get('message_type') == COUNTS_MESSAGE_TYPE:
+                counts[SUCCESS] += entry.get('passed', 0)
+                times['test_time'] += entry.get('duration', 0.0)
+            else:
+                yield entry
+
+    for result in iter_test_results(entries()):
+        counts[result.outcome] += 1
+        add_time(result.start_time, result.end_time)
+        duration = result.duration()
+        if duration is not None and slowest:
+            item = (duration, result.test)
+            if len(slowest_tests) < slowest:
+                heapq.heappush(slowest_tests, item)
+            else:
+                heapq.heappushpop(slowest_tests, item)
+        if result.outcome in FAILING_OUTCOMES:
+            if len(failures) < max_failures:
+                failures.append(Failure(
+                    test=result.test, outcome=result.outcome,
+                    reason=_reason(result), duration=duration,
+                    run=run, shard=shard))
+            else:
+                more_failures[0] += 1
+    return ShardSummary(
+        run=run, shard=shard, counts=dict(counts),
+        failures=failures, more_failures=more_failures[0],
+        slowest=sorted(slowest_tests, reverse=True), **times)
+
+
+class RunSummary(object):
+    """
+    The merged summary of many shards.
+
+    Add each ``ShardSummary`` with ``add``. Only the totals, the slowest
+    tests and shards, and up to ``max_failures`` failures are kept.
+
+    :param slowest: How many of the slowest tests and shards to keep.
+    :param max_failures: How many failures to keep.
+    """
+
+    def __init__(self, slowest=DEFAULT_SLOWEST,
+                 max_failures=DEFAULT_MAX_FAILURES):
+        self._slowest = slowest
+        self._max_failures = max_failures
+        self.counts = Counter()
+        self.shards = 0
+        self.test_time = 0.0
+        self.failures = []
+        self.more_failures = 0
+        # run -> [shards, tests, failing, start_time, end_time]
+        self.runs = {}
+        # (duration, test, run, shard)
+        self._slowest_tests = []
+        # (wall time, run, shard)
+        self._slowest_shards = []
+
+    def _keep(self, heap, item):
+        if len(heap) < self._slowest:
+            heapq.heappush(heap, item)
+        elif self._slowest:
+            heapq.heappushpop(heap, item)
+
+    def add(self, shard):
+        """
+        Add the summary of one more shard.
+
+        :param shard: A ``ShardSummary``.
+        """
+        self.shards += 1
+        self.counts.update(shard.counts)
+        self.test_time += shard.test_time
+        failing = sum(
+            count for outcome, count in shard.counts.items()
+            if outcome in FAILING_OUTCOMES)
+        room = max(0, self._max_failures - len(self.failures))
+        self.failures.extend(shard.failures[:room])
+        self.more_failures += (
+            shard.more_failures + max(0, len(shard.failures) - room))
+        run = self.runs.setdefault(shard.run, [0, 0, 0, None, None])
+        run[0] += 1
+        run[1] += shard.tests()
+        run[2] += failing
+        if shard.start_time is not None:
+            if run[3] is None or shard.start_time < run[3]:
+                run[3] = shard.start_time
+            if run[4] is None or shard.end_time > run[4]:
+                run[4] = shard.end_time
+            self._keep(
+                self._slowest_shards,
+                (shard.end_time - shard.start_time, shard.run, shard.shard))
+        for duration, test in shard.slowest:
+            self._keep(
+                self._slowest_tests, (duration, test, shard.run, shard.shard))
+
+    def tests(self):
+        return sum(self.counts.values())
+
+    def slowest_tests(self):
+        """
+        Get ``(duration, test, run, shard)`` for the slowest tests, slowest
+        first.
+        """
+        return sorted(self._slowest_tests, reverse=True)
+
+    def slowest_shards(self):
+        """
+        Get ``(wall time, run, shard)`` for the slowest shards, slowest
+        first.
+        """
+        return sorted(self._slowest_shards, reverse=True)
+
+
+def find_shard_logs(patterns):
+    """
+    Find the logs matching any of ``patterns``, each a path or a glob.
+
+    :return: A sorted list of paths, each only once.
+    :raise ValueError: If a pattern matches nothing.
+    """
+    paths = set()
+    for pattern in patterns:
+        matches = glob(pattern)
+        if not matches:
+            raise ValueError('No logs match {}'.format(pattern))
+        paths.update(matches)
+    return sorted(paths)
+
+
+def iter_shard_summaries(paths, processes=None, **kwargs):
+    """
+    Summarize many reporter logs, in parallel.
+
+    :param paths: Paths to reporter logs.
+    :param processes: How many processes to parse logs with. ``None`` means
+        one per core.
+    :param kwargs: Passed on to ``summarize_shard``.
+    :return: An iterator of ``ShardSummary``, in the same order as
+        ``paths``, each yielded as soon as it and all before it are ready.
+    """
+    summarize = partial(summarize_shard, **kwargs)
+    if len(paths) < 2 or processes == 1:
+        for path in paths:
+            yield summarize(path)
+        return
+    pool = Pool(processes)
+    try:
+        for summary in pool.imap(summarize, paths):
+            yield summary
+    finally:
+        pool.close()
+        pool.join()
+
+
+def summarize_shards(paths, processes=None, slowest=DEFAULT_SLOWEST,
+                     max_failures=DEFAULT_MAX_FAILURES):
+    """
+    Summarize a run split across the reporter logs at ``paths``.
+
+    :return: A ``RunSummary``.
+    """
+    summary = RunSummary(slowest, max_failures)
+    for shard in iter_shard_summaries(
+            paths, processes, slowest=slowest, max_failures=max_failures):
+        summary.add(shard)
+    return summary
+
+
+def _format_time(start, end):
+    if start is None:
+        return u'-'
+    return u'{:.3f}s'.format(end - start)
+
+
+def format_run_summary(summary):
+    """
+    Format a ``RunSummary`` as text.
+    """
+    outcomes = u', '.join(
+        u'{} {}'.format(count, outcome)
+        for outcome, count in sorted(summary.counts.items()))
+    lines = [
+        u'Ran {} tests in {} shards of {} runs{}'.format(
+            summary.tests(), summary.shards, len(summary.runs),
+            u': ' + outcomes if outcomes else u''),
+        u'Total test time: {:.3f}s'.format(summary.test_time),
+        u'',
+        u'{:>7} {:>7} {:>7} {:>10}  {}'.format(
+            u'shards', u'tests', u'failing', u'wall', u'run'),
+    ]
+    for run, (shards, tests, failing, start, end) in sorted(
+            summary.runs.items()):
+        lines.append(u'{:>7} {:>7} {:>7} {:>10}  {}'.format(
+            shards, tests, failing, _format_time(start, end), run))
+    if summary.failures:
+        lines.extend([u'', u'Failures:'])
+        for failure in sorted(
+                summary.failures,
+                key=lambda f: (f.run, f.shard, f.test)):
+            line = u'  [{}] {} ({}/{})'.format(
+                failure.outcome.upper(), failure.test, failure.run,
+                failure.shard)
+            if failure.reason:
+                line += u': ' + failure.reason
+            lines.append(line)
+        if summary.more_failures:
+            lines.append(u'  ... and {} more'.format(summary.more_failures))
+    slowest_shards = summary.slowest_shards()
+    if slowest_shards:
+        lines.extend([u'', u'Slowest shards:'])
+        for wall, run, shard in slowest_shards:
+            lines.append(u'  {:>9.3f}s  {}/{}'.format(wall, run, shard))
+    slowest_tests = summary.slowest_tests()
+    if slowest_tests:
+        lines.extend([u'', u'Slowest tests:'])
+        for duration, test, run, shard in slowest_tests:
+            lines.append(u'  {:>9.3f}s  {} ({}/{})'.format(
+                duration, test, run, shard))
+    return u'\n'.join(lines) + u'\n'
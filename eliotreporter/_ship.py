@@ -0,0 +1,272 @@
+# Copyright (c) 2015 Jonathan M. Lange <jml@mumak.net>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Ship reporter output to a collector over the network.
+
+The reporter can't rely on the reactor running between tests, so this uses
+a plain non-blocking socket and only ever does work when the reporter writes
+a message. Messages are batched, held in a bounded in-memory spool, spilled
+to a bounded file when the collector can't keep up, and sent again after a
+reconnect. A line that was only partly sent when the connection was lost is
+sent again whole, so the collector only ever sees whole lines from each
+connection.
+"""
+
+from collections import deque
+import errno
+import os
+import socket
+import sys
+import tempfile
+import time
+
+
+_WOULD_BLOCK = (errno.EAGAIN, errno.EWOULDBLOCK)
+
+
+def parse_address(description):
+    """
+    Parse a socket address.
+
+    :param description: Either ``unix:<path>`` or ``tcp:<host>:<port>``.
+    :return: ``(family, address)``, suitable for ``socket.socket`` and
+        ``socket.connect``.
+    """
+    kind, _, address = description.partition(':')
+    if kind == 'unix':
+        return socket.AF_UNIX, address
+    if kind == 'tcp':
+        host, _, port = address.rpartition(':')
+        try:
+            return socket.AF_INET, (host, int(port))
+        except ValueError:
+            pass
+    raise ValueError('Unrecognized address: {!r}'.format(description))
+
+
+class ShippingDestination(object):
+    """
+    Send reporter output to a collector.
+
+    :param address: ``(family, address)``, as returned by ``parse_address``.
+    :param batch_size: Don't send until this many bytes are waiting...
+    :param batch_interval: ... or this many seconds have passed since the
+        last send.
+    :param max_memory: Most bytes to hold in memory. Beyond this, output is
+        spilled to a file in ``spool_directory``.
+    :param max_disk: Most bytes to spill to that file. Messages that don't
+        fit are dropped, and counted in ``bytes_dropped``.
+    :param budget: Most seconds, in total, to spend shipping. Once this is
+        used up, output is only spooled, never sent, and is left on disk
+        when the destination is closed.
+    :param connect_timeout: Most seconds to spend on one connection attempt.
+    :param initial_backoff: Seconds to wait before reconnecting after the
+        first failure. Doubles with each failure, up to ``max_backoff``.
+    :param clock: Returns the current time in seconds.
+    :param errors: Where to say, on closing, that messages were dropped.
+        Defaults to ``sys.stderr``.
+    """
+
+    def __init__(self, address, batch_size=64 * 1024, batch_interval=1.0,
+                 max_memory=8 * 2 ** 20, spool_directory=None, budget=5.0,
+                 connect_timeout=1.0, initial_backoff=0.5, max_backoff=30.0,
+                 clock=time.time, max_disk=256 * 2 ** 20, errors=None):
+        self._family, self._address = address
+        self._batch_size = batch_size
+        self._batch_interval = batch_interval
+        self._max_memory = max_memory
+        self._max_disk = max_disk
+        self._spool_directory = spool_directory
+        self._budget = budget
+        self._connect_timeout = connect_timeout
+        self._initial_backoff = initial_backoff
+        self._max_backoff = max_backoff
+        self._clock = clock
+        self._errors = errors
+
+        self._memory = deque()
+        self._memory_size = 0
+        # Bytes at the start of the memory spool that were already sent on
+        # this connection: the start of a line that was only partly sent.
+        self._memory_sent = 0
+        self._disk = None
+        self._disk_size = 0
+        self._disk_read = 0
+
+        self._socket = None
+        self._backoff = initial_backoff
+        self._next_attempt = clock()
+        self._last_send = clock()
+
+        self.time_spent = 0.0
+        self.bytes_sent = 0
+        self.bytes_dropped = 0
+        self.unsent_path = None
+
+    @classmethod
+    def from_description(cls, description, **kwargs):
+        return cls(parse_address(description), **kwargs)
+
+    def pending(self):
+        """
+        Number of bytes waiting to be sent.
+        """
+        return (
+            self._memory_size - self._memory_sent +
+            self._disk_size - self._disk_read)
+
+    def over_budget(self):
+        return self.time_spent >= self._budget
+
+    def write(self, data):
+        start = self._clock()
+        self._spool(data)
+        if (self.pending() >= self._batch_size or
+                start - self._last_send >= self._batch_interval):
+            self._send(start)
+        self.time_spent += self._clock() - start
+
+    def _spool(self, data):
+        if (self._disk_size == 0 and
+                self._memory_size + len(data) <= self._max_memory):
+            self._memory.append(data)
+            self._memory_size += len(data)
+            return
+        if self._disk_size + len(data) > self._max_disk:
+            self.bytes_dropped += len(data)
+            return
+        if self._disk is None:
+            self._disk = tempfile.TemporaryFile(dir=self._spool_directory)
+        self._disk.seek(self._disk_size)
+        self._disk.write(data)
+        self._disk_size += len(data)
+
+    def _unspool(self):
+        """
+        Move data from the disk spool back into memory.
+        """
+        self._disk.seek(self._disk_read)
+        data = self._disk.read(self._max_memory)
+        self._disk_read += len(data)
+        if self._disk_read == self._disk_size:
+            self._disk.seek(0)
+            self._disk.truncate()
+            self._disk_size = self._disk_read = 0
+        self._memory.append(data)
+        self._memory_size += len(data)
+
+    def _connect(self, now):
+        if now < self._next_attempt:
+            return False
+        remaining = self._budget - self.time_spent
+        sock = socket.socket(self._family, socket.SOCK_STREAM)
+        sock.settimeout(max(0.0, min(self._connect_timeout, remaining)))
+        try:
+            sock.connect(self._address)
+        except (socket.error, socket.timeout):
+            sock.close()
+            self._next_attempt = now + self._backoff
+            self._backoff = min(self._backoff * 2, self._max_backoff)
+            return False
+        sock.setblocking(False)
+        self._socket = sock
+        self._backoff = self._initial_backoff
+        return True
+
+    def _disconnect(self, now):
+        self._socket.close()
+        self._socket = None
+        # Send the whole of a partly sent line on the next connection.
+        self._memory_sent = 0
+        self._next_attempt = now + self._backoff
+        self._backoff = min(self._backoff * 2, self._max_backoff)
+
+    def _send(self, now):
+        if self.over_budget():
+            return
+        if self._socket is None and not self._connect(now):
+            return
+        self._last_send = now
+        while self.pending():
+            if self._memory_size == self._memory_sent:
+                self._unspool()
+            batch = b''.join(self._memory)
+            self._memory.clear()
+            try:
+                sent = self._socket.send(batch[self._memory_sent:])
+            except socket.error as e:
+                sent = 0
+                if e.args[0] not in _WOULD_BLOCK:
+                    self._disconnect(now)
+            self.bytes_sent += sent
+            sent += self._memory_sent
+            # Keep all of the first line that wasn't completely sent, in
+            # case it has to be sent again on a new connection.
+            line_start = batch.rfind(b'\n', 0, sent) + 1
+            self._memory_size = len(batch) - line_start
+            self._memory_sent = sent - line_start if self._socket else 0
+            if self._memory_size:
+                self._memory.append(batch[line_start:])
+            if sent < len(batch):
+                # The collector is slow, or gone. Try again later.
+                return
+
+    def close(self, timeout=1.0):
+        """
+        Send whatever is waiting, for up to ``timeout`` seconds, and close.
+
+        Anything that still couldn't be sent is written to a file, whose path
+        is stored in ``unsent_path``.
+        """
+        deadline = self._clock() + timeout
+        while self.pending() and not self.over_budget():
+            now = self._clock()
+            if now >= deadline:
+                break
+            start = now
+            self._send(now)
+            if self.pending():
+                time.sleep(0.01)
+            self.time_spent += self._clock() - start
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+            self._memory_sent = 0
+        if self.pending():
+            self._save_unsent()
+        if self._disk is not None:
+            self._disk.close()
+            self._disk = None
+        if self.bytes_dropped:
+            (self._errors or sys.stderr).write(
+                'Eliot reporter: dropped {} bytes of output that would not '
+                'fit in the shipping spool\n'.format(self.bytes_dropped))
+
+    def _save_unsent(self):
+        fd, self.unsent_path = tempfile.mkstemp(
+            prefix='trial-eliot-unsent-', dir=self._spool_directory)
+        with os.fdopen(fd, 'wb') as f:
+            for data in self._memory:
+                f.write(data)
+            if self._disk is not None:
+                self._disk.seek(self._disk_read)
+                while True:
+                    data = self._disk.read(self._max_memory)
+                    if not data:
+                        break
+                    f.write(data)
+        self._memory.clear()
+        self._memory_size = self._memory_sent = 0
+        self._disk_size = self._disk_read = 0
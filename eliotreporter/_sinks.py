@@ -0,0 +1,252 @@
+# Copyright (c) 2015 Jonathan M. Lange <jml@mumak.net>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Places for the reporter to send its output, as well as its stream.
+
+The reporter serializes each message once, and ``FanOut`` hands the same
+bytes to every sink. Each sink does its own buffering, and a sink that fails
+is dropped without affecting the others.
+"""
+
+import gzip
+import json
+import os
+import sys
+import traceback
+
+from ._environment import (
+    SEGMENT_BYTES_ENVIRONMENT_VARIABLE,
+    SEGMENT_TESTS_ENVIRONMENT_VARIABLE,
+    SEGMENTS_ENVIRONMENT_VARIABLE,
+)
+from ._parse import MANIFEST_NAME
+
+
+class FileSink(object):
+    """
+    Append output to a file.
+    """
+
+    def __init__(self, path, buffer_size=2 ** 16):
+        self._file = open(path, 'ab', buffer_size)
+
+    def write(self, data):
+        self._file.write(data)
+
+    def close(self):
+        self._file.close()
+
+
+class GzipSink(object):
+    """
+    Append output to a gzip-compressed file.
+
+    Compressing each message on its own is slow, so output is held until
+    there is at least ``buffer_size`` bytes of it.
+    """
+
+    def __init__(self, path, buffer_size=2 ** 16, compresslevel=6):
+        self._file = gzip.open(path, 'ab', compresslevel)
+        self._buffer_size = buffer_size
+        self._buffer = []
+        self._buffered = 0
+
+    def write(self, data):
+        self._buffer.append(data)
+        self._buffered += len(data)
+        if self._buffered >= self._buffer_size:
+            self._flush()
+
+    def _flush(self):
+        self._file.write(b''.join(self._buffer))
+        self._buffer = []
+        self._buffered = 0
+
+    def close(self):
+        self._flush()
+        self._file.close()
+
+
+# How a test action's messages start, as serialized by the reporter. Only
+# these lines need to be decoded to find where tests begin and end.
+_TEST_ACTION_MARKER = b'"action_type": "trial:test"'
+
+
+class SegmentedSink(object):
+    """
+    Write output to a series of files in ``directory``.
+
+    Starts a new file once the current one has ``max_bytes`` bytes or
+    ``max_tests`` tests in it, but only between tests, so that a test's
+    messages are all in the same file. Keeps a manifest of which tests, and
+    which times, each file covers, which ``_parse.read_manifest`` reads. Each
+    file is added to the manifest as soon as it's started, marked as not yet
+    finished, so that the manifest lists every file even if the run never
+    gets to close the sink.
+    """
+
+    def __init__(self, directory, max_bytes=256 * 2 ** 20, max_tests=None,
+                 prefix='segment'):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self._max_tests = max_tests
+        self._prefix = prefix
+        self._segments = []
+        self._running = set()
+        self._file = None
+        self._start_segment()
+
+    def _start_segment(self):
+        name = '{}-{:05d}.log'.format(self._prefix, len(self._segments))
+        self._file = open(os.path.join(self._directory, name), 'wb')
+        self._current = {
+            'path': name,
+            'bytes': 0,
+            'tests': 0,
+            'min_test': None,
+            'max_test': None,
+            'start_time': None,
+            'end_time': None,
+            'finished': False,
+        }
+        self._segments.append(self._current)
+        self._write_manifest()
+
+    def _is_full(self):
+        current = self._current
+        if self._max_bytes is not None and current['bytes'] >= self._max_bytes:
+            return True
+        return (self._max_tests is not None and
+                current['tests'] >= self._max_tests)
+
+    def write(self, data):
+        self._file.write(data)
+        current = self._current
+        current['bytes'] += len(data)
+        if _TEST_ACTION_MARKER not in data:
+            return
+        message = json.loads(data)
+        task_uuid = message.get('task_uuid')
+        timestamp = message.get('timestamp')
+        if message.get('action_status') == 'started':
+            self._running.add(task_uuid)
+            test = message.get('test')
+            if test is not None:
+                if current['min_test'] is None or test < current['min_test']:
+                    current['min_test'] = test
+                if current['max_test'] is None or test > current['max_test']:
+                    current['max_test'] = test
+            if current['start_time'] is None:
+                current['start_time'] = timestamp
+        elif task_uuid in self._running:
+            self._running.discard(task_uuid)
+            current['tests'] += 1
+            current['end_time'] = timestamp
+            if not self._running and self._is_full():
+                self._file.close()
+                current['finished'] = True
+                self._start_segment()
+
+    def _write_manifest(self):
+        path = os.path.join(self._directory, MANIFEST_NAME)
+        temporary_path = path + '.tmp'
+        with open(temporary_path, 'w') as f:
+            json.dump({'segments': self._segments}, f, indent=2)
+        os.rename(temporary_path, path)
+
+    def close(self):
+        self._file.close()
+        self._current['finished'] = True
+        if self._current['bytes'] == 0 and len(self._segments) > 1:
+            os.unlink(os.path.join(self._directory, self._current['path']))
+            self._segments.pop()
+        self._write_manifest()
+
+
+def open_segmented_sink(environ):
+    """
+    Open a ``SegmentedSink`` as configured by environment variables.
+    """
+    kwargs = {}
+    max_bytes = environ.get(SEGMENT_BYTES_ENVIRONMENT_VARIABLE)
+    if max_bytes:
+        kwargs['max_bytes'] = int(max_bytes)
+    max_tests = environ.get(SEGMENT_TESTS_ENVIRONMENT_VARIABLE)
+    if max_tests:
+        kwargs['max_tests'] = int(max_tests)
+    return SegmentedSink(environ[SEGMENTS_ENVIRONMENT_VARIABLE], **kwargs)
+
+
+def open_file_sink(path):
+    """
+    Open a sink for ``path``, compressed if it ends in ``.gz``.
+    """
+    if path.endswith('.gz'):
+        return GzipSink(path)
+    return FileSink(path)
+
+
+def open_file_sinks(value):
+    """
+    Open sinks for the paths in the value of ``FILES_ENVIRONMENT_VARIABLE``.
+    """
+    return [open_file_sink(path) for path in value.split(os.pathsep) if path]
+
+
+class FanOut(object):
+    """
+    Write the same output to many sinks.
+
+    A sink is anything with ``write`` and ``close`` methods. If one of them
+    raises, the sink is reported to ``errors`` and dropped.
+    """
+
+    def __init__(self, sinks, errors=None):
+        self._sinks = list(sinks)
+        self._errors = errors
+
+    @property
+    def sinks(self):
+        return list(self._sinks)
+
+    def write(self, data):
+        for sink in self._sinks:
+            try:
+                sink.write(data)
+            except Exception:
+                self._failed(sink)
+
+    def _failed(self, sink):
+        self._sinks = [s for s in self._sinks if s is not sink]
+        self._report(sink)
+        try:
+            sink.close()
+        except Exception:
+            pass
+
+    def _report(self, sink):
+        errors = self._errors or sys.stderr
+        errors.write('Eliot reporter: dropping output to {!r}\n'.format(sink))
+        traceback.print_exc(file=errors)
+
+    def close(self):
+        sinks, self._sinks = self._sinks, []
+        for sink in sinks:
+            try:
+                sink.close()
+            except Exception:
+                self._report(sink)
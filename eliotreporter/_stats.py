@@ -0,0 +1,195 @@
+# Copyright (c) 2015 Jonathan M. Lange <jml@mumak.net>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Timing statistics over the output of an Eliot reporter.
+
+This works on the parsed JSON messages rather than on ``Message`` objects,
+so timestamps stay as floats, and does all of the arithmetic on NumPy
+arrays.
+"""
+
+from array import array
+
+import numpy as np
+from pyrsistent import PClass, field
+
+from ._parse import TEST_ACTION_TYPE
+
+# How many dotted components to strip from a test id to get its group.
+CLASS = 1
+MODULE = 2
+
+
+class Durations(PClass):
+    """
+    How long each test in a run took.
+
+    ``codes``, ``start_times`` and ``durations`` are NumPy arrays of the same
+    length, and the Nth element of each refers to the Nth test to finish.
+    Test ids are stored once each, in ``names``, and ``codes`` indexes into
+    it, so a million tests don't need a million fixed-width strings.
+    ``untimed`` counts the tests that finished without a timestamp on their
+    start or end, which are left out.
+    """
+
+    names = field()
+    codes = field()
+    start_times = field()
+    durations = field()
+    untimed = field(type=int, initial=0)
+
+    def tests(self):
+        """
+        Get the id of each test, as a NumPy array of objects.
+        """
+        return self.names[self.codes]
+
+
+def get_durations(entries):
+    """
+    Find the duration of every test in a stream of parsed Eliot messages.
+
+    Tests whose action never finishes, or that lack timestamps, are left
+    out.
+
+    :param entries: An iterable of parsed Eliot messages, as returned by
+        ``parse_json_stream``.
+    :return: A ``Durations``.
+    """
+    started = {}
+    names = {}
+    codes = array('l')
+    start_times = array('d')
+    end_times = array('d')
+    untimed = 0
+    for entry in entries:
+        if entry.get('action_type') != TEST_ACTION_TYPE:
+            continue
+        task_uuid = entry.get('task_uuid')
+        if entry.get('action_status') == u'started':
+            started[task_uuid] = (entry.get('test'), entry.get('timestamp'))
+        elif task_uuid in started:
+            test, start_time = started.pop(task_uuid)
+            end_time = entry.get('timestamp')
+            if start_time is None or end_time is None:
+                untimed += 1
+                continue
+            codes.append(names.setdefault(test, len(names)))
+            start_times.append(start_time)
+            end_times.append(end_time)
+    ordered = np.empty(len(names), dtype=object)
+    for test, code in names.items():
+        ordered[code] = test
+    start_times = np.frombuffer(start_times, dtype=np.float64)
+    end_times = np.frombuffer(end_times, dtype=np.float64)
+    return Durations(
+        names=ordered,
+        codes=np.frombuffer(codes, dtype=np.int_).astype(np.intp),
+        start_times=start_times,
+        durations=end_times - start_times,
+        untimed=untimed,
+    )
+
+
+def percentiles(durations, q=(50, 90, 99)):
+    """
+    Get percentiles of the test durations.
+
+    :param durations: A ``Durations``.
+    :param q: A sequence of percentiles to compute, each between 0 and 100.
+    :return: A NumPy array of durations, one for each of ``q``.
+    """
+    return np.percentile(durations.durations, q)
+
+
+def histogram(durations, bins=10):
+    """
+    Get a histogram of the test durations.
+
+    :param durations: A ``Durations``.
+    :param bins: Either the number of bins or a sequence of bin edges, as
+        for ``numpy.histogram``.
+    :return: ``(counts, edges)``, as for ``numpy.histogram``.
+    """
+    return np.histogram(durations.durations, bins=bins)
+
+
+class Rollup(PClass):
+    """
+    Test durations aggregated by group, e.g. by module or by class.
+
+    All fields are NumPy arrays of the same length, sorted by group name.
+    """
+
+    groups = field()
+    counts = field()
+    totals = field()
+    maximums = field()
+
+    def means(self):
+        return self.totals / self.counts
+
+
+def _parent(test, depth):
+    """
+    Strip ``depth`` dotted components from the end of a test id.
+    """
+    for i in range(depth):
+        test = test.rpartition(u'.')[0]
+    return test
+
+
+def rollup(durations, depth=CLASS):
+    """
+    Aggregate test durations by the dotted prefix of the test id.
+
+    :param durations: A ``Durations``.
+    :param depth: How many components to strip from the end of each test id
+        to find its group. ``CLASS`` groups tests by class, ``MODULE`` by
+        module.
+    :return: A ``Rollup``. Tests logged without an id are in no group.
+    """
+    named = np.array(
+        [test is not None for test in durations.names], dtype=bool)
+    codes = durations.codes
+    times = durations.durations
+    if not named.all():
+        keep = named[codes]
+        codes = codes[keep]
+        times = times[keep]
+    if not len(codes):
+        empty = np.array([], dtype=np.float64)
+        return Rollup(
+            groups=np.array([], dtype=object),
+            counts=np.array([], dtype=np.intp),
+            totals=empty,
+            maximums=empty,
+        )
+    # Only work out the group of each distinct test once.
+    parents = np.empty(named.sum(), dtype=object)
+    parents[:] = [_parent(test, depth) for test in durations.names[named]]
+    groups, name_groups = np.unique(parents, return_inverse=True)
+    # Unnamed tests were dropped, so their codes are never looked up.
+    lookup = np.zeros(len(durations.names), dtype=np.intp)
+    lookup[named] = name_groups
+    indexes = lookup[codes]
+    maximums = np.zeros(len(groups), dtype=np.float64)
+    np.maximum.at(maximums, indexes, times)
+    return Rollup(
+        groups=groups,
+        counts=np.bincount(indexes, minlength=len(groups)),
+        totals=np.bincount(indexes, weights=times, minlength=len(groups)),
+        maximums=maximums,
+    )
@@ -0,0 +1,310 @@
+# Copyright (c) 2015 Jonathan M. Lange <jml@mumak.net>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Turn Eliot reporter output into subunit v2.
+
+Each ``trial:test`` action becomes an ``inprogress`` packet when it starts,
+then, when it finishes, a file attachment for each error, failure, skip,
+expected failure or unexpected success message in it, and a packet with the
+test's final status.
+
+See https://github.com/testing-cabal/subunit for the protocol. Only the
+parts needed to write test results are implemented here, so there's no
+dependency on ``python-subunit``.
+"""
+
+import argparse
+import json
+import struct
+import sys
+import zlib
+
+from ._parse import (
+    ERROR,
+    EXPECTED_FAILURE,
+    FAILURE,
+    SKIP,
+    SUCCESS,
+    TEST_ACTION_TYPE,
+    UNEXPECTED_SUCCESS,
+    TestResultCollector,
+    parse_test_entries,
+)
+
+
+_SIGNATURE = b'\xb3'
+_VERSION = 0x2000
+
+_FLAG_TEST_ID = 0x0800
+_FLAG_TIMESTAMP = 0x0200
+_FLAG_RUNNABLE = 0x0100
+_FLAG_FILE_CONTENT = 0x0040
+_FLAG_MIME_TYPE = 0x0020
+_FLAG_EOF = 0x0010
+
+STATUS_UNDEFINED = 0
+STATUS_INPROGRESS = 2
+STATUS_SUCCESS = 3
+STATUS_UXSUCCESS = 4
+STATUS_SKIP = 5
+STATUS_FAIL = 6
+STATUS_XFAIL = 7
+
+_STATUSES = {
+    SUCCESS: STATUS_SUCCESS,
+    ERROR: STATUS_FAIL,
+    FAILURE: STATUS_FAIL,
+    SKIP: STATUS_SKIP,
+    EXPECTED_FAILURE: STATUS_XFAIL,
+    UNEXPECTED_SUCCESS: STATUS_UXSUCCESS,
+}
+
+_TRACEBACK_MIME_TYPE = u'text/x-traceback; charset=utf8'
+_TEXT_MIME_TYPE = u'text/plain; charset=utf8'
+
+# Packets can be at most 4MiB, so attachments are split into chunks.
+_CHUNK_SIZE = 2 ** 16
+
+
+def _encode_number(value):
+    """
+    Encode a number as subunit does, in one to four bytes, the top two bits
+    of the first byte saying how many more there are.
+    """
+    if value < 0x40:
+        return struct.pack('>B', value)
+    if value < 0x4000:
+        return struct.pack('>H', value | 0x4000)
+    if value < 0x400000:
+        return struct.pack('>I', value | 0x800000)[1:]
+    if value < 0x40000000:
+        return struct.pack('>I', value | 0xc0000000)
+    raise ValueError('Too big for subunit: {}'.format(value))
+
+
+def _encode_string(value):
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    return _encode_number(len(value)) + value
+
+
+def _encode_timestamp(timestamp):
+    seconds = int(timestamp)
+    nanoseconds = min(int(round((timestamp - seconds) * 1e9)), 999999999)
+    return struct.pack('>I', seconds) + _encode_number(nanoseconds)
+
+
+def make_packet(test_id=None, status=STATUS_UNDEFINED, timestamp=None,
+                runnable=False, file_name=None, file_bytes=b'',
+                mime_type=None, eof=False):
+    """
+    Make a subunit v2 packet.
+
+    :param timestamp: Float seconds since the epoch, or ``None``.
+    :param file_name: If not ``None``, the packet carries ``file_bytes`` as
+        part of an attachment with this name.
+    :return: The packet, as bytes.
+    """
+    flags = _VERSION | status
+    body = []
+    if timestamp is not None:
+        flags |= _FLAG_TIMESTAMP
+        body.append(_encode_timestamp(timestamp))
+    if test_id is not None:
+        flags |= _FLAG_TEST_ID
+        body.append(_encode_string(test_id))
+    if mime_type is not None:
+        flags |= _FLAG_MIME_TYPE
+        body.append(_encode_string(mime_type))
+    if file_name is not None:
+        flags |= _FLAG_FILE_CONTENT
+        body.append(_encode_string(file_name))
+        body.append(_encode_string(file_bytes))
+    if runnable:
+        flags |= _FLAG_RUNNABLE
+    if eof:
+        flags |= _FLAG_EOF
+    body = b''.join(body)
+    # The length counts the whole packet, including the length itself.
+    length = len(_SIGNATURE) + 2 + len(body) + 4
+    for size, limit in [(1, 0x40), (2, 0x4000), (3, 0x400000)]:
+        if length + size < limit:
+            length += size
+            break
+    else:
+        raise ValueError('Packet too long: {} bytes'.format(length))
+    packet = (
+        _SIGNATURE + struct.pack('>H', flags) + _encode_number(length) + body)
+    return packet + struct.pack('>I', zlib.crc32(packet) & 0xffffffff)
+
+
+def _make_file_packets(test_id, name, mime_type, text):
+    data = text.encode('utf-8')
+    chunks = [
+        data[i:i + _CHUNK_SIZE] for i in range(0, len(data), _CHUNK_SIZE)
+    ] or [b'']
+    last = len(chunks) - 1
+    return [
+        make_packet(
+            test_id=test_id,
+            file_name=name,
+            file_bytes=chunk,
+            mime_type=mime_type if i == 0 else None,
+            eof=(i == last),
+        )
+        for i, chunk in enumerate(chunks)
+    ]
+
+
+def _get_attachments(detail):
+    """
+    Get the attachments for an outcome message.
+
+    :return: A list of ``(name, mime_type, text)``.
+    """
+    attachments = []
+    traceback = detail.get('traceback')
+    if traceback is not None:
+        text = u'{}'.format(traceback)
+        if text and not text.endswith(u'\n'):
+            text += u'\n'
+        text += u'{}: {}\n'.format(
+            detail.get('exception'), detail.get('reason'))
+        attachments.append((u'traceback', _TRACEBACK_MIME_TYPE, text))
+    elif detail.get('reason') is not None:
+        attachments.append(
+            (u'reason', _TEXT_MIME_TYPE, u'{}'.format(detail['reason'])))
+    if detail.get('todo') is not None:
+        attachments.append(
+            (u'todo', _TEXT_MIME_TYPE, u'{}'.format(detail['todo'])))
+    return attachments
+
+
+def result_to_packets(result):
+    """
+    Get the packets for a finished test: its attachments and final status.
+
+    :param result: A ``TestResult``.
+    :return: A list of packets.
+    """
+    packets = []
+    names = set()
+    for detail in result.details:
+        for name, mime_type, text in _get_attachments(detail):
+            # Names have to be unique within a test.
+            unique, i = name, 1
+            while unique in names:
+                i += 1
+                unique = u'{}-{}'.format(name, i)
+            names.add(unique)
+            packets.extend(
+                _make_file_packets(result.test, unique, mime_type, text))
+    packets.append(make_packet(
+        test_id=result.test,
+        status=_STATUSES.get(result.outcome, STATUS_FAIL),
+        timestamp=result.end_time,
+        runnable=True,
+    ))
+    return packets
+
+
+class SubunitWriter(object):
+    """
+    Write subunit v2 for Eliot reporter messages as they arrive.
+
+    Only keeps the messages of tests that are still running, so it works on
+    output of any length.
+
+    :param write: Called with each packet.
+    """
+
+    def __init__(self, write):
+        self._write = write
+        self._collector = TestResultCollector()
+
+    def feed(self, entry):
+        """
+        Add an Eliot message, either parsed or as it was logged.
+        """
+        if (entry.get('action_type') == TEST_ACTION_TYPE and
+                entry.get('action_status') == u'started'):
+            self._write(make_packet(
+                test_id=entry.get('test'),
+                status=STATUS_INPROGRESS,
+                timestamp=entry.get('timestamp'),
+                runnable=True,
+            ))
+        result = self._collector.feed(entry)
+        if result is not None:
+            for packet in result_to_packets(result):
+                self._write(packet)
+
+
+# Only messages with this in them can be part of a test's result.
+_TEST_MARKER = b'"trial:test'
+
+
+class SubunitSink(object):
+    """
+    Write subunit v2 to a file, given serialized Eliot reporter messages.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, 'ab')
+        self._writer = SubunitWriter(self._file.write)
+
+    def write(self, data):
+        if _TEST_MARKER in data:
+            self._writer.feed(json.loads(data))
+
+    def close(self):
+        self._file.close()
+
+
+def convert(lines, output):
+    """
+    Convert Eliot reporter output to subunit v2.
+
+    :param lines: An iterable of serialized Eliot messages.
+    :param output: A binary file to write subunit to.
+    """
+    writer = SubunitWriter(output.write)
+    for entry in parse_test_entries(lines):
+        writer.feed(entry)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description='Convert the output of the Eliot reporter to subunit v2.')
+    parser.add_argument(
+        'log', nargs='?',
+        help='Path to an Eliot reporter log. Reads stdin if not given.')
+    parser.add_argument(
+        '-o', '--output', help='Where to write subunit. Defaults to stdout.')
+    options = parser.parse_args(args)
+    output = sys.stdout
+    if options.output:
+        output = open(options.output, 'wb')
+    try:
+        if options.log:
+            with open(options.log) as f:
+                convert(f, output)
+        else:
+            convert(sys.stdin, output)
+    finally:
+        if options.output:
+            output.close()
+        else:
+            output.flush()
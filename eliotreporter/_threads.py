@@ -0,0 +1,120 @@
+# Copyright (c) 2015 Jonathan M. Lange <jml@mumak.net>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Accept Eliot messages from any thread, but only handle them in one.
+
+Eliot calls its destinations in whichever thread logged the message, so
+tests that log from ``deferToThread`` or a thread pool would otherwise have
+the reporter writing from several threads at once, interleaving partial
+lines. Instead, each other thread appends its messages to a queue of its
+own, and the thread that owns the reporter takes them from the queues the
+next time it handles a message of its own, or is asked to. Only the owning
+thread ever writes, so every line is written whole, and no lock is taken
+for each message.
+
+Once the merger is closed, nothing will take messages from the queues
+again, so anything other threads log after that is dropped rather than
+queued.
+"""
+
+from collections import deque
+import threading
+
+try:
+    from thread import get_ident
+except ImportError:
+    from threading import get_ident
+
+
+class ThreadMerger(object):
+    """
+    Pass messages from any thread to ``handle``, in the thread that made
+    this.
+
+    Messages from each thread are handled in the order that thread logged
+    them. Messages from other threads are handled in between the owning
+    thread's own messages, but not necessarily just after they were logged.
+
+    :param handle: Called with each message, only ever in the owning thread.
+    """
+
+    def __init__(self, handle):
+        self._handle = handle
+        self._owner = get_ident()
+        self._local = threading.local()
+        # (thread, queue) for each other thread that has logged. Only taken
+        # the first time a thread logs, and when cleaning up after threads
+        # that have finished.
+        self._lock = threading.Lock()
+        self._queues = []
+        self._closed = False
+
+    def write(self, message):
+        """
+        Handle ``message`` now, if called in the owning thread, or else queue
+        it to be handled by the owning thread.
+        """
+        if get_ident() == self._owner:
+            if self._queues:
+                self.drain()
+            self._handle(message)
+            return
+        if self._closed:
+            return
+        queue = getattr(self._local, 'queue', None)
+        if queue is None:
+            queue = self._local.queue = deque()
+            with self._lock:
+                self._queues.append((threading.current_thread(), queue))
+        queue.append(message)
+
+    def drain(self):
+        """
+        Handle every message that other threads have queued so far.
+
+        Must only be called in the owning thread.
+        """
+        finished = False
+        for thread, queue in list(self._queues):
+            while queue:
+                self._handle(queue.popleft())
+            if not thread.is_alive():
+                finished = True
+        if finished:
+            self._forget_finished()
+
+    def close(self):
+        """
+        Handle every message that other threads have queued, and drop any
+        they log from now on.
+
+        Must only be called in the owning thread.
+        """
+        with self._lock:
+            self._closed = True
+        self.drain()
+
+    def _forget_finished(self):
+        with self._lock:
+            finished = [
+                queue for thread, queue in self._queues
+                if not thread.is_alive()]
+            self._queues = [
+                (thread, queue) for thread, queue in self._queues
+                if thread.is_alive()]
+        # They can't log any more, but they may have since we looked.
+        for queue in finished:
+            while queue:
+                self._handle(queue.popleft())
@@ -32,6 +32,19 @@ TEST = ActionType(u'trial:test',
                   u'A test')
 
 
+_PHASE = Field.forTypes(
+    u'phase', [unicode],
+    u'The part of the test: setUp, test, cleanup or tearDown')
+
+"""
+The action of running one part of a test, inside its ``TEST`` action.
+"""
+PHASE = ActionType(u'trial:test:phase',
+                   [_PHASE],
+                   [],
+                   u'A part of a test')
+
+
 def _exception_name(exception_class):
     return '{}.{}'.format(
         exception_class.__module__, exception_class.__name__)
@@ -79,6 +92,68 @@ EXPECTED_FAILURE = MessageType(
 )
 
 
+_NET_SIZE = Field.forTypes(
+    u'net_size', [int, long, None],
+    u'Bytes allocated during a test and still allocated at the end of it, '
+    u'if known')
+_NET_COUNT = Field.forTypes(
+    u'net_count', [int, long],
+    u'Number of allocations, or of objects, retained by a test')
+_TOP = Field(
+    u'top', list,
+    u'The sites that retained the most, each a dict of site, size and count')
+
+"""
+Logged when a test finishes, if memory tracking is enabled and the test was
+sampled.
+"""
+MEMORY = MessageType(u'trial:test:memory', [_NET_SIZE, _NET_COUNT, _TOP])
+
+
+_ITERATIONS = Field.forTypes(
+    u'iterations', [int, long], u'Number of reactor iterations')
+_CALLBACK_TIME = Field.forTypes(
+    u'callback_time', [float],
+    u'Seconds spent running timed calls and handling I/O events')
+_LONGEST_CALLBACK = Field.forTypes(
+    u'longest_callback', [float],
+    u'Seconds taken by the longest single I/O event or batch of timed calls')
+_LONGEST_CALLBACK_SOURCE = Field.forTypes(
+    u'longest_callback_source', [unicode, None],
+    u'What the longest callback was for')
+_PENDING_COUNT = Field.forTypes(
+    u'pending_count', [int, long],
+    u'Number of delayed calls still pending when the test finished')
+_PENDING_CALLS = Field(
+    u'pending_calls', list, u'Descriptions of some of the pending calls')
+
+"""
+Logged when a test finishes, if reactor instrumentation is enabled.
+"""
+REACTOR = MessageType(u'trial:test:reactor', [
+    _ITERATIONS,
+    _CALLBACK_TIME,
+    _LONGEST_CALLBACK,
+    _LONGEST_CALLBACK_SOURCE,
+    _PENDING_COUNT,
+    _PENDING_CALLS,
+])
+
+
+_PASSED = Field.forTypes(
+    u'passed', [int, long],
+    u'Number of passing tests that were not logged')
+_DURATION = Field.forTypes(
+    u'duration', [float],
+    u'Seconds taken by the passing tests that were not logged')
+
+"""
+Logged every so often, and at the end of the run, if only some passing
+tests are logged.
+"""
+COUNTS = MessageType(u'trial:test:counts', [_PASSED, _DURATION])
+
+
 def _failure_to_exception_tuple(failure):
     """
     Convert a ``Failure`` to an exception 3-tuple.
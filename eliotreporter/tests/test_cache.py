@@ -0,0 +1,198 @@
+# Copyright (c) 2015 Jonathan M. Lange <jml@mumak.net>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import shutil
+import tempfile
+
+from pyrsistent import m, thaw
+import unittest2 as unittest
+
+from .. import _cache
+from .._cache import load_parsed_log
+from .._parse import Message, iter_test_results, parse_json_stream, to_tasks
+from .test_parse import make_test_messages
+
+
+ERROR_MESSAGE = m(message_type=u'trial:test:error', reason=u'boom')
+
+
+def serialize(messages):
+    return ''.join(json.dumps(thaw(x)) + '\n' for x in messages)
+
+
+class TestLoadParsedLog(unittest.TestCase):
+
+    def setUp(self):
+        super(TestLoadParsedLog, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.cache = os.path.join(self.directory, 'cache')
+        self.path = os.path.join(self.directory, 'run.log')
+        self.parsed = []
+        original = _cache._parse_tail
+
+        def parse_tail(entry, f):
+            self.parsed.append(entry['offset'])
+            return original(entry, f)
+
+        _cache._parse_tail = parse_tail
+        self.addCleanup(setattr, _cache, '_parse_tail', original)
+
+    def write(self, data, mode='wb'):
+        with open(self.path, mode) as f:
+            f.write(data)
+
+    def load(self, **kwargs):
+        return load_parsed_log(self.path, self.cache, **kwargs)
+
+    def assert_matches_log(self, parsed):
+        with open(self.path) as f:
+            lines = f.read().splitlines(True)
+        if lines and not lines[-1].endswith('\n'):
+            lines.pop()
+        entries = list(parse_json_stream(lines))
+        self.assertEqual(
+            to_tasks(Message.new(x) for x in entries), parsed.tasks())
+        self.assertEqual(
+            list(iter_test_results(entries)), list(parsed.results))
+
+    def make_log(self):
+        return (
+            make_test_messages(u'a', u'a.B.test_a', 1.0, 2.0) +
+            make_test_messages(u'b', u'a.B.test_b', 2.0, 3.0, ERROR_MESSAGE)
+        )
+
+    def test_matches_uncached(self):
+        self.write(serialize(self.make_log()))
+        parsed = self.load()
+        self.assert_matches_log(parsed)
+        self.assertEqual(2, len(parsed.results))
+
+    def test_cached(self):
+        self.write(serialize(self.make_log()))
+        first = self.load()
+        second = self.load()
+        self.assertEqual(list(first.results), list(second.results))
+        self.assertEqual(first.tasks(), second.tasks())
+        self.assertEqual([0], self.parsed)
+
+    def test_results_decoded_when_used(self):
+        self.write(serialize(self.make_log()))
+        self.load()
+        decoded = []
+        original = _cache.TestResult
+
+        def test_result(**kwargs):
+            decoded.append(kwargs['task_uuid'])
+            return original(**kwargs)
+
+        _cache.TestResult = test_result
+        self.addCleanup(setattr, _cache, 'TestResult', original)
+        parsed = self.load()
+        self.assertEqual([], decoded)
+        self.assertEqual(2, len(parsed.results))
+        self.assertEqual([u'a', u'b'], decoded)
+
+    def test_some_tasks(self):
+        self.write(serialize(self.make_log()))
+        tasks = self.load().tasks([u'b'])
+        self.assertEqual([u'b'], list(tasks.keys()))
+        self.assertEqual(3, len(tasks[u'b']))
+
+    def test_interleaved_tasks(self):
+        a = make_test_messages(u'a', u'a.B.test_a', 1.0, 3.0)
+        b = make_test_messages(u'b', u'a.B.test_b', 2.0, 4.0, ERROR_MESSAGE)
+        log = [a[0], b[0], a[1], b[1], b[2]]
+        data = serialize(log)
+        self.write(data)
+        parsed = self.load()
+        self.assert_matches_log(parsed)
+        self.assertEqual([u'a'], list(parsed.tasks([u'a']).keys()))
+        self.assertEqual(2, len(parsed.tasks([u'a'])[u'a']))
+        starts = [0]
+        for line in data.splitlines(True)[:-1]:
+            starts.append(starts[-1] + len(line))
+        self.assertEqual(
+            [starts[0], starts[2]], parsed.line_offsets([u'a']))
+        self.assertEqual([], parsed.line_offsets([u'c']))
+
+    def test_running_tests(self):
+        log = self.make_log()
+        self.write(serialize(log[:-1]))
+        parsed = self.load()
+        self.assertEqual([u'b'], list(parsed.running))
+        self.assertEqual([u'a.B.test_b'], parsed.running_tests())
+        self.write(serialize(log[-1:]), 'ab')
+        self.assertEqual([], self.load().running_tests())
+
+    def test_default_directory(self):
+        self.write(serialize(self.make_log()))
+        load_parsed_log(self.path)
+        cache = os.path.join(self.directory, '.trial-eliot-cache')
+        self.assertEqual(1, len(os.listdir(cache)))
+
+    def test_appended(self):
+        first = make_test_messages(u'a', u'a.B.test_a', 1.0, 2.0)
+        second = make_test_messages(
+            u'b', u'a.B.test_b', 2.0, 3.0, ERROR_MESSAGE)
+        # test_b starts before the append and finishes after it.
+        before = serialize(first + second[:1])
+        self.write(before)
+        self.assertEqual(1, len(self.load().results))
+        self.write(serialize(second[1:]), 'ab')
+        parsed = self.load()
+        self.assertEqual([0, len(before)], self.parsed)
+        self.assert_matches_log(parsed)
+        self.assertEqual(
+            [u'success', u'error'], [r.outcome for r in parsed.results])
+
+    def test_partial_line(self):
+        data = serialize(self.make_log())
+        self.write(data[:-10])
+        self.assertEqual(1, len(self.load().results))
+        self.write(data[-10:], 'ab')
+        parsed = self.load()
+        self.assert_matches_log(parsed)
+        self.assertEqual(2, len(parsed.results))
+
+    def test_rewritten(self):
+        self.write(serialize(self.make_log()))
+        self.load()
+        self.write(serialize(
+            make_test_messages(u'c', u'a.B.test_c', 1.0, 2.0)))
+        parsed = self.load()
+        self.assertEqual([0, 0], self.parsed)
+        self.assertEqual([u'a.B.test_c'], [r.test for r in parsed.results])
+
+    def test_eviction(self):
+        paths = []
+        for i in range(3):
+            self.path = os.path.join(self.directory, 'run-%d.log' % (i,))
+            self.write(serialize(self.make_log()))
+            paths.append(self.path)
+        sizes = 0
+        for i, path in enumerate(paths[:2]):
+            self.path = path
+            self.load()
+            cache_path = _cache._cache_path(self.cache, path)
+            os.utime(cache_path, (i, i))
+            sizes += os.path.getsize(cache_path)
+        self.path = paths[2]
+        self.load(max_bytes=sizes + 10)
+        self.assertEqual(
+            ['run-1.log', 'run-2.log'],
+            sorted(name.split('-')[0] + '-' + name.split('-')[1]
+                   for name in os.listdir(self.cache)))
@@ -0,0 +1,147 @@
+# Copyright (c) 2015 Jonathan M. Lange <jml@mumak.net>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from pyrsistent import m
+import unittest2 as unittest
+
+from .._cluster import (
+    cluster_failures,
+    get_frames,
+    iter_failures,
+    normalize,
+)
+from .._parse import iter_test_results
+from .test_parse import make_test_messages
+
+
+def make_traceback(*frames):
+    lines = [u'Traceback (most recent call last):']
+    for filename, line, function in frames:
+        lines.append(u'  File "{}", line {}, in {}'.format(
+            filename, line, function))
+    return u'\n'.join(lines)
+
+
+def make_failure(exception, reason, traceback):
+    return m(
+        message_type=u'trial:test:error',
+        exception=exception,
+        reason=reason,
+        traceback=traceback,
+    )
+
+
+DATABASE_FRAMES = [
+    (u'/src/app/tests/test_db.py', 10, u'test_query'),
+    (u'/src/app/db.py', 200, u'query'),
+    (u'/src/app/db.py', 150, u'connect'),
+    (u'/src/app/pool.py', 80, u'acquire'),
+    (u'/src/app/pool.py', 40, u'_open'),
+    (u'/usr/lib/python2.7/socket.py', 571, u'create_connection'),
+]
+
+TEMPLATE_FRAMES = [
+    (u'/src/app/tests/test_web.py', 12, u'test_render'),
+    (u'/src/app/web.py', 30, u'render'),
+    (u'/src/app/templates.py', 99, u'load'),
+]
+
+
+class TestNormalize(unittest.TestCase):
+
+    def test_addresses(self):
+        self.assertEqual(
+            u'<Foo object at 0x?>', normalize(u'<Foo object at 0x7f3a2b1c>'))
+
+    def test_line_numbers(self):
+        self.assertEqual(
+            u'File "foo.py", line ?, in bar',
+            normalize(u'File "foo.py", line 123, in bar'))
+        self.assertEqual(
+            u'foo/bar.py:?:baz', normalize(u'foo/bar.py:42:baz'))
+
+    def test_temp_paths(self):
+        self.assertEqual(
+            u'open(<tmp>)', normalize(u'open(/tmp/tmpAbc123/foo.txt)'))
+        self.assertEqual(
+            u'File "<tmp>"',
+            normalize(u'File "/src/_trial_temp/a/b/temp.py"'))
+
+    def test_get_frames(self):
+        traceback = make_traceback(
+            (u'/src/foo.py', 12, u'f'), (u'/tmp/xyz/bar.py', 3, u'g'))
+        self.assertEqual(
+            [u'File "/src/foo.py", line ?, in f',
+             u'File "<tmp>", line ?, in g'],
+            get_frames(traceback))
+
+
+class TestClusterFailures(unittest.TestCase):
+
+    def test_identical_signatures(self):
+        failures = [
+            ('test_%d' % i, make_failure(
+                u'socket.error', u'Connection refused',
+                make_traceback(*[
+                    (f, line + i, function)
+                    for f, line, function in DATABASE_FRAMES])))
+            for i in range(10)
+        ]
+        [cluster] = cluster_failures(failures, threshold=1)
+        self.assertEqual(10, len(cluster.tests))
+        self.assertEqual(1, cluster.signatures)
+
+    def test_separate_causes(self):
+        failures = [
+            ('test_db_%d' % i, make_failure(
+                u'socket.error', u'Connection refused',
+                make_traceback(*DATABASE_FRAMES)))
+            for i in range(3)
+        ] + [
+            ('test_web', make_failure(
+                u'exceptions.IOError', u'No such template',
+                make_traceback(*TEMPLATE_FRAMES))),
+        ]
+        clusters = cluster_failures(failures)
+        self.assertEqual(
+            [['test_db_0', 'test_db_1', 'test_db_2'], ['test_web']],
+            [list(c.tests) for c in clusters])
+
+    def test_near_duplicates(self):
+        # Same failure, reached through a different test.
+        failures = [
+            ('test_a', make_failure(
+                u'socket.error', u'Connection refused',
+                make_traceback(*DATABASE_FRAMES))),
+            ('test_b', make_failure(
+                u'socket.error', u'Connection refused',
+                make_traceback(
+                    (u'/src/app/tests/test_db.py', 20, u'test_insert'),
+                    *DATABASE_FRAMES[1:]))),
+        ]
+        self.assertEqual(2, len(cluster_failures(failures, threshold=1)))
+        [cluster] = cluster_failures(failures, threshold=0.5)
+        self.assertEqual(['test_a', 'test_b'], list(cluster.tests))
+        self.assertEqual(2, cluster.signatures)
+
+    def test_iter_failures(self):
+        error = make_failure(u'E', u'boom', u'')
+        skip = m(message_type=u'trial:test:skip', reason=u'meh')
+        entries = (
+            make_test_messages('a', 'test_a', 1.0, 2.0, error) +
+            make_test_messages('b', 'test_b', 1.0, 2.0, skip)
+        )
+        [(test, message)] = iter_failures(iter_test_results(entries))
+        self.assertEqual('test_a', test)
+        self.assertEqual(u'boom', message['reason'])
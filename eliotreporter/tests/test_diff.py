@@ -0,0 +1,111 @@
+# Copyright (c) 2015 Jonathan M. Lange <jml@mumak.net>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from pyrsistent import pvector
+import unittest2 as unittest
+
+from .._diff import NEW, OLD, TestChange, diff_runs, format_diff
+from .._parse import ERROR, FAILURE, SKIP, SUCCESS, TestResult
+
+
+def make_result(test, outcome=SUCCESS, duration=1.0):
+    return TestResult(
+        test=test,
+        task_uuid=test,
+        outcome=outcome,
+        start_time=0.0,
+        end_time=duration,
+        details=pvector(),
+    )
+
+
+OLD_RUN = [
+    make_result('a.B.test_broken', FAILURE),
+    make_result('a.B.test_fixed', ERROR),
+    make_result('a.B.test_fine'),
+    make_result('a.B.test_slow', duration=1.0),
+    make_result('a.B.test_skipped'),
+    make_result('a.B.test_removed', FAILURE),
+]
+
+NEW_RUN = [
+    make_result('a.B.test_fine'),
+    make_result('a.B.test_fixed'),
+    make_result('a.B.test_broken', FAILURE),
+    make_result('a.B.test_slow', duration=2.0),
+    make_result('a.B.test_skipped', SKIP),
+    make_result('a.B.test_added', ERROR),
+]
+
+
+class TestDiffRuns(unittest.TestCase):
+
+    def assert_diff(self, diff):
+        self.assertEqual(
+            ['a.B.test_added'], [c.test for c in diff.new_failures])
+        self.assertEqual(['a.B.test_fixed'], [c.test for c in diff.fixed])
+        self.assertEqual(
+            ['a.B.test_skipped'], [c.test for c in diff.newly_skipped])
+        self.assertEqual(
+            [TestChange(
+                test='a.B.test_slow',
+                old_outcome=SUCCESS,
+                new_outcome=SUCCESS,
+                old_duration=1.0,
+                new_duration=2.0,
+            )],
+            diff.slower)
+
+    def test_summarize_old(self):
+        self.assert_diff(diff_runs(OLD_RUN, NEW_RUN, smaller=OLD))
+
+    def test_summarize_new(self):
+        self.assert_diff(diff_runs(OLD_RUN, NEW_RUN, smaller=NEW))
+
+    def test_repeated_tests(self):
+        old = [make_result('a', FAILURE), make_result('b')]
+        new = [
+            make_result('a', ERROR), make_result('b'),
+            make_result('a'), make_result('b'),
+        ]
+        for smaller in (OLD, NEW):
+            diff = diff_runs(old, new, smaller=smaller)
+            self.assertEqual([], diff.new_failures)
+            self.assertEqual(
+                [('a', FAILURE, SUCCESS)],
+                [(c.test, c.old_outcome, c.new_outcome) for c in diff.fixed])
+
+    def test_slower_thresholds(self):
+        old = [make_result('a', duration=0.01), make_result('b', duration=1)]
+        new = [make_result('a', duration=0.1), make_result('b', duration=1.4)]
+        diff = diff_runs(old, new, ratio=1.5, minimum=0.1)
+        self.assertEqual([], diff.slower)
+        diff = diff_runs(old, new, ratio=1.3, minimum=0.05)
+        self.assertEqual(['b', 'a'], [c.test for c in diff.slower])
+
+    def test_format(self):
+        diff = diff_runs(
+            [make_result('a', duration=1.0)],
+            [make_result('a', duration=3.0), make_result('b', FAILURE)])
+        self.assertEqual(
+            u'New failures (1):\n'
+            u'  b (None -> failure)\n'
+            u'\n'
+            u'Slower (1):\n'
+            u'  a (1.000s -> 3.000s)\n',
+            format_diff(diff))
+
+    def test_format_no_differences(self):
+        diff = diff_runs([make_result('a')], [make_result('a')])
+        self.assertEqual(u'No differences.\n', format_diff(diff))
@@ -0,0 +1,147 @@
+# Copyright (c) 2015 Jonathan M. Lange <jml@mumak.net>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+
+from pyrsistent import m
+import unittest2 as unittest
+
+from .. import _flaky
+from .._flaky import FlakyTest, find_flaky, find_logs, iter_summaries
+from .._parse import ERROR, FAILURE, SKIP, SUCCESS
+from .test_live import make_lines
+
+
+ERROR_MESSAGE = m(message_type=u'trial:test:error', reason=u'boom')
+
+
+def write_log(path, *tests):
+    """
+    Write a reporter log with ``tests``, a sequence of
+    ``(test_id, duration, details)``.
+    """
+    lines = make_lines(*[
+        (test, 0.0, duration, details) for test, duration, details in tests])
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+class TestFindFlaky(unittest.TestCase):
+
+    def test_flaky(self):
+        summaries = [
+            {'a': (SUCCESS, 1.0), 'b': (SUCCESS, 1.0), 'c': (FAILURE, 1.0)},
+            {'a': (FAILURE, 2.0), 'b': (SUCCESS, 1.0), 'c': (FAILURE, 1.0)},
+            {'a': (SUCCESS, 1.0), 'b': (ERROR, 3.0), 'c': (FAILURE, 1.0)},
+        ]
+        self.assertEqual(
+            [FlakyTest(test='a', runs=3, passes=2, failures=1, flips=2,
+                       wasted_time=2.0),
+             FlakyTest(test='b', runs=3, passes=2, failures=1, flips=1,
+                       wasted_time=3.0)],
+            find_flaky(summaries))
+
+    def test_flip_rate(self):
+        test = FlakyTest(
+            test='a', runs=5, passes=3, failures=2, flips=2, wasted_time=0.0)
+        self.assertEqual(0.5, test.flip_rate())
+
+    def test_ties_broken_by_wasted_time(self):
+        summaries = [
+            {'a': (SUCCESS, 1.0), 'b': (SUCCESS, 1.0)},
+            {'a': (FAILURE, 1.0), 'b': (FAILURE, 5.0)},
+        ]
+        self.assertEqual(['b', 'a'], [t.test for t in find_flaky(summaries)])
+
+    def test_skips_ignored(self):
+        summaries = [
+            {'a': (SUCCESS, 1.0)},
+            {'a': (SKIP, 0.0)},
+            {'a': (SUCCESS, 1.0)},
+        ]
+        self.assertEqual([], find_flaky(summaries))
+
+
+class TestLoadSummaries(unittest.TestCase):
+
+    def setUp(self):
+        super(TestLoadSummaries, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.cache = os.path.join(self.directory, '.cache')
+
+    def make_logs(self):
+        paths = []
+        for i in range(3):
+            path = os.path.join(self.directory, 'run-%d.log' % i)
+            details = [ERROR_MESSAGE] if i == 1 else []
+            write_log(path, ('a.B.test_a', 1.0, details))
+            os.utime(path, (i, i))
+            paths.append(path)
+        return paths
+
+    def test_find_logs(self):
+        paths = self.make_logs()
+        os.makedirs(self.cache)
+        self.assertEqual(paths, find_logs(self.directory))
+        self.assertEqual(paths[1:2], find_logs(self.directory, '*-1.log'))
+
+    def test_parallel(self):
+        paths = self.make_logs()
+        summaries = list(iter_summaries(paths, processes=2))
+        self.assertEqual(
+            [{'a.B.test_a': (SUCCESS, 1.0)},
+             {'a.B.test_a': (ERROR, 1.0)},
+             {'a.B.test_a': (SUCCESS, 1.0)}],
+            summaries)
+
+    def test_cached(self):
+        paths = self.make_logs()
+        expected = list(iter_summaries(paths, self.cache, processes=1))
+        parsed = []
+        original = _flaky.summarize_log
+
+        def summarize_log(path):
+            parsed.append(path)
+            return original(path)
+
+        _flaky.summarize_log = summarize_log
+        self.addCleanup(setattr, _flaky, 'summarize_log', original)
+        self.assertEqual(
+            expected, list(iter_summaries(paths, self.cache, processes=1)))
+        self.assertEqual([], parsed)
+
+        # Changing one log means only that one gets parsed again.
+        write_log(paths[2], ('a.B.test_a', 1.0, [ERROR_MESSAGE]))
+        summaries = list(iter_summaries(paths, self.cache, processes=1))
+        self.assertEqual([paths[2]], parsed)
+        self.assertEqual({'a.B.test_a': (ERROR, 1.0)}, summaries[2])
+
+    def test_same_name_in_other_directory(self):
+        [path] = self.make_logs()[:1]
+        other = os.path.join(self.directory, 'other')
+        os.makedirs(other)
+        other_path = os.path.join(other, os.path.basename(path))
+        write_log(other_path, ('a.B.test_z', 1.0, []))
+        # Same size and modification time, but a different log.
+        os.utime(other_path, (0, 0))
+        self.assertEqual(os.path.getsize(path), os.path.getsize(other_path))
+        self.assertEqual(
+            [{'a.B.test_a': (SUCCESS, 1.0)}],
+            list(iter_summaries([path], self.cache, processes=1)))
+        self.assertEqual(
+            [{'a.B.test_z': (SUCCESS, 1.0)}],
+            list(iter_summaries([other_path], self.cache, processes=1)))
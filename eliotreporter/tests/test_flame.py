@@ -0,0 +1,146 @@
+# Copyright (c) 2015 Jonathan M. Lange <jml@mumak.net>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+from StringIO import StringIO
+
+from pyrsistent import m, thaw
+import unittest2 as unittest
+
+from .._flame import (
+    build_tree,
+    iter_action_timings,
+    parse_action_entries,
+    write_folded,
+    write_speedscope,
+)
+from .._phases import SET_UP, TEST_METHOD
+from .test_parse import make_test_messages
+from .test_phases import make_phased_messages
+
+
+def make_entries():
+    return (
+        make_phased_messages(u'a', u'pkg.mod.A.test_a', [
+            (SET_UP, 1.0, 3.0), (TEST_METHOD, 3.0, 4.0)]) +
+        make_test_messages(u'b', u'pkg.mod.A.test_b', 0.0, 0.5) +
+        make_test_messages(u'c', u'pkg.other.B.test_c', 0.0, 0.25)
+    )
+
+
+class TestTimings(unittest.TestCase):
+
+    def test_nested(self):
+        self.assertEqual([
+            ((u'pkg', u'mod', u'A', u'test_a', SET_UP), 2.0),
+            ((u'pkg', u'mod', u'A', u'test_a', TEST_METHOD), 1.0),
+            ((u'pkg', u'mod', u'A', u'test_a'), 10.0),
+            ((u'pkg', u'mod', u'A', u'test_b'), 0.5),
+            ((u'pkg', u'other', u'B', u'test_c'), 0.25),
+        ], list(iter_action_timings(make_entries())))
+
+    def test_action_in_action(self):
+        entries = make_test_messages(u'a', u'a.B.test_c', 0.0, 5.0)
+        entries[1:1] = [
+            m(task_uuid=u'a', task_level=[2, 1], timestamp=1.0,
+              action_type=u'outer', action_status=u'started'),
+            m(task_uuid=u'a', task_level=[2, 2, 1], timestamp=1.5,
+              action_type=u'inner', action_status=u'started'),
+            m(task_uuid=u'a', task_level=[2, 2, 2], timestamp=2.0,
+              action_type=u'inner', action_status=u'succeeded'),
+            m(task_uuid=u'a', task_level=[2, 3], timestamp=3.0,
+              action_type=u'outer', action_status=u'succeeded'),
+        ]
+        self.assertEqual([
+            ((u'a', u'B', u'test_c', u'outer', u'inner'), 0.5),
+            ((u'a', u'B', u'test_c', u'outer'), 2.0),
+            ((u'a', u'B', u'test_c'), 5.0),
+        ], list(iter_action_timings(entries)))
+
+    def test_actions_outside_tests(self):
+        entries = [
+            m(task_uuid=u'x', task_level=[1], timestamp=1.0,
+              action_type=u'app:thing', action_status=u'started'),
+            m(task_uuid=u'x', task_level=[2], timestamp=2.0,
+              action_type=u'app:thing', action_status=u'succeeded'),
+        ]
+        self.assertEqual([], list(iter_action_timings(entries)))
+
+    def test_incomplete_actions_skipped(self):
+        no_test = make_test_messages(u'x', None, 0.0, 1.0)
+        no_start_time = make_test_messages(u'y', u'a.B.test_y', 0.0, 1.0)
+        no_start_time[0] = no_start_time[0].remove('timestamp')
+        no_end_time = make_test_messages(u'z', u'a.B.test_z', 0.0, 2.0)
+        no_end_time[1:1] = [
+            m(task_uuid=u'z', task_level=[2, 1], timestamp=0.5,
+              action_type=u'inner', action_status=u'started'),
+            m(task_uuid=u'z', task_level=[2, 2],
+              action_type=u'inner', action_status=u'succeeded'),
+        ]
+        no_level = m(task_uuid=u'w', action_type=u'trial:test',
+                     action_status=u'started', timestamp=0.0)
+        entries = (
+            no_test + no_start_time + no_end_time + [no_level] +
+            make_test_messages(u'b', u'a.B.test_b', 0.0, 0.5))
+        self.assertEqual([
+            ((u'a', u'B', u'test_z'), 2.0),
+            ((u'a', u'B', u'test_b'), 0.5),
+        ], list(iter_action_timings(entries)))
+
+    def test_parse_only_actions(self):
+        lines = [json.dumps(thaw(x)) for x in make_entries()]
+        lines.insert(1, json.dumps({u'message_type': u'app:noise'}))
+        self.assertEqual(
+            [json.loads(line) for line in lines if 'app:noise' not in line],
+            list(parse_action_entries(lines)))
+
+
+class TestExport(unittest.TestCase):
+
+    def test_folded(self):
+        output = StringIO()
+        write_folded(build_tree(make_entries()), output)
+        self.assertEqual([
+            'pkg;mod;A;test_a 7000000',
+            'pkg;mod;A;test_a;setUp 2000000',
+            'pkg;mod;A;test_a;test 1000000',
+            'pkg;mod;A;test_b 500000',
+            'pkg;other;B;test_c 250000',
+        ], output.getvalue().splitlines())
+
+    def test_totals(self):
+        tree = build_tree(make_entries())
+        self.assertEqual(10.75, tree.total())
+        # Repeated tests add up.
+        tree.add((u'pkg', u'mod', u'A', u'test_b'), 0.5)
+        self.assertEqual(11.25, tree.total())
+
+    def test_speedscope(self):
+        output = StringIO()
+        write_speedscope(build_tree(make_entries()), output, name=u'run')
+        document = json.loads(output.getvalue())
+        frames = [f['name'] for f in document['shared']['frames']]
+        [profile] = document['profiles']
+        self.assertEqual(
+            (u'sampled', u'seconds', 10.75),
+            (profile['type'], profile['unit'], profile['endValue']))
+        self.assertEqual([
+            [u'pkg', u'mod', u'A', u'test_a'],
+            [u'pkg', u'mod', u'A', u'test_a', u'setUp'],
+            [u'pkg', u'mod', u'A', u'test_a', u'test'],
+            [u'pkg', u'mod', u'A', u'test_b'],
+            [u'pkg', u'other', u'B', u'test_c'],
+        ], [[frames[i] for i in sample] for sample in profile['samples']])
+        self.assertEqual([7.0, 2.0, 1.0, 0.5, 0.25], profile['weights'])
+        self.assertEqual(len(frames), len(set(frames)))
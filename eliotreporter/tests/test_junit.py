@@ -0,0 +1,125 @@
+# Copyright (c) 2015 Jonathan M. Lange <jml@mumak.net>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from StringIO import StringIO
+import json
+from xml.etree import ElementTree
+
+from pyrsistent import m, thaw
+import unittest2 as unittest
+
+from .. import _junit
+from .._junit import convert, split_test_id
+from .test_parse import make_test_messages
+
+
+def run(*tests):
+    """
+    Convert ``tests``, a sequence of ``(test_id, duration, details)``, to
+    JUnit XML and parse it.
+    """
+    messages = []
+    for i, (test, duration, details) in enumerate(tests):
+        messages.extend(
+            make_test_messages(u'%d' % (i,), test, 0.0, duration, *details))
+    output = StringIO()
+    convert([json.dumps(thaw(x)) for x in messages], output)
+    return ElementTree.fromstring(output.getvalue())
+
+
+class TestJUnit(unittest.TestCase):
+
+    def test_split_test_id(self):
+        self.assertEqual((u'a.b.C', u'test_d'), split_test_id(u'a.b.C.test_d'))
+
+    def test_split_missing_test_id(self):
+        self.assertEqual((u'', _junit.UNKNOWN_TEST), split_test_id(None))
+
+    def test_grouped_by_class(self):
+        root = run(
+            (u'a.B.test_1', 1.0, []),
+            (u'a.B.test_2', 0.5, []),
+            (u'a.C.test_1', 2.0, []),
+        )
+        suites = root.findall('testsuite')
+        self.assertEqual(
+            [('a.B', '2', '1.500000'), ('a.C', '1', '2.000000')],
+            [(s.get('name'), s.get('tests'), s.get('time'))
+             for s in suites])
+        self.assertEqual(
+            [('a.B', 'test_1', '1.000000'), ('a.B', 'test_2', '0.500000')],
+            [(c.get('classname'), c.get('name'), c.get('time'))
+             for c in suites[0].findall('testcase')])
+
+    def test_outcomes(self):
+        error = m(message_type=u'trial:test:error', exception=u'E',
+                  reason=u'boom', traceback=u'Traceback <here>')
+        failure = m(message_type=u'trial:test:failure', exception=u'F',
+                    reason=u'1 != 2', traceback=u'Traceback')
+        skip = m(message_type=u'trial:test:skip', reason=u'meh')
+        xfail = m(message_type=u'trial:test:expected-failure',
+                  todo=u'later', exception=u'E', reason=u'boom',
+                  traceback=u'Traceback')
+        [suite] = run(
+            (u'a.B.test_error', 1.0, [error]),
+            (u'a.B.test_failure', 1.0, [failure]),
+            (u'a.B.test_skip', 0.0, [skip]),
+            (u'a.B.test_xfail', 1.0, [xfail]),
+        )
+        self.assertEqual(
+            ('4', '1', '1', '2'),
+            (suite.get('tests'), suite.get('errors'), suite.get('failures'),
+             suite.get('skipped')))
+        cases = suite.findall('testcase')
+        element = cases[0].find('error')
+        self.assertEqual(
+            ('E', 'boom', 'Traceback <here>'),
+            (element.get('type'), element.get('message'), element.text))
+        self.assertEqual('1 != 2', cases[1].find('failure').get('message'))
+        self.assertEqual('meh', cases[2].find('skipped').get('message'))
+        self.assertEqual(
+            'Expected failure: later',
+            cases[3].find('skipped').get('message'))
+
+    def test_invalid_characters(self):
+        error = m(message_type=u'trial:test:error', exception=u'E',
+                  reason=u'bad \x00 "byte"', traceback=u'\x1b[31mred')
+        [suite] = run((u'a.B.test_a', 1.0, [error]))
+        element = suite.find('testcase').find('error')
+        self.assertEqual(u'bad \ufffd "byte"', element.get('message'))
+        self.assertEqual(u'\ufffd[31mred', element.text)
+
+    def test_missing_test_id(self):
+        error = m(message_type=u'trial:test:error', reason=u'boom')
+        root = run((u'a.B.test_a', 1.0, []), (None, 2.0, [error]))
+        self.assertEqual(
+            [('a.B', 'test_a'), ('', _junit.UNKNOWN_TEST)],
+            [(c.get('classname'), c.get('name'))
+             for c in root.iter('testcase')])
+        self.assertEqual(
+            ['0', '1'], [s.get('errors') for s in root.findall('testsuite')])
+
+    def test_spooled_to_disk(self):
+        self.patch(_junit, '_SPOOL_SIZE', 10)
+        root = run(*[(u'a.B.test_%d' % (i,), 1.0, []) for i in range(50)])
+        [suite] = root.findall('testsuite')
+        self.assertEqual(50, len(suite.findall('testcase')))
+
+    def patch(self, obj, name, value):
+        original = getattr(obj, name)
+        setattr(obj, name, value)
+        self.addCleanup(setattr, obj, name, original)
+
+    def test_empty(self):
+        self.assertEqual([], list(run()))
@@ -0,0 +1,173 @@
+# Copyright (c) 2015 Jonathan M. Lange <jml@mumak.net>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+
+from eliot.testing import LoggedMessage, capture_logging
+from twisted.python.failure import Failure
+from twisted.trial.unittest import TestCase
+from twisted.trial.util import DirtyReactorAggregateError
+import unittest2 as unittest
+
+from .._environment import REACTOR_ENVIRONMENT_VARIABLE
+from .._latency import (
+    ReactorMonitor,
+    open_reactor_monitor,
+)
+from .._types import REACTOR
+from .test_reporter import make_reporter, make_test
+
+
+class FakeTimer(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class Selectable(object):
+    pass
+
+
+class FakeReactor(object):
+    """
+    Just enough of a reactor to be measured. Each step advances ``timer``
+    by the given number of seconds.
+    """
+
+    def __init__(self, timer):
+        self._timer = timer
+        self.pending = []
+
+    def runUntilCurrent(self, seconds=0.0):
+        self._timer.now += seconds
+
+    def _doReadOrWrite(self, selectable, seconds=0.0):
+        self._timer.now += seconds
+
+    def getDelayedCalls(self):
+        return list(self.pending)
+
+
+class TestReactorMonitor(unittest.TestCase):
+
+    def setUp(self):
+        super(TestReactorMonitor, self).setUp()
+        self.timer = FakeTimer()
+        self.reactor = FakeReactor(self.timer)
+        self.monitor = ReactorMonitor(self.reactor, self.timer)
+        self.monitor.install()
+        self.addCleanup(self.monitor.uninstall)
+
+    def test_measures(self):
+        self.monitor.start()
+        self.reactor.runUntilCurrent(0.5)
+        self.reactor._doReadOrWrite(Selectable(), 2.0)
+        self.reactor.runUntilCurrent(0.25)
+        self.reactor.pending.append('<DelayedCall f>')
+        self.assertEqual(
+            {u'iterations': 2,
+             u'callback_time': 2.75,
+             u'longest_callback': 2.0,
+             u'longest_callback_source': u'{}.Selectable'.format(__name__),
+             u'pending_count': 1,
+             u'pending_calls': [u'<DelayedCall f>']},
+            self.monitor.stop())
+
+    def test_cancelled_calls_pending(self):
+        self.monitor.start()
+        self.monitor.add_error(
+            Failure(DirtyReactorAggregateError(['<DelayedCall f>'])))
+        self.monitor.add_error(Failure(RuntimeError('boom')))
+        self.reactor.pending.append('<DelayedCall g>')
+        result = self.monitor.stop()
+        self.assertEqual(
+            (2, [u'<DelayedCall f>', u'<DelayedCall g>']),
+            (result['pending_count'], result['pending_calls']))
+        self.monitor.start()
+        self.reactor.pending = []
+        self.assertEqual(0, self.monitor.stop()['pending_count'])
+
+    def test_start_resets(self):
+        self.reactor.runUntilCurrent(1.0)
+        self.monitor.start()
+        result = self.monitor.stop()
+        self.assertEqual(
+            (0, 0.0, None),
+            (result['iterations'], result['callback_time'],
+             result['longest_callback_source']))
+
+    def test_uninstall(self):
+        self.monitor.uninstall()
+        self.assertEqual({'_timer': self.timer, 'pending': []},
+                         vars(self.reactor))
+        self.reactor.runUntilCurrent(1.0)
+        self.assertEqual(0, self.monitor.stop()['iterations'])
+
+    def test_nested_monitors(self):
+        inner = ReactorMonitor(self.reactor, self.timer)
+        inner.install()
+        self.reactor.runUntilCurrent()
+        inner.uninstall()
+        self.reactor.runUntilCurrent()
+        self.assertEqual(1, inner.stop()['iterations'])
+        self.assertEqual(2, self.monitor.stop()['iterations'])
+
+
+class TestReporterReactor(unittest.TestCase):
+
+    def test_disabled_by_default(self):
+        self.assertIs(None, open_reactor_monitor({}))
+
+    @capture_logging(None)
+    def test_logged_inside_test(self, logger):
+        from twisted.internet import reactor
+        os.environ[REACTOR_ENVIRONMENT_VARIABLE] = '1'
+        self.addCleanup(os.environ.pop, REACTOR_ENVIRONMENT_VARIABLE)
+        reporter = make_reporter(logger=logger)
+        self.addCleanup(reporter.done)
+        self.assertIn('runUntilCurrent', vars(reactor))
+
+        def pending(test):
+            call = reactor.callLater(10, lambda: None)
+            self.addCleanup(call.cancel)
+
+        make_test(None, pending).run(reporter)
+        [message] = LoggedMessage.of_type(logger.messages, REACTOR)
+        self.assertEqual(
+            logger.messages[0]['task_uuid'], message.message['task_uuid'])
+        self.assertGreaterEqual(message.message['pending_count'], 1)
+        reporter.done()
+        self.assertNotIn('runUntilCurrent', vars(reactor))
+
+    @capture_logging(None)
+    def test_calls_cancelled_by_janitor(self, logger):
+        from twisted.internet import reactor
+        os.environ[REACTOR_ENVIRONMENT_VARIABLE] = '1'
+        self.addCleanup(os.environ.pop, REACTOR_ENVIRONMENT_VARIABLE)
+        reporter = make_reporter(logger=logger)
+        self.addCleanup(reporter.done)
+
+        class LeakyTest(TestCase):
+            def test_leak(self):
+                reactor.callLater(100, lambda: None)
+
+        LeakyTest('test_leak').run(reporter)
+        self.assertEqual([], reactor.getDelayedCalls())
+        [message] = LoggedMessage.of_type(logger.messages, REACTOR)
+        self.assertEqual(1, message.message['pending_count'])
+        [call] = message.message['pending_calls']
+        self.assertIn(u'<lambda>', call)
@@ -0,0 +1,210 @@
+# Copyright (c) 2015 Jonathan M. Lange <jml@mumak.net>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import shutil
+import socket
+from StringIO import StringIO
+import sys
+import tempfile
+
+from eliot import MemoryLogger
+from pyrsistent import m, thaw
+from twisted.internet.task import Clock
+from twisted.test.proto_helpers import StringTransport
+import unittest2 as unittest
+
+from .._environment import LIVE_FEED_ENVIRONMENT_VARIABLE
+from .._live import (
+    LiveFeed,
+    LiveService,
+    ProgressTracker,
+    feed_factory,
+    load_history,
+    subscriber_factory,
+)
+from .test_parse import make_test_messages
+from .test_reporter import make_reporter
+
+
+FAILURE = m(message_type=u'trial:test:failure', reason=u'1 != 2')
+
+
+def make_lines(*tests):
+    """
+    Make reporter output for ``tests``, a sequence of
+    ``(test_id, start_time, end_time, details)``.
+    """
+    lines = []
+    for i, (test, start_time, end_time, details) in enumerate(tests):
+        messages = make_test_messages(
+            str(i), test, start_time, end_time, *details)
+        lines.extend(json.dumps(thaw(x)) for x in messages)
+    return lines
+
+
+class TestProgressTracker(unittest.TestCase):
+
+    def feed(self, tracker, lines):
+        service = LiveService(tracker, Clock())
+        for line in lines:
+            service.line_received(line)
+
+    def test_counts(self):
+        tracker = ProgressTracker()
+        self.feed(tracker, make_lines(
+            ('a.B.test_a', 10.0, 11.0, []),
+            ('a.B.test_b', 11.0, 12.0, [FAILURE]),
+            ('a.B.test_c', 12.0, 14.0, []),
+        ))
+        self.assertEqual(
+            {u'tests_run': 3,
+             u'failures': 1,
+             u'elapsed': 4.0,
+             u'throughput': 0.75,
+             u'eta': None,
+            }, tracker.as_dict())
+
+    def test_eta(self):
+        # Last time, each test took 1s. This time, they're taking twice as
+        # long.
+        history = {'a.B.test_a': 1.0, 'a.B.test_b': 1.0, 'a.B.test_c': 1.0}
+        tracker = ProgressTracker(history)
+        self.feed(tracker, make_lines(('a.B.test_a', 10.0, 12.0, [])))
+        self.assertEqual(4.0, tracker.eta())
+
+    def test_load_history(self):
+        lines = make_lines(
+            ('a.B.test_a', 10.0, 11.0, []),
+            ('a.B.test_b', 11.0, 13.5, []),
+        )
+        self.assertEqual(
+            {'a.B.test_a': 1.0, 'a.B.test_b': 2.5}, load_history(lines))
+
+
+class TestLiveService(unittest.TestCase):
+
+    def make_service(self):
+        clock = Clock()
+        service = LiveService(ProgressTracker(), clock, interval=1.0)
+        return clock, service
+
+    def connect(self, factory):
+        protocol = factory.buildProtocol(None)
+        transport = StringTransport()
+        protocol.makeConnection(transport)
+        return protocol, transport
+
+    def get_updates(self, transport):
+        return [json.loads(x) for x in transport.value().splitlines()]
+
+    def test_subscriber_gets_current_status(self):
+        clock, service = self.make_service()
+        _, transport = self.connect(subscriber_factory(service))
+        [update] = self.get_updates(transport)
+        self.assertEqual(0, update['tests_run'])
+
+    def test_updates_are_coalesced(self):
+        clock, service = self.make_service()
+        feed, _ = self.connect(feed_factory(service))
+        _, transport = self.connect(subscriber_factory(service))
+        lines = make_lines(
+            *[('a.B.test_%d' % i, float(i), i + 0.001, []) for i in range(50)])
+        feed.dataReceived(b'\n'.join(lines) + b'\n')
+        self.assertEqual(1, len(self.get_updates(transport)))
+        clock.advance(1.0)
+        updates = self.get_updates(transport)
+        self.assertEqual([0, 50], [x['tests_run'] for x in updates])
+        clock.advance(1.0)
+        self.assertEqual(2, len(self.get_updates(transport)))
+
+    def test_unsubscribe(self):
+        clock, service = self.make_service()
+        feed, _ = self.connect(feed_factory(service))
+        subscriber, transport = self.connect(subscriber_factory(service))
+        subscriber.connectionLost(None)
+        feed.dataReceived(b'\n'.join(make_lines(('a.B.test_a', 1.0, 2.0, [])))
+                          + b'\n')
+        clock.advance(1.0)
+        self.assertEqual(1, len(self.get_updates(transport)))
+
+    def test_bad_lines_ignored(self):
+        clock, service = self.make_service()
+        feed, _ = self.connect(feed_factory(service))
+        feed.dataReceived(b'not json\n\n')
+        self.assertEqual(0, service.tracker.tests_run)
+
+
+class TestLiveFeed(unittest.TestCase):
+
+    def test_write(self):
+        a, b = socket.socketpair()
+        self.addCleanup(b.close)
+        feed = LiveFeed(a)
+        self.addCleanup(feed.close)
+        feed.write(b'{"foo": "bar"}\n')
+        self.assertEqual(b'{"foo": "bar"}\n', b.recv(1024))
+
+    def test_service_gone(self):
+        a, b = socket.socketpair()
+        feed = LiveFeed(a)
+        b.close()
+        feed.write(b'x' * 2 ** 20)
+        feed.write(b'x')
+
+    def test_service_stalled(self):
+        a, b = socket.socketpair()
+        self.addCleanup(b.close)
+        feed = LiveFeed(a, timeout=0.01)
+        for i in range(64):
+            feed.write(b'x' * 2 ** 20)
+        self.assertIs(None, feed._socket)
+
+    def test_service_not_running(self):
+        errors = StringIO()
+        self.assertIs(
+            None, LiveFeed.connect('unix:/nonexistent', errors=errors))
+        self.assertIn('unix:/nonexistent', errors.getvalue())
+
+    def test_reporter_without_service(self):
+        os.environ[LIVE_FEED_ENVIRONMENT_VARIABLE] = 'unix:/nonexistent'
+        self.addCleanup(os.environ.pop, LIVE_FEED_ENVIRONMENT_VARIABLE)
+        self.addCleanup(setattr, sys, 'stderr', sys.stderr)
+        sys.stderr = StringIO()
+        stream = StringIO()
+        reporter = make_reporter(stream, logger=MemoryLogger())
+        reporter._write_message({u'foo': u'bar'})
+        reporter.done()
+        self.assertEqual('{"foo": "bar"}\n', stream.getvalue())
+
+    def test_bad_description(self):
+        self.assertRaises(ValueError, LiveFeed.connect, 'carrier-pigeon:1')
+
+    def test_reporter_sends_to_feed(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'live')
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.addCleanup(server.close)
+        server.bind(path)
+        server.listen(1)
+        os.environ[LIVE_FEED_ENVIRONMENT_VARIABLE] = 'unix:' + path
+        self.addCleanup(os.environ.pop, LIVE_FEED_ENVIRONMENT_VARIABLE)
+        reporter = make_reporter(logger=MemoryLogger())
+        connection, _ = server.accept()
+        self.addCleanup(connection.close)
+        reporter._write_message({u'foo': u'bar'})
+        reporter.done()
+        self.assertEqual(b'{"foo": "bar"}\n', connection.recv(1024))
@@ -0,0 +1,162 @@
+# Copyright (c) 2015 Jonathan M. Lange <jml@mumak.net>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+
+from eliot.testing import LoggedMessage, capture_logging
+from pyrsistent import m
+import unittest2 as unittest
+
+from .. import _memory
+from .._environment import (
+    MEMORY_ENVIRONMENT_VARIABLE,
+    MEMORY_SAMPLE_ENVIRONMENT_VARIABLE,
+)
+from .._memory import (
+    MemoryTracker,
+    _GCBackend,
+    open_memory_tracker,
+    rank_by_memory,
+)
+from .._parse import iter_test_results
+from .._sampling import is_sampled
+from .._types import MEMORY
+from .test_parse import make_test_messages
+from .test_reporter import make_reporter, make_test
+
+
+class Leaked(object):
+    pass
+
+
+_LEAKS = []
+
+
+def leak(count):
+    _LEAKS.extend(Leaked() for i in range(count))
+
+
+class RecordingBackend(object):
+
+    def __init__(self):
+        self.calls = []
+
+    def start(self):
+        self.calls.append('start')
+
+    def stop(self):
+        self.calls.append('stop')
+        return 300, 3, [(u'a.py:1', 100, 1), (u'b.py:2', 200, 2),
+                        (u'c.py:3', -50, -1)]
+
+
+class TestMemoryTracker(unittest.TestCase):
+
+    def setUp(self):
+        super(TestMemoryTracker, self).setUp()
+        self.addCleanup(_LEAKS.__delitem__, slice(None))
+
+    def test_gc_backend(self):
+        tracker = MemoryTracker(limit=5, backend=_GCBackend())
+        tracker.start(u'a.B.test_c')
+        leak(100)
+        retained = tracker.stop()
+        self.assertIs(None, retained['net_size'])
+        sites = dict(
+            (site['site'], site['count']) for site in retained['top'])
+        self.assertEqual(100, sites[u'{}.Leaked'.format(__name__)])
+
+    @unittest.skipIf(_memory.tracemalloc is None, 'No tracemalloc')
+    def test_tracemalloc_backend(self):
+        tracker = MemoryTracker(limit=5)
+        tracker.start(u'a.B.test_c')
+        leak(1000)
+        retained = tracker.stop()
+        self.assertGreater(retained['net_size'], 0)
+        self.assertFalse(_memory.tracemalloc.is_tracing())
+
+    def test_top_sites(self):
+        backend = RecordingBackend()
+        tracker = MemoryTracker(limit=2, backend=backend)
+        tracker.start(u'a.B.test_c')
+        self.assertEqual(
+            {u'net_size': 300, u'net_count': 3, u'top': [
+                {u'site': u'b.py:2', u'size': 200, u'count': 2},
+                {u'site': u'a.py:1', u'size': 100, u'count': 1},
+            ]},
+            tracker.stop())
+
+    def test_not_sampled(self):
+        backend = RecordingBackend()
+        tracker = MemoryTracker(sample=0, backend=backend)
+        tracker.start(u'a.B.test_c')
+        self.assertIs(None, tracker.stop())
+        self.assertEqual([], backend.calls)
+
+    def test_sampling_stable(self):
+        tests = [u'a.B.test_%d' % (i,) for i in range(1000)]
+        sampled = [t for t in tests if is_sampled(t, 0.1)]
+        self.assertEqual(sampled, [t for t in tests if is_sampled(t, 0.1)])
+        self.assertTrue(50 < len(sampled) < 150, len(sampled))
+
+    def test_disabled_by_default(self):
+        self.assertIs(None, open_memory_tracker({}))
+
+    def test_from_environment(self):
+        tracker = open_memory_tracker({
+            MEMORY_ENVIRONMENT_VARIABLE: '5',
+            MEMORY_SAMPLE_ENVIRONMENT_VARIABLE: '0.5',
+        })
+        self.assertEqual((5, 0.5), (tracker._limit, tracker._sample))
+
+
+class TestReporterMemory(unittest.TestCase):
+
+    def setUp(self):
+        super(TestReporterMemory, self).setUp()
+        self.addCleanup(_LEAKS.__delitem__, slice(None))
+        os.environ[MEMORY_ENVIRONMENT_VARIABLE] = '5'
+        self.addCleanup(os.environ.pop, MEMORY_ENVIRONMENT_VARIABLE)
+
+    @capture_logging(None)
+    def test_logged_inside_test(self, logger):
+        reporter = make_reporter(logger=logger)
+        self.assertIsInstance(reporter._memory, MemoryTracker)
+        reporter._memory = MemoryTracker(limit=5, backend=_GCBackend())
+        test = make_test(None, lambda ignored: leak(10))
+        test.run(reporter)
+        [message] = LoggedMessage.of_type(logger.messages, MEMORY)
+        self.assertEqual(
+            set([logger.messages[0]['task_uuid']]),
+            set(x['task_uuid'] for x in logger.messages))
+        self.assertIn(
+            u'{}.Leaked'.format(__name__),
+            [site['site'] for site in message.message['top']])
+
+
+class TestRanking(unittest.TestCase):
+
+    def test_rank(self):
+        def memory(net_size, net_count):
+            return m(message_type=u'trial:test:memory', net_size=net_size,
+                     net_count=net_count, top=[])
+        entries = (
+            make_test_messages(u'a', u'test_a', 1.0, 2.0, memory(10, 1)) +
+            make_test_messages(u'b', u'test_b', 1.0, 2.0) +
+            make_test_messages(u'c', u'test_c', 1.0, 2.0, memory(500, 2)) +
+            make_test_messages(u'd', u'test_d', 1.0, 2.0, memory(-5, 1))
+        )
+        self.assertEqual(
+            [u'test_c', u'test_a', u'test_d'],
+            [r[0] for r in rank_by_memory(iter_test_results(entries))])
@@ -13,13 +13,36 @@
 # limitations under the License.
 
 from datetime import datetime
+import json
+from StringIO import StringIO
+import sys
 import time
 
-from pyrsistent import m, pmap
+from pyrsistent import m, pmap, thaw
 import unittest2 as unittest
 
 
-from .._parse import Action, Message, parse_json_stream, to_tasks
+from .._parse import (
+    Action,
+    ERROR,
+    FAILURE,
+    Message,
+    Predicate,
+    SKIP,
+    Segment,
+    SUCCESS,
+    TestResult,
+    follow_lines,
+    _follow,
+    filter_tests,
+    format_result,
+    iter_test_results,
+    main,
+    parse_json_stream,
+    parse_json_stream_filtered,
+    parse_test_entries,
+    to_tasks,
+)
 
 
 class TestParser(unittest.TestCase):
@@ -30,6 +53,75 @@ class TestParser(unittest.TestCase):
         self.assertEqual(expected, list(parse_json_stream(data.splitlines())))
 
 
+class TestFilteredParser(unittest.TestCase):
+
+    def make_lines(self):
+        return [json.dumps(thaw(x)) for x in [
+            m(task_uuid=u'a', action_type=u'trial:test',
+              action_status=u'started', test=u'a.B.test_a'),
+            m(task_uuid=u'a', message_type=u'noise', data=u'trial:test'),
+            m(task_uuid=u'b', message_type=u'trial:test:error',
+              reason=u'boom', traceback=u'...'),
+            m(task_uuid=u'b', action_type=u'trial:testing',
+              action_status=u'started', test=u'a.B.test_b'),
+        ]]
+
+    def parse(self, predicates, keys=None):
+        return list(
+            parse_json_stream_filtered(self.make_lines(), predicates, keys))
+
+    def test_action_type(self):
+        [entry] = self.parse([Predicate(action_type=u'trial:test')])
+        self.assertEqual(u'a.B.test_a', entry['test'])
+
+    def test_message_type(self):
+        [entry] = self.parse([Predicate(message_type=u'trial:test:error')])
+        self.assertEqual(u'boom', entry['reason'])
+
+    def test_task_uuid(self):
+        entries = self.parse([Predicate(task_uuid=u'b')])
+        self.assertEqual([u'b', u'b'], [e['task_uuid'] for e in entries])
+
+    def test_test_prefix(self):
+        entries = self.parse([Predicate(test_prefix=u'a.B.')])
+        self.assertEqual(
+            [u'a.B.test_a', u'a.B.test_b'], [e['test'] for e in entries])
+        self.assertEqual([], self.parse([Predicate(test_prefix=u'B.')]))
+
+    def test_all_fields_must_match(self):
+        predicate = Predicate(action_type=u'trial:test', task_uuid=u'b')
+        self.assertEqual([], self.parse([predicate]))
+
+    def test_any_predicate(self):
+        entries = self.parse([
+            Predicate(action_type=u'trial:test'),
+            Predicate(message_type=u'trial:test:error'),
+        ])
+        self.assertEqual([u'a', u'b'], [e['task_uuid'] for e in entries])
+
+    def test_keys(self):
+        [entry] = self.parse(
+            [Predicate(message_type=u'trial:test:error')],
+            keys=['task_uuid', 'reason', 'missing'])
+        self.assertEqual(m(task_uuid=u'b', reason=u'boom'), entry)
+
+    def test_unmatched_lines_not_decoded(self):
+        lines = ['not json'] + self.make_lines()
+        [entry] = parse_json_stream_filtered(
+            lines, [Predicate(action_type=u'trial:test')])
+        self.assertEqual(u'a', entry['task_uuid'])
+
+    def test_test_entries(self):
+        error = m(message_type=u'trial:test:error', reason=u'boom')
+        entries = make_test_messages(u'a', u'a.B.test_a', 1.0, 2.0, error)
+        noise = m(task_uuid=u'a', task_level=[9], message_type=u'noise')
+        lines = [json.dumps(thaw(x)) for x in [noise] + entries]
+        self.assertEqual(entries, list(parse_test_entries(lines)))
+        self.assertEqual(
+            list(iter_test_results(entries)),
+            list(iter_test_results(parse_test_entries(lines))))
+
+
 class TestMessage(unittest.TestCase):
 
     def make_uuid(self):
@@ -59,6 +151,28 @@ class TestMessage(unittest.TestCase):
         message = Message.new(data)
         self.assertEqual(datetime.fromtimestamp(timestamp), message.timestamp)
 
+    def test_timestamp_not_converted(self):
+        timestamp = self.make_timestamp()
+        message = Message.new(self.make_message_data(timestamp=timestamp))
+        self.assertRaises(
+            AttributeError, object.__getattribute__, message, 'timestamp')
+        self.assertEqual(datetime.fromtimestamp(timestamp), message.timestamp)
+
+    def test_no_timestamp(self):
+        message = Message.new(self.make_message_data())
+        self.assertIs(None, message.timestamp)
+
+    def test_constructor_timestamp(self):
+        timestamp = datetime.fromtimestamp(self.make_timestamp())
+        message = Message(task_uuid=u'a', timestamp=timestamp)
+        self.assertEqual(timestamp, message.timestamp)
+
+    def test_set_timestamp(self):
+        message = Message.new(
+            self.make_message_data(timestamp=self.make_timestamp()))
+        timestamp = datetime(2015, 1, 1)
+        self.assertEqual(timestamp, message.set(timestamp=timestamp).timestamp)
+
     def test_other_fields(self):
         data = self.make_message_data(foo="bar", baz="qux")
         message = Message.new(data)
@@ -188,3 +302,245 @@ class TestActions(unittest.TestCase):
     # XXX: Actions that contain actions
 
     # XXX: Duration property
+
+
+class StopFollowing(Exception):
+    """Raised by ``GrowingFile`` to stop ``follow_lines``."""
+
+
+class GrowingFile(object):
+    """
+    A fake file that has ``chunks`` appended to it, one per ``sleep``.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = list(chunks)
+        self._data = ''
+        self.sleeps = 0
+
+    def readline(self):
+        index = self._data.find('\n')
+        if index == -1:
+            line, self._data = self._data, ''
+        else:
+            line, self._data = self._data[:index + 1], self._data[index + 1:]
+        return line
+
+    def sleep(self, interval):
+        if not self._chunks:
+            raise StopFollowing()
+        self.sleeps += 1
+        self._data += self._chunks.pop(0)
+
+
+def take_lines(f):
+    lines = []
+    try:
+        for line in follow_lines(f, sleep=f.sleep):
+            lines.append(line)
+    except StopFollowing:
+        pass
+    return lines
+
+
+class TestFollowLines(unittest.TestCase):
+
+    def test_complete_lines(self):
+        f = GrowingFile(['{"a": 1}\n{"b": 2}\n'])
+        self.assertEqual(['{"a": 1}\n', '{"b": 2}\n'], take_lines(f))
+
+    def test_partial_line(self):
+        f = GrowingFile(['{"a": 1}\n{"b"', ': 2}', '\n'])
+        self.assertEqual(['{"a": 1}\n', '{"b": 2}\n'], take_lines(f))
+        self.assertEqual(3, f.sleeps)
+
+    def test_never_finished_line(self):
+        f = GrowingFile(['{"a": 1}\n{"b"'])
+        self.assertEqual(['{"a": 1}\n'], take_lines(f))
+
+    def test_blank_lines(self):
+        f = GrowingFile(['{"a": 1}\n\n'])
+        self.assertEqual(['{"a": 1}\n'], take_lines(f))
+
+
+def make_test_messages(task_uuid, test, start_time, end_time, *details):
+    messages = [
+        m(task_uuid=task_uuid, task_level=[1], action_type=u'trial:test',
+          action_status=u'started', test=test, timestamp=start_time),
+    ]
+    for i, detail in enumerate(details):
+        messages.append(detail.update(
+            {'task_uuid': task_uuid, 'task_level': [i + 2]}))
+    messages.append(
+        m(task_uuid=task_uuid, task_level=[len(details) + 2],
+          action_type=u'trial:test', action_status=u'succeeded',
+          timestamp=end_time))
+    return messages
+
+
+class TestIterTestResults(unittest.TestCase):
+
+    def test_success(self):
+        entries = make_test_messages('foo', 'a.B.test_c', 10.0, 12.5)
+        [result] = iter_test_results(entries)
+        self.assertEqual(
+            TestResult(
+                test='a.B.test_c',
+                task_uuid='foo',
+                outcome=SUCCESS,
+                start_time=10.0,
+                end_time=12.5,
+                details=[],
+            ),
+            result)
+        self.assertEqual(2.5, result.duration())
+
+    def test_outcomes(self):
+        error = m(message_type=u'trial:test:error', reason=u'boom')
+        failure = m(message_type=u'trial:test:failure', reason=u'1 != 2')
+        skip = m(message_type=u'trial:test:skip', reason=u'meh')
+        entries = (
+            make_test_messages('a', 'a.B.test_a', 1.0, 2.0, failure) +
+            make_test_messages('b', 'a.B.test_b', 2.0, 3.0, skip) +
+            make_test_messages('c', 'a.B.test_c', 3.0, 4.0, failure, error)
+        )
+        results = list(iter_test_results(entries))
+        self.assertEqual(
+            [FAILURE, SKIP, ERROR], [r.outcome for r in results])
+        self.assertEqual(
+            [u'1 != 2', u'boom'],
+            [d['reason'] for d in results[2].details])
+
+    def test_interleaved(self):
+        first = make_test_messages('a', 'a.B.test_a', 1.0, 5.0)
+        second = make_test_messages('b', 'a.B.test_b', 2.0, 3.0)
+        entries = [first[0], second[0], second[1], first[1]]
+        self.assertEqual(
+            ['a.B.test_b', 'a.B.test_a'],
+            [r.test for r in iter_test_results(entries)])
+
+    def test_unfinished(self):
+        entries = make_test_messages('a', 'a.B.test_a', 1.0, 5.0)
+        self.assertEqual([], list(iter_test_results(entries[:-1])))
+
+    def test_ignores_other_messages(self):
+        entries = [m(task_uuid='x', task_level=[1], message_type=u'other')]
+        entries.extend(make_test_messages('a', 'a.B.test_a', 1.0, 5.0))
+        [result] = iter_test_results(entries)
+        self.assertEqual(SUCCESS, result.outcome)
+
+    def test_format_result(self):
+        [result] = iter_test_results(
+            make_test_messages('a', 'a.B.test_a', 1.0, 1.25))
+        self.assertEqual(
+            u'a.B.test_a ... [SUCCESS] (0.250s)\n', format_result(result))
+
+
+class TestFilterTests(unittest.TestCase):
+
+    def test_prefix(self):
+        entries = (
+            make_test_messages(
+                'a', 'a.B.test_a', 1.0, 2.0,
+                m(message_type=u'trial:test:failure', reason=u'no')) +
+            [m(task_uuid='x', task_level=[1], message_type=u'other')] +
+            make_test_messages('b', 'c.D.test_b', 2.0, 3.0) +
+            make_test_messages('c', 'a.B.test_c', 3.0, 4.0))
+        self.assertEqual(
+            ['a', 'a', 'a', 'c', 'c'],
+            [e['task_uuid'] for e in filter_tests(entries, 'a.B.')])
+
+
+class Interrupted(object):
+    """
+    A file with ``lines`` in it, that is interrupted once they've been read.
+    """
+
+    def __init__(self, lines):
+        self._lines = list(lines)
+
+    def readline(self):
+        if not self._lines:
+            raise KeyboardInterrupt()
+        return self._lines.pop(0)
+
+
+class TestFollow(unittest.TestCase):
+
+    def test_writes_utf8(self):
+        messages = make_test_messages(
+            u'a', u'a.B.test_\N{SNOWMAN}', 1.0, 1.25)
+        f = Interrupted(json.dumps(thaw(x)) + '\n' for x in messages)
+        output = StringIO()
+        _follow(f, output)
+        self.assertEqual(
+            u'a.B.test_\N{SNOWMAN} ... [SUCCESS] (0.250s)\n'.encode('utf-8'),
+            output.getvalue())
+
+    def test_test_prefix(self):
+        messages = (
+            make_test_messages(u'a', u'a.B.test_a', 1.0, 1.25) +
+            make_test_messages(u'b', u'a.C.test_b', 1.25, 1.5))
+        f = Interrupted(json.dumps(thaw(x)) + '\n' for x in messages)
+        output = StringIO()
+        _follow(f, output, u'a.C.')
+        self.assertEqual(
+            'a.C.test_b ... [SUCCESS] (0.250s)\n', output.getvalue())
+
+
+class TestMain(unittest.TestCase):
+
+    def test_counts_with_test(self):
+        self.addCleanup(setattr, sys, 'stderr', sys.stderr)
+        sys.stderr = StringIO()
+        self.assertRaises(
+            SystemExit, main, ['--counts', '--test', 'a.B', 'some.log'])
+        self.assertIn('--counts can\'t be used with --test',
+                      sys.stderr.getvalue())
+
+
+def make_segment(min_test, max_test, start_time, end_time):
+    return Segment(
+        path='segment.log',
+        bytes=100,
+        tests=2,
+        min_test=min_test,
+        max_test=max_test,
+        start_time=start_time,
+        end_time=end_time,
+    )
+
+
+class TestSegment(unittest.TestCase):
+
+    def test_no_query(self):
+        segment = make_segment(None, None, None, None)
+        self.assertTrue(segment.may_contain())
+
+    def test_test_prefix(self):
+        segment = make_segment('a.b.C.test_x', 'a.d.E.test_y', 1.0, 2.0)
+        self.assertTrue(segment.may_contain(test_prefix='a.b'))
+        self.assertTrue(segment.may_contain(test_prefix='a.c'))
+        self.assertTrue(segment.may_contain(test_prefix='a.d.E'))
+        self.assertTrue(segment.may_contain(test_prefix='a'))
+        self.assertFalse(segment.may_contain(test_prefix='a.a'))
+        self.assertFalse(segment.may_contain(test_prefix='a.e'))
+        self.assertFalse(segment.may_contain(test_prefix='b'))
+
+    def test_no_tests(self):
+        segment = make_segment(None, None, None, None)
+        self.assertFalse(segment.may_contain(test_prefix='a'))
+        self.assertFalse(segment.may_contain(since=1.0))
+
+    def test_unfinished(self):
+        segment = make_segment(None, None, None, None).set(finished=False)
+        self.assertTrue(segment.may_contain(test_prefix='a'))
+        self.assertTrue(segment.may_contain(since=1.0, until=2.0))
+
+    def test_times(self):
+        segment = make_segment('a', 'b', 10.0, 20.0)
+        self.assertTrue(segment.may_contain(since=15.0))
+        self.assertTrue(segment.may_contain(until=15.0))
+        self.assertTrue(segment.may_contain(since=5.0, until=25.0))
+        self.assertFalse(segment.may_contain(since=21.0))
+        self.assertFalse(segment.may_contain(until=9.0))
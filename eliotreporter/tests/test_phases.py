@@ -0,0 +1,210 @@
+# Copyright (c) 2015 Jonathan M. Lange <jml@mumak.net>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+from StringIO import StringIO
+
+from pyrsistent import m, thaw
+from twisted.internet import defer, reactor, task
+from twisted.trial.unittest import SynchronousTestCase, TestCase
+import unittest2 as unittest
+
+from .._parse import (
+    ERROR,
+    SUCCESS,
+    iter_test_results,
+    parse_json_stream,
+)
+from .._phases import (
+    CLEANUP,
+    SET_UP,
+    TEAR_DOWN,
+    TEST_METHOD,
+    PhasesMixin,
+    SynchronousPhasesMixin,
+    format_summary,
+    iter_phase_timings,
+    parse_phase_entries,
+    summarize_phases,
+)
+from .test_reporter import make_reporter
+
+
+class SynchronousExample(SynchronousPhasesMixin, SynchronousTestCase):
+
+    def setUp(self):
+        self.addCleanup(lambda: None)
+
+    def passing(self):
+        pass
+
+    def failing(self):
+        self.fail('failed')
+
+    def tearDown(self):
+        pass
+
+
+class AsynchronousExample(PhasesMixin, TestCase):
+
+    def setUp(self):
+        return task.deferLater(reactor, 0, lambda: None)
+
+    def passing(self):
+        return task.deferLater(reactor, 0, lambda: None)
+
+    def erroring(self):
+        return defer.fail(RuntimeError('broken'))
+
+
+def run_tests(*tests):
+    stream = StringIO()
+    reporter = make_reporter(stream=stream)
+    try:
+        for test in tests:
+            test.run(reporter)
+    finally:
+        reporter.done()
+    return stream.getvalue().splitlines()
+
+
+def get_phases(lines):
+    return [
+        (timing.test.rpartition(u'.')[2], timing.phase, timing.status)
+        for timing in iter_phase_timings(parse_phase_entries(lines))
+    ]
+
+
+class TestMixins(unittest.TestCase):
+
+    def test_synchronous(self):
+        lines = run_tests(
+            SynchronousExample('passing'), SynchronousExample('failing'))
+        self.assertEqual([
+            (u'passing', SET_UP, u'succeeded'),
+            (u'passing', TEST_METHOD, u'succeeded'),
+            (u'passing', CLEANUP, u'succeeded'),
+            (u'passing', TEAR_DOWN, u'succeeded'),
+            (u'failing', SET_UP, u'succeeded'),
+            (u'failing', TEST_METHOD, u'succeeded'),
+            (u'failing', CLEANUP, u'succeeded'),
+            (u'failing', TEAR_DOWN, u'succeeded'),
+        ], get_phases(lines))
+        # The failure is still found, although it's inside the phase.
+        self.assertEqual(
+            [SUCCESS, u'failure'],
+            [r.outcome
+             for r in iter_test_results(parse_json_stream(lines))])
+
+    def test_asynchronous(self):
+        lines = run_tests(
+            AsynchronousExample('passing'),
+            AsynchronousExample('erroring'))
+        self.assertEqual([
+            (u'passing', SET_UP, u'succeeded'),
+            (u'passing', TEST_METHOD, u'succeeded'),
+            (u'passing', TEAR_DOWN, u'succeeded'),
+            (u'erroring', SET_UP, u'succeeded'),
+            (u'erroring', TEST_METHOD, u'failed'),
+            (u'erroring', TEAR_DOWN, u'succeeded'),
+        ], get_phases(lines))
+        self.assertEqual(
+            [SUCCESS, ERROR],
+            [r.outcome
+             for r in iter_test_results(parse_json_stream(lines))])
+
+    def test_phases_inside_test(self):
+        lines = run_tests(SynchronousExample('passing'))
+        entries = [json.loads(line) for line in lines]
+        self.assertEqual(
+            set([entries[0]['task_uuid']]),
+            set(entry['task_uuid'] for entry in entries))
+        self.assertEqual(
+            [[2, 1], [3, 1], [4, 1], [5, 1]],
+            [entry['task_level'] for entry in entries
+             if entry.get('action_status') == u'started' and
+             entry.get('action_type') == u'trial:test:phase'])
+
+
+def phase_messages(task_uuid, level, phase, start, end):
+    return [
+        m(task_uuid=task_uuid, task_level=[level, 1], timestamp=start,
+          action_type=u'trial:test:phase', action_status=u'started',
+          phase=phase),
+        m(task_uuid=task_uuid, task_level=[level, 2], timestamp=end,
+          action_type=u'trial:test:phase', action_status=u'succeeded'),
+    ]
+
+
+def make_phased_messages(task_uuid, test, phases):
+    messages = [
+        m(task_uuid=task_uuid, task_level=[1], timestamp=0.0,
+          action_type=u'trial:test', action_status=u'started', test=test)]
+    for level, (phase, start, end) in enumerate(phases, 2):
+        messages.extend(phase_messages(task_uuid, level, phase, start, end))
+    messages.append(
+        m(task_uuid=task_uuid, task_level=[len(phases) + 2],
+          timestamp=10.0, action_type=u'trial:test',
+          action_status=u'succeeded'))
+    return messages
+
+
+class TestSummary(unittest.TestCase):
+
+    def get_summary(self):
+        entries = (
+            make_phased_messages(u'a', u'a.Slow.test_a', [
+                (SET_UP, 0.0, 3.0), (TEST_METHOD, 3.0, 3.5),
+                (TEAR_DOWN, 3.5, 4.0)]) +
+            make_phased_messages(u'b', u'a.Slow.test_b', [
+                (SET_UP, 0.0, 2.0), (TEST_METHOD, 2.0, 2.5)]) +
+            make_phased_messages(u'c', u'a.Fast.test_c', [
+                (SET_UP, 0.0, 0.25), (TEST_METHOD, 0.25, 1.0),
+                (CLEANUP, 1.0, 2.0)])
+        )
+        return summarize_phases(iter_phase_timings(entries))
+
+    def test_totals(self):
+        summary = self.get_summary()
+        self.assertEqual({
+            SET_UP: (5.25, 3),
+            TEST_METHOD: (1.75, 3),
+            CLEANUP: (1.0, 1),
+            TEAR_DOWN: (0.5, 1),
+        }, thaw(summary.phases))
+        self.assertEqual(8.5, summary.total())
+
+    def test_most_expensive_fixtures(self):
+        self.assertEqual([
+            (u'a.Slow', SET_UP, 5.0, 2),
+            (u'a.Fast', CLEANUP, 1.0, 1),
+        ], self.get_summary().most_expensive_fixtures(2))
+
+    def test_unfinished_phase(self):
+        entries = make_phased_messages(
+            u'a', u'a.B.test_a', [(SET_UP, 0.0, 1.0)])
+        del entries[2]
+        self.assertEqual([], list(iter_phase_timings(entries)))
+
+    def test_format(self):
+        output = format_summary(self.get_summary(), top=1)
+        self.assertEqual([
+            u'setUp           5.250s  61.8%  (3 runs)',
+            u'test            1.750s  20.6%  (3 runs)',
+            u'cleanup         1.000s  11.8%  (1 runs)',
+            u'tearDown        0.500s   5.9%  (1 runs)',
+            u'',
+            u'Most expensive fixtures:',
+            u'     5.000s  a.Slow.setUp  (2 runs, 2.500s each)',
+        ], output.splitlines())
@@ -0,0 +1,191 @@
+# Copyright (c) 2015 Jonathan M. Lange <jml@mumak.net>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import shutil
+from StringIO import StringIO
+import sys
+import tempfile
+
+import numpy as np
+from pyrsistent import m, thaw
+import unittest2 as unittest
+
+from .._parse import iter_test_results
+from .._regress import (
+    DurationHistory,
+    _row_medians,
+    main,
+    passing_durations,
+)
+from .test_parse import make_test_messages
+
+
+def make_history(runs, window=10):
+    history = DurationHistory(window=window)
+    for durations in runs:
+        history.add_run(durations)
+    return history
+
+
+class TestDurationHistory(unittest.TestCase):
+
+    def setUp(self):
+        super(TestDurationHistory, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_ring_buffer(self):
+        history = make_history(
+            [{u'a': float(i)} for i in range(5)], window=3)
+        self.assertEqual(5, history.runs)
+        self.assertEqual([[3.0, 4.0, 2.0]], history.durations.tolist())
+
+    def test_new_and_missing_tests(self):
+        history = make_history([{u'a': 1.0}, {u'b': 2.0}], window=3)
+        self.assertEqual([u'a', u'b'], history.tests)
+        np.testing.assert_array_equal(
+            np.array([[1.0, np.nan, np.nan], [np.nan, 2.0, np.nan]]),
+            history.durations)
+
+    def test_save_and_load(self):
+        history = make_history([{u'a': 1.0, u'b': 2.0}, {u'a': 1.5}])
+        history.save(self.directory)
+        loaded = DurationHistory.load(self.directory)
+        self.assertEqual(
+            (history.tests, 2, 10),
+            (loaded.tests, loaded.runs, loaded.window))
+        np.testing.assert_array_equal(
+            history.durations, loaded.durations)
+
+    def test_load_missing(self):
+        history = DurationHistory.load(self.directory, window=7)
+        self.assertEqual(([], 0, 7), (history.tests, history.runs,
+                                      history.window))
+
+    def test_load_without_durations(self):
+        make_history([{u'a': 1.0}]).save(self.directory)
+        os.remove(os.path.join(self.directory, 'durations.npy'))
+        history = DurationHistory.load(self.directory, window=7)
+        self.assertEqual(([], 0, 7), (history.tests, history.runs,
+                                      history.window))
+
+    def test_load_interrupted_save(self):
+        make_history([{u'a': 1.0}]).save(self.directory)
+        with open(os.path.join(self.directory, 'history.json')) as f:
+            metadata = f.read()
+        make_history([{u'a': 1.0}, {u'b': 2.0}]).save(self.directory)
+        with open(os.path.join(self.directory, 'history.json'), 'w') as f:
+            f.write(metadata)
+        history = DurationHistory.load(self.directory)
+        self.assertEqual(([u'a'], 1), (history.tests, history.runs))
+        history.add_run({u'c': 3.0})
+        self.assertEqual([u'a', u'c'], history.tests)
+        np.testing.assert_array_equal(
+            np.array([[1.0, np.nan], [np.nan, 3.0]]),
+            history.durations[:, :2])
+
+
+class TestFindRegressions(unittest.TestCase):
+
+    def test_slower(self):
+        history = make_history([
+            {u'steady': 1.0, u'noisy': 1.0 + i % 3, u'slow': 0.5}
+            for i in range(9)])
+        [regression] = history.find_regressions(
+            {u'steady': 1.05, u'noisy': 3.5, u'slow': 2.0})
+        self.assertEqual(
+            (u'slow', 2.0, 0.5, 0.0, 9),
+            (regression.test, regression.duration, regression.median,
+             regression.mad, regression.runs))
+        self.assertEqual(float('inf'), regression.score)
+        self.assertEqual(1.5, regression.slowdown())
+
+    def test_ranked_by_slowdown(self):
+        history = make_history([{u'a': 1.0, u'b': 1.0}] * 5)
+        self.assertEqual(
+            [u'b', u'a'],
+            [r.test
+             for r in history.find_regressions({u'a': 2.0, u'b': 5.0})])
+
+    def test_robust_to_outliers(self):
+        runs = [{u'a': 1.0 + 0.01 * i} for i in range(9)]
+        runs[3] = {u'a': 60.0}
+        [regression] = make_history(runs).find_regressions({u'a': 2.0})
+        self.assertAlmostEqual(1.05, regression.median, places=5)
+
+    def test_too_few_runs(self):
+        history = make_history([{u'a': 1.0}] * 4 + [{u'b': 1.0}])
+        self.assertEqual([], history.find_regressions({u'a': 9.0}))
+        self.assertEqual(
+            [u'a'],
+            [r.test
+             for r in history.find_regressions({u'a': 9.0}, min_runs=4)])
+
+    def test_unknown_test(self):
+        history = make_history([{u'a': 1.0}] * 5)
+        self.assertEqual([], history.find_regressions({u'b': 9.0}))
+
+    def test_row_medians(self):
+        a = np.array([[3.0, 1.0, 2.0, np.nan], [4.0, np.nan, 1.0, 2.0],
+                      [np.nan, np.nan, np.nan, 5.0]])
+        self.assertEqual(
+            [2.0, 2.0, 5.0],
+            _row_medians(a, np.array([3, 3, 1])).tolist())
+
+
+class TestMain(unittest.TestCase):
+
+    def setUp(self):
+        super(TestMain, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.stdout = StringIO()
+        self.patch_stdout()
+
+    def patch_stdout(self):
+        original = sys.stdout
+        sys.stdout = self.stdout
+        self.addCleanup(setattr, sys, 'stdout', original)
+
+    def write_log(self, duration):
+        path = os.path.join(self.directory, 'test.log')
+        with open(path, 'w') as f:
+            for message in make_test_messages(
+                    u'x', u'a.B.test_c', 0.0, duration):
+                f.write(json.dumps(thaw(message)) + '\n')
+        return path
+
+    def test_records_and_reports(self):
+        history = os.path.join(self.directory, 'history')
+        for i in range(5):
+            self.assertIs(None, main([
+                history, self.write_log(1.0 + 0.01 * i), '--record']))
+        self.assertEqual(1, main([history, self.write_log(3.0)]))
+        self.assertIn(u'a.B.test_c', self.stdout.getvalue().splitlines()[-1])
+        self.assertEqual(5, DurationHistory.load(history).runs)
+
+
+class TestPassingDurations(unittest.TestCase):
+
+    def test_only_passing(self):
+        entries = (
+            make_test_messages(u'x', u'a.B.test_c', 0.0, 1.0) +
+            make_test_messages(
+                u'y', u'a.B.test_d', 0.0, 9.0,
+                m(message_type=u'trial:test:error')))
+        self.assertEqual(
+            {u'a.B.test_c': 1.0},
+            passing_durations(iter_test_results(entries)))
@@ -13,15 +13,21 @@
 # limitations under the License.
 
 from StringIO import StringIO
+import gc
+import os
+import subprocess
+import sys
 import unittest2 as unittest
 
-from eliot import Field, MemoryLogger, MessageType
+from eliot import Field, MemoryLogger, Message, MessageType
 from eliot.testing import assertContainsFields, capture_logging, LoggedAction
+from twisted.python.reflect import namedAny
 from twisted.trial.test import test_reporter
 from twisted.trial.unittest import SkipTest, SynchronousTestCase
 
-from eliotreporter import EliotReporter
-from .._reporter import TEST, InvalidStateError
+from eliotreporter import EliotReporter, SubunitReporter, eliot_plugin
+from .._environment import SHIP_ENVIRONMENT_VARIABLE
+from .._reporter import TEST, InvalidStateError, _Router, _router
 
 
 DUMMY_MESSAGE = MessageType(
@@ -348,6 +354,162 @@ class TestEliotReporterDefences(unittest.TestCase):
 
 
 
+class RecordingReporter(object):
+
+    def __init__(self):
+        self.messages = []
+
+    def _write_message(self, message):
+        self.messages.append(message)
+
+
+class BrokenReporter(object):
+
+    def _write_message(self, message):
+        raise RuntimeError('broken')
+
+
+class TestDestinations(unittest.TestCase):
+
+    def test_done_stops_output(self):
+        stream = StringIO()
+        reporter = make_reporter(stream)
+        self.addCleanup(reporter.done)
+        DUMMY_MESSAGE(foo='before').write()
+        reporter.done()
+        DUMMY_MESSAGE(foo='after').write()
+        self.assertIn('before', stream.getvalue())
+        self.assertNotIn('after', stream.getvalue())
+
+    def test_done_twice(self):
+        reporter = make_reporter()
+        reporter.done()
+        reporter.done()
+
+    def test_routes_to_live_reporters(self):
+        router = _Router()
+        first, second = RecordingReporter(), RecordingReporter()
+        router.add(first)
+        router.add(second)
+        self.addCleanup(router.remove, second)
+        router({'foo': 'bar'})
+        router.remove(first)
+        router({'baz': 'qux'})
+        self.assertEqual([{'foo': 'bar'}], first.messages)
+        self.assertEqual([{'foo': 'bar'}, {'baz': 'qux'}], second.messages)
+
+    def test_broken_reporter_removed(self):
+        errors = StringIO()
+        router = _Router(errors)
+        broken, working = BrokenReporter(), RecordingReporter()
+        router.add(broken)
+        router.add(working)
+        self.addCleanup(router.remove, working)
+        router({'foo': 'bar'})
+        router({'baz': 'qux'})
+        self.assertEqual([{'foo': 'bar'}, {'baz': 'qux'}], working.messages)
+        self.assertEqual([working], list(router._reporters))
+        self.assertIn('RuntimeError: broken', errors.getvalue())
+
+    def test_failed_reporter_not_routed_to(self):
+        before = set(_router._reporters)
+        os.environ[SHIP_ENVIRONMENT_VARIABLE] = 'carrier-pigeon:1'
+        try:
+            make_reporter()
+        except ValueError:
+            # The traceback keeps the half-built reporter alive.
+            pass
+        else:
+            self.fail('Reporter started with a bad address')
+        finally:
+            del os.environ[SHIP_ENVIRONMENT_VARIABLE]
+        self.assertEqual(before, set(_router._reporters))
+        stream = StringIO()
+        reporter = make_reporter(stream)
+        Message.log(message_type=u'after')
+        reporter.done()
+        self.assertIn('after', stream.getvalue())
+
+    def test_unregisters_when_no_reporters(self):
+        router = _Router()
+        reporters = [RecordingReporter() for i in range(100)]
+        for reporter in reporters:
+            router.add(reporter)
+        self.assertTrue(router._registered)
+        for reporter in reporters:
+            router.remove(reporter)
+        self.assertFalse(router._registered)
+
+    def test_forgets_collected_reporters(self):
+        router = _Router()
+        router.add(RecordingReporter())
+        live = RecordingReporter()
+        router.add(live)
+        self.addCleanup(router.remove, live)
+        gc.collect()
+        self.assertEqual([live], list(router._reporters))
+
+
+class TestPlugin(unittest.TestCase):
+
+    def get_plugin(self):
+        from twisted.plugins._eliotreporter import EliotReporter as plugin
+        return plugin
+
+    def test_finds_reporter(self):
+        plugin = self.get_plugin()
+        self.assertIs(
+            EliotReporter, namedAny(plugin.module + '.' + plugin.klass))
+
+    def test_matches_package(self):
+        plugin = self.get_plugin()
+        for name in ['name', 'module', 'description', 'longOpt', 'shortOpt',
+                     'klass']:
+            self.assertEqual(
+                getattr(eliot_plugin, name), getattr(plugin, name))
+
+    def test_lightweight(self):
+        """
+        Importing the plugin doesn't import the reporter or its dependencies.
+        """
+        code = (
+            'import sys, twisted.plugins._eliotreporter; '
+            'print(sorted(m for m in ["eliot", "pyrsistent", "toolz", '
+            '"eliotreporter"] if m in sys.modules))'
+        )
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        output = subprocess.check_output(
+            [sys.executable, '-c', code], env=env)
+        self.assertEqual('[]', output.strip())
+
+    def test_subunit_plugin(self):
+        from twisted.plugins._eliotreporter import EliotSubunitReporter
+        self.assertIs(
+            SubunitReporter,
+            namedAny(EliotSubunitReporter.module + '.' +
+                     EliotSubunitReporter.klass))
+
+    def test_features_off_not_imported(self):
+        """
+        Making a reporter doesn't import the optional features that aren't
+        turned on.
+        """
+        code = (
+            'import sys; from StringIO import StringIO; '
+            'import eliotreporter; '
+            'eliotreporter.EliotReporter(StringIO()).done(); '
+            'print(sorted(m for m in ["_latency", "_live", "_memory", '
+            '"_sampling", "_ship", "_subunit"] '
+            'if "eliotreporter." + m in sys.modules))'
+        )
+        env = dict(
+            (name, value) for name, value in os.environ.items()
+            if not name.startswith('TRIAL_ELIOT_'))
+        env['PYTHONPATH'] = os.pathsep.join(sys.path)
+        output = subprocess.check_output(
+            [sys.executable, '-c', code], env=env)
+        self.assertEqual('[]', output.strip())
+
 
 class InterfaceTests(test_reporter.ReporterInterfaceTests):
 
@@ -0,0 +1,138 @@
+# Copyright (c) 2015 Jonathan M. Lange <jml@mumak.net>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+from StringIO import StringIO
+import tempfile
+
+from pyrsistent import m
+import unittest2 as unittest
+
+from .._cache import load_parsed_log
+from .._parse import iter_test_results, parse_json_stream
+from .._rerun import (
+    find_tests_to_rerun,
+    format_rerun,
+    merge_logs,
+    trial_command,
+)
+from .test_cache import serialize
+from .test_parse import make_test_messages
+
+
+ERROR_MESSAGE = m(message_type=u'trial:test:error', reason=u'boom')
+FAILURE_MESSAGE = m(message_type=u'trial:test:failure', reason=u'no')
+
+
+class TestRerun(unittest.TestCase):
+
+    def setUp(self):
+        super(TestRerun, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write_log(self, name, messages):
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as f:
+            f.write(serialize(messages))
+        return path
+
+    def load(self, path):
+        return load_parsed_log(path, os.path.join(self.directory, 'cache'))
+
+    def make_previous(self):
+        crashed = make_test_messages(u'd', u'a.B.test_d', 4.0, 5.0)
+        return self.load(self.write_log('previous.log', (
+            make_test_messages(
+                u'a', u'a.B.test_a', 1.0, 2.0, FAILURE_MESSAGE) +
+            make_test_messages(u'b', u'a.B.test_b', 2.0, 3.0) +
+            make_test_messages(u'c', u'a.B.test_c', 3.0, 4.0, ERROR_MESSAGE) +
+            [m(message_type=u'app:noise', task_uuid=u'x', task_level=[1])] +
+            crashed[:1])))
+
+    def test_find(self):
+        self.assertEqual(
+            [u'a.B.test_a', u'a.B.test_c', u'a.B.test_d'],
+            find_tests_to_rerun(self.make_previous()))
+
+    def test_last_result_counts(self):
+        parsed = self.load(self.write_log('previous.log', (
+            make_test_messages(
+                u'a', u'a.B.test_a', 1.0, 2.0, FAILURE_MESSAGE) +
+            make_test_messages(u'b', u'a.B.test_b', 2.0, 3.0) +
+            make_test_messages(u'c', u'a.B.test_a', 3.0, 4.0) +
+            make_test_messages(
+                u'd', u'a.B.test_b', 4.0, 5.0, ERROR_MESSAGE))))
+        self.assertEqual([u'a.B.test_b'], find_tests_to_rerun(parsed))
+
+    def test_trial_command(self):
+        self.assertEqual(
+            ['python', '-m', 'twisted.trial', '--reporter=eliot', '-j4',
+             u'a.B.test_a'],
+            trial_command([u'a.B.test_a'], ['-j4'], python='python'))
+
+    def test_merge(self):
+        previous = self.make_previous()
+        # test_d crashed again, before finishing.
+        rerun_path = self.write_log('rerun.log', (
+            make_test_messages(u'e', u'a.B.test_a', 6.0, 7.0) +
+            make_test_messages(u'f', u'a.B.test_c', 7.0, 8.0, ERROR_MESSAGE) +
+            make_test_messages(u'g', u'a.B.test_d', 8.0, 9.0)[:1]))
+        output = StringIO()
+        rerun = merge_logs(previous, rerun_path, output)
+        self.assertEqual(
+            {u'a.B.test_a': (u'success', 1.0),
+             u'a.B.test_c': (u'error', 1.0)},
+            rerun)
+        entries = list(parse_json_stream(output.getvalue().splitlines()))
+        self.assertEqual(
+            [(u'a.B.test_b', u'success'), (u'a.B.test_a', u'success'),
+             (u'a.B.test_c', u'error')],
+            [(r.test, r.outcome) for r in iter_test_results(entries)])
+        # Messages outside of tests, and unfinished tests that weren't
+        # replaced, are kept.
+        self.assertEqual(
+            [u'x', u'd', u'g'],
+            [e[u'task_uuid'] for e in entries
+             if e[u'task_uuid'] in (u'd', u'x', u'g')])
+
+    def test_merge_many_unfinished(self):
+        uuids = [u'q', u'c', u'x', u'a', u'm', u'f']
+        previous = self.load(self.write_log('previous.log', sum([
+            make_test_messages(
+                task_uuid, u'a.B.test_' + task_uuid, 1.0, 2.0)[:1]
+            for task_uuid in uuids], [])))
+        rerun_path = self.write_log(
+            'rerun.log', make_test_messages(u'z', u'a.B.test_m', 3.0, 4.0))
+        output = StringIO()
+        merge_logs(previous, rerun_path, output)
+        entries = list(parse_json_stream(output.getvalue().splitlines()))
+        self.assertEqual(
+            [u'q', u'c', u'x', u'a', u'f', u'z', u'z'],
+            [e[u'task_uuid'] for e in entries])
+
+    def test_format(self):
+        self.assertEqual([
+            u'Ran 3 tests again: 1 fixed, 1 still failing, 1 did not finish.',
+            u'',
+            u'Still failing:',
+            u'  a.B.test_c',
+            u'',
+            u'Did not finish:',
+            u'  a.B.test_d',
+        ], format_rerun(
+            [u'a.B.test_a', u'a.B.test_c', u'a.B.test_d'],
+            {u'a.B.test_a': (u'success', 1.0),
+             u'a.B.test_c': (u'error', 1.0)}).splitlines())
@@ -0,0 +1,144 @@
+# Copyright (c) 2015 Jonathan M. Lange <jml@mumak.net>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+from StringIO import StringIO
+
+from eliot import Message
+import unittest2 as unittest
+
+from .._environment import (
+    COUNTS_INTERVAL_ENVIRONMENT_VARIABLE,
+    SAMPLE_ENVIRONMENT_VARIABLE,
+)
+from .._parse import iter_test_results, parse_json_stream
+from .._sampling import (
+    PassSampler,
+    count_outcomes,
+    is_sampled,
+    open_pass_sampler,
+)
+from .test_reporter import make_reporter, make_test
+
+
+def passing(test):
+    Message.log(message_type=u'app:step')
+
+
+def failing(test):
+    test.fail('nope')
+
+
+def skipping(test):
+    test.skipTest('later')
+
+
+def set_environment(test_case, **environ):
+    for key, value in environ.items():
+        os.environ[key] = value
+        test_case.addCleanup(os.environ.pop, key)
+
+
+class TestOpenPassSampler(unittest.TestCase):
+
+    def test_disabled_by_default(self):
+        self.assertIs(None, open_pass_sampler({}))
+
+    def test_everything(self):
+        self.assertIs(None, open_pass_sampler(
+            {SAMPLE_ENVIRONMENT_VARIABLE: '1'}))
+
+    def test_from_environment(self):
+        sampler = open_pass_sampler({
+            SAMPLE_ENVIRONMENT_VARIABLE: '0.25',
+            COUNTS_INTERVAL_ENVIRONMENT_VARIABLE: '50',
+        })
+        self.assertEqual((0.25, 50), (sampler._sample, sampler._interval))
+
+
+class TestIsSampled(unittest.TestCase):
+
+    def test_nested(self):
+        tests = [u'a.B.test_%d' % (i,) for i in range(1000)]
+        small = set(t for t in tests if is_sampled(t, 0.1))
+        large = set(t for t in tests if is_sampled(t, 0.5))
+        self.assertTrue(small < large)
+
+
+class TestPassSampler(unittest.TestCase):
+
+    def test_unsampled_pass_dropped(self):
+        sampler = PassSampler(0.0, interval=2)
+        sampler.start_test(u'a.B.test_c')
+        start = {u'task_uuid': u'x', u'action_type': u'trial:test',
+                 u'action_status': u'started', u'timestamp': 1.0}
+        other = {u'task_uuid': u'y', u'message_type': u'app:elsewhere'}
+        end = {u'task_uuid': u'x', u'action_type': u'trial:test',
+               u'action_status': u'succeeded', u'timestamp': 3.5}
+        self.assertEqual(
+            [True, False, True],
+            [sampler.hold(start), sampler.hold(other), sampler.hold(end)])
+        self.assertEqual([], sampler.stop_test())
+        self.assertFalse(sampler.counts_due())
+        self.assertEqual(
+            {u'passed': 1, u'duration': 2.5}, sampler.take_counts())
+        self.assertIs(None, sampler.take_counts())
+
+    def test_sampled_not_held(self):
+        sampler = PassSampler(1.0)
+        sampler.start_test(u'a.B.test_c')
+        self.assertFalse(sampler.hold({u'action_type': u'trial:test'}))
+        self.assertEqual([], sampler.stop_test())
+        self.assertIs(None, sampler.take_counts())
+
+
+class TestReporterSampling(unittest.TestCase):
+
+    def run_tests(self, functions, **environ):
+        set_environment(self, **environ)
+        stream = StringIO()
+        reporter = make_reporter(stream)
+        try:
+            for function in functions:
+                make_test(None, function).run(reporter)
+        finally:
+            reporter.done()
+        return reporter, stream.getvalue().splitlines()
+
+    def test_only_failures_logged(self):
+        reporter, lines = self.run_tests(
+            [passing, failing, passing, skipping, passing],
+            **{SAMPLE_ENVIRONMENT_VARIABLE: '0',
+               COUNTS_INTERVAL_ENVIRONMENT_VARIABLE: '2'})
+        self.assertEqual(5, reporter.testsRun)
+        results = list(iter_test_results(parse_json_stream(lines)))
+        self.assertEqual(
+            [u'failure', u'skip'], [r.outcome for r in results])
+        counts = [json.loads(line) for line in lines
+                  if 'trial:test:counts' in line]
+        self.assertEqual([2, 1], [c['passed'] for c in counts])
+        self.assertNotIn('app:step', ''.join(lines))
+        self.assertEqual(
+            {u'success': 3, u'failure': 1, u'skip': 1},
+            dict(count_outcomes(lines)))
+
+    def test_everything_logged_by_default(self):
+        reporter, lines = self.run_tests([passing, failing])
+        self.assertEqual(
+            [u'success', u'failure'],
+            [r.outcome for r in iter_test_results(parse_json_stream(lines))])
+        self.assertEqual(2, reporter.testsRun)
+        self.assertEqual(
+            {u'success': 1, u'failure': 1}, dict(count_outcomes(lines)))
@@ -0,0 +1,172 @@
+# Copyright (c) 2015 Jonathan M. Lange <jml@mumak.net>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+
+from pyrsistent import m
+import unittest2 as unittest
+
+from .._shards import (
+    Failure,
+    RunSummary,
+    find_shard_logs,
+    format_run_summary,
+    shard_name,
+    summarize_shard,
+    summarize_shards,
+)
+from .test_cache import serialize
+from .test_parse import make_test_messages
+
+
+ERROR_MESSAGE = m(
+    message_type=u'trial:test:error', reason=u'boom\nand more')
+SKIP_MESSAGE = m(message_type=u'trial:test:skip', reason=u'later')
+
+
+class TestShards(unittest.TestCase):
+
+    def setUp(self):
+        super(TestShards, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write_log(self, run, shard, messages):
+        directory = os.path.join(self.directory, run)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        path = os.path.join(directory, shard)
+        with open(path, 'wb') as f:
+            f.write(serialize(messages))
+        return path
+
+    def write_shards(self):
+        return [
+            self.write_log('1', 'shard-1.log', (
+                make_test_messages(u'a', u'a.B.test_a', 1.0, 2.0) +
+                make_test_messages(
+                    u'b', u'a.B.test_b', 2.0, 5.0, ERROR_MESSAGE))),
+            self.write_log('1', 'shard-2.log', (
+                make_test_messages(u'c', u'a.B.test_c', 1.0, 1.5) +
+                [m(message_type=u'trial:test:counts', task_uuid=u'x',
+                   task_level=[1], passed=3, duration=0.5)] +
+                # Never finished.
+                make_test_messages(u'd', u'a.B.test_d', 2.0, 3.0)[:1])),
+            self.write_log('2', 'shard-1.log', (
+                make_test_messages(
+                    u'e', u'a.B.test_e', 1.0, 1.25, SKIP_MESSAGE) +
+                make_test_messages(
+                    u'f', u'a.B.test_b', 1.25, 2.0, ERROR_MESSAGE))),
+        ]
+
+    def test_shard_name(self):
+        self.assertEqual(
+            ('1234', 'shard-7.log'), shard_name('ci/1234/shard-7.log'))
+
+    def test_summarize_shard(self):
+        [path, _, _] = self.write_shards()
+        summary = summarize_shard(path, slowest=1)
+        self.assertEqual(
+            ('1', 'shard-1.log', {u'success': 1, u'error': 1}, 4.0, 1.0, 5.0),
+            (summary.run, summary.shard, dict(summary.counts),
+             summary.test_time, summary.start_time, summary.end_time))
+        self.assertEqual([(3.0, u'a.B.test_b')], list(summary.slowest))
+        self.assertEqual(
+            [Failure(test=u'a.B.test_b', outcome=u'error', reason=u'boom',
+                     duration=3.0, run='1', shard='shard-1.log')],
+            list(summary.failures))
+
+    def test_sampled_passes_counted(self):
+        [_, path, _] = self.write_shards()
+        summary = summarize_shard(path)
+        self.assertEqual({u'success': 4}, dict(summary.counts))
+        self.assertEqual(1.0, summary.test_time)
+
+    def test_unexpected_success_not_failing(self):
+        path = self.write_log('1', 'shard-1.log', (
+            make_test_messages(
+                u'a', u'a.B.test_a', 1.0, 2.0,
+                m(message_type=u'trial:test:unexpected-success',
+                  todo=u'later')) +
+            make_test_messages(u'b', None, 2.0, 3.0, ERROR_MESSAGE)))
+        summary = summarize_shard(path)
+        self.assertEqual(
+            {u'unexpected-success': 1, u'error': 1}, dict(summary.counts))
+        self.assertEqual([None], [f.test for f in summary.failures])
+        run = RunSummary()
+        run.add(summary)
+        self.assertEqual(1, run.runs['1'][2])
+        self.assertIn(
+            u'[ERROR] None (1/shard-1.log)', format_run_summary(run))
+
+    def test_merge(self):
+        summary = summarize_shards(self.write_shards(), processes=1)
+        self.assertEqual(
+            {u'success': 5, u'error': 2, u'skip': 1}, dict(summary.counts))
+        self.assertEqual(
+            {'1': [2, 6, 1, 1.0, 5.0], '2': [1, 2, 1, 1.0, 2.0]},
+            summary.runs)
+        self.assertEqual(
+            [('1', 'shard-1.log'), ('2', 'shard-1.log')],
+            [(f.run, f.shard) for f in summary.failures])
+        self.assertEqual(
+            [(3.0, u'a.B.test_b', '1', 'shard-1.log'),
+             (1.0, u'a.B.test_a', '1', 'shard-1.log')],
+            summary.slowest_tests()[:2])
+        self.assertEqual(
+            (4.0, '1', 'shard-1.log'), summary.slowest_shards()[0])
+
+    def test_parallel(self):
+        paths = self.write_shards()
+        self.assertEqual(
+            format_run_summary(summarize_shards(paths, processes=1)),
+            format_run_summary(summarize_shards(paths, processes=2)))
+
+    def test_failures_limited(self):
+        summary = RunSummary(max_failures=1)
+        for path in self.write_shards():
+            summary.add(summarize_shard(path))
+        self.assertEqual(
+            ([u'a.B.test_b'], 1),
+            ([f.test for f in summary.failures], summary.more_failures))
+
+    def test_find_shard_logs(self):
+        paths = self.write_shards()
+        self.assertEqual(
+            sorted(paths),
+            find_shard_logs([
+                os.path.join(self.directory, '*', 'shard-*.log'),
+                paths[0]]))
+        self.assertRaises(
+            ValueError, find_shard_logs,
+            [os.path.join(self.directory, 'nothing-*.log')])
+
+    def test_format(self):
+        paths = self.write_shards()
+        output = format_run_summary(summarize_shards(paths, processes=1))
+        self.assertEqual([
+            u'Ran 8 tests in 3 shards of 2 runs: '
+            u'2 error, 1 skip, 5 success',
+            u'Total test time: 6.000s',
+            u'',
+            u' shards   tests failing       wall  run',
+            u'      2       6       1     4.000s  1',
+            u'      1       2       1     1.000s  2',
+            u'',
+            u'Failures:',
+            u'  [ERROR] a.B.test_b (1/shard-1.log): boom',
+            u'  [ERROR] a.B.test_b (2/shard-1.log): boom',
+        ], output.splitlines()[:10])
@@ -0,0 +1,262 @@
+# Copyright (c) 2015 Jonathan M. Lange <jml@mumak.net>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import errno
+import os
+import shutil
+import socket
+from StringIO import StringIO
+import tempfile
+import threading
+
+import unittest2 as unittest
+
+from .._environment import (
+    SHIP_BUDGET_ENVIRONMENT_VARIABLE,
+    SHIP_ENVIRONMENT_VARIABLE,
+)
+from .._reporter import _open_outputs
+from .._ship import (
+    ShippingDestination,
+    parse_address,
+)
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class Collector(object):
+    """
+    A stand-in for a log collector, listening on a Unix socket.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._server = None
+        self._connections = []
+
+    def listen(self):
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(self.path)
+        self._server.listen(5)
+
+    def accept(self):
+        connection, _ = self._server.accept()
+        self._connections.append(connection)
+        return connection
+
+    def read_all(self, connection):
+        chunks = []
+        while True:
+            data = connection.recv(65536)
+            if not data:
+                return b''.join(chunks)
+            chunks.append(data)
+
+    def close(self):
+        for connection in self._connections:
+            connection.close()
+        if self._server is not None:
+            self._server.close()
+
+
+class BrokenConnection(object):
+    """
+    A connection that takes its first ``accept`` bytes, then is reset.
+    """
+
+    def __init__(self, accept):
+        self.accept = accept
+        self.received = b''
+
+    def send(self, data):
+        if not self.accept:
+            raise socket.error(errno.ECONNRESET, 'Connection reset by peer')
+        data = data[:self.accept]
+        self.accept -= len(data)
+        self.received += data
+        return len(data)
+
+    def close(self):
+        pass
+
+
+def make_lines(count):
+    return [b'{"n": %d, "padding": "%s"}\n' % (i, b'x' * 100)
+            for i in range(count)]
+
+
+class TestParseAddress(unittest.TestCase):
+
+    def test_tcp(self):
+        self.assertEqual(
+            (socket.AF_INET, ('127.0.0.1', 9000)),
+            parse_address('tcp:127.0.0.1:9000'))
+
+    def test_unix(self):
+        self.assertEqual(
+            (socket.AF_UNIX, '/tmp/foo'), parse_address('unix:/tmp/foo'))
+
+    def test_bad(self):
+        self.assertRaises(ValueError, parse_address, 'tcp:localhost')
+        self.assertRaises(ValueError, parse_address, 'udp:localhost:9000')
+
+
+class TestShippingDestination(unittest.TestCase):
+
+    def setUp(self):
+        super(TestShippingDestination, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.collector = Collector(os.path.join(self.directory, 'collector'))
+        self.addCleanup(self.collector.close)
+        self.clock = FakeClock()
+
+    def make_destination(self, **kwargs):
+        kwargs.setdefault('clock', self.clock)
+        kwargs.setdefault('spool_directory', self.directory)
+        return ShippingDestination(
+            (socket.AF_UNIX, self.collector.path), **kwargs)
+
+    def test_ships(self):
+        self.collector.listen()
+        destination = self.make_destination(batch_size=1)
+        lines = make_lines(10)
+        for line in lines:
+            destination.write(line)
+        connection = self.collector.accept()
+        destination.close()
+        self.assertEqual(b''.join(lines), self.collector.read_all(connection))
+        self.assertIs(None, destination.unsent_path)
+
+    def test_batches(self):
+        self.collector.listen()
+        destination = self.make_destination(
+            batch_size=1000, batch_interval=10)
+        lines = make_lines(3)
+        for line in lines:
+            destination.write(line)
+        self.assertEqual(sum(map(len, lines)), destination.pending())
+        self.assertEqual(0, destination.bytes_sent)
+        self.clock.now += 10
+        destination.write(b'{}\n')
+        self.assertEqual(0, destination.pending())
+
+    def test_reconnects_with_backoff(self):
+        destination = self.make_destination(
+            batch_size=1, initial_backoff=1.0)
+        lines = make_lines(3)
+        destination.write(lines[0])
+        # Collector isn't there, so nothing is sent.
+        self.assertEqual(len(lines[0]), destination.pending())
+        self.collector.listen()
+        # Too soon to try again.
+        destination.write(lines[1])
+        self.assertEqual(0, destination.bytes_sent)
+        self.clock.now += 1.0
+        destination.write(lines[2])
+        connection = self.collector.accept()
+        self.assertEqual(0, destination.pending())
+        destination.close()
+        self.assertEqual(b''.join(lines), self.collector.read_all(connection))
+
+    def test_spills_to_disk_under_backpressure(self):
+        self.collector.listen()
+        destination = self.make_destination(batch_size=1, max_memory=4096)
+        lines = make_lines(20000)
+        for line in lines:
+            destination.write(line)
+        # The collector hasn't read anything, so most of it is waiting, but
+        # only a little of it is in memory.
+        self.assertGreater(destination.pending(), 4096)
+        self.assertLessEqual(destination._memory_size, 4096)
+        connection = self.collector.accept()
+        received = []
+        reader = threading.Thread(
+            target=lambda: received.append(
+                self.collector.read_all(connection)))
+        reader.start()
+        destination.close(timeout=10.0)
+        reader.join()
+        self.assertEqual(b''.join(lines), received[0])
+
+    def test_partly_sent_line_sent_again_whole(self):
+        self.collector.listen()
+        destination = self.make_destination(batch_size=1)
+        lines = make_lines(3)
+        broken = BrokenConnection(len(lines[0]) + 10)
+        destination._socket = broken
+        for line in lines:
+            destination.write(line)
+        self.assertEqual(lines[0] + lines[1][:10], broken.received)
+        self.clock.now += 1.0
+        destination.close()
+        connection = self.collector.accept()
+        self.assertEqual(
+            b''.join(lines[1:]), self.collector.read_all(connection))
+
+    def test_disk_spool_bounded(self):
+        errors = StringIO()
+        destination = self.make_destination(
+            batch_size=1, max_memory=200, max_disk=300, errors=errors)
+        lines = make_lines(10)
+        for line in lines:
+            destination.write(line)
+        self.assertEqual(sum(map(len, lines[3:])), destination.bytes_dropped)
+        destination.close(timeout=0)
+        with open(destination.unsent_path, 'rb') as f:
+            self.assertEqual(b''.join(lines[:3]), f.read())
+        self.assertIn(
+            'dropped {} bytes'.format(destination.bytes_dropped),
+            errors.getvalue())
+
+    def test_budget(self):
+        self.collector.listen()
+        destination = self.make_destination(batch_size=1, budget=0.0)
+        lines = make_lines(3)
+        for line in lines:
+            destination.write(line)
+        self.assertEqual(0, destination.bytes_sent)
+        destination.close()
+        with open(destination.unsent_path, 'rb') as f:
+            self.assertEqual(b''.join(lines), f.read())
+
+    def test_unsent_includes_disk_spool(self):
+        destination = self.make_destination(batch_size=1, max_memory=200)
+        lines = make_lines(10)
+        for line in lines:
+            destination.write(line)
+        destination.close(timeout=0)
+        with open(destination.unsent_path, 'rb') as f:
+            self.assertEqual(b''.join(lines), f.read())
+
+
+class TestOpenOutputs(unittest.TestCase):
+
+    def test_none(self):
+        self.assertEqual([], _open_outputs({}))
+
+    def test_ship(self):
+        [output] = _open_outputs({
+            SHIP_ENVIRONMENT_VARIABLE: 'tcp:127.0.0.1:1',
+            SHIP_BUDGET_ENVIRONMENT_VARIABLE: '0.5',
+        })
+        self.assertIsInstance(output, ShippingDestination)
+        self.assertEqual(0.5, output._budget)
@@ -0,0 +1,231 @@
+# Copyright (c) 2015 Jonathan M. Lange <jml@mumak.net>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from StringIO import StringIO
+import gzip
+import json
+import os
+import shutil
+import tempfile
+
+from pyrsistent import thaw
+import unittest2 as unittest
+
+from .._environment import (
+    FILES_ENVIRONMENT_VARIABLE,
+    SEGMENTS_ENVIRONMENT_VARIABLE,
+    SEGMENT_TESTS_ENVIRONMENT_VARIABLE,
+)
+from .._parse import iter_log_lines, read_manifest
+from .._reporter import _open_outputs
+from .._sinks import (
+    FanOut,
+    FileSink,
+    GzipSink,
+    SegmentedSink,
+    open_file_sinks,
+)
+from .test_live import make_lines
+from .test_parse import make_test_messages
+
+
+class ListSink(object):
+
+    def __init__(self):
+        self.written = []
+        self.closed = False
+
+    def write(self, data):
+        self.written.append(data)
+
+    def close(self):
+        self.closed = True
+
+
+class BrokenSink(ListSink):
+
+    def write(self, data):
+        raise IOError('Disk on fire')
+
+
+class TestFanOut(unittest.TestCase):
+
+    def test_writes_to_all(self):
+        sinks = [ListSink(), ListSink(), ListSink()]
+        fan_out = FanOut(sinks)
+        fan_out.write(b'foo\n')
+        fan_out.write(b'bar\n')
+        fan_out.close()
+        for sink in sinks:
+            self.assertEqual([b'foo\n', b'bar\n'], sink.written)
+            self.assertTrue(sink.closed)
+
+    def test_shares_bytes(self):
+        sinks = [ListSink(), ListSink()]
+        data = b'foo\n'
+        FanOut(sinks).write(data)
+        self.assertIs(sinks[0].written[0], sinks[1].written[0])
+
+    def test_failure_isolated(self):
+        errors = StringIO()
+        good, broken = ListSink(), BrokenSink()
+        fan_out = FanOut([broken, good], errors)
+        fan_out.write(b'foo\n')
+        fan_out.write(b'bar\n')
+        self.assertEqual([b'foo\n', b'bar\n'], good.written)
+        self.assertEqual([good], fan_out.sinks)
+        self.assertTrue(broken.closed)
+        self.assertIn('Disk on fire', errors.getvalue())
+
+    def test_close_failure_isolated(self):
+        class BadClose(ListSink):
+            def close(self):
+                raise IOError('Nope')
+
+        errors = StringIO()
+        good = ListSink()
+        FanOut([BadClose(), good], errors).close()
+        self.assertTrue(good.closed)
+        self.assertIn('Nope', errors.getvalue())
+
+
+class TestFileSinks(unittest.TestCase):
+
+    def setUp(self):
+        super(TestFileSinks, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_file(self):
+        path = os.path.join(self.directory, 'out.log')
+        sink = FileSink(path)
+        sink.write(b'foo\n')
+        sink.close()
+        with open(path, 'rb') as f:
+            self.assertEqual(b'foo\n', f.read())
+
+    def test_gzip(self):
+        path = os.path.join(self.directory, 'out.log.gz')
+        sink = GzipSink(path, buffer_size=10)
+        for i in range(10):
+            sink.write(b'line %d\n' % (i,))
+        sink.close()
+        f = gzip.open(path, 'rb')
+        self.addCleanup(f.close)
+        self.assertEqual(
+            b''.join(b'line %d\n' % (i,) for i in range(10)), f.read())
+
+    def test_open_file_sinks(self):
+        paths = [os.path.join(self.directory, 'a.log'),
+                 os.path.join(self.directory, 'b.log.gz')]
+        sinks = open_file_sinks(os.pathsep.join(paths))
+        self.addCleanup(FanOut(sinks).close)
+        self.assertEqual(
+            [FileSink, GzipSink], [sink.__class__ for sink in sinks])
+
+    def test_open_outputs(self):
+        path = os.path.join(self.directory, 'a.log')
+        [sink] = _open_outputs({FILES_ENVIRONMENT_VARIABLE: path})
+        self.addCleanup(sink.close)
+        self.assertIsInstance(sink, FileSink)
+
+
+class TestSegmentedSink(unittest.TestCase):
+
+    def setUp(self):
+        super(TestSegmentedSink, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write_lines(self, sink, lines):
+        for line in lines:
+            sink.write(line + '\n')
+        sink.close()
+
+    def test_rolls_over_by_tests(self):
+        lines = make_lines(*[
+            ('a.B.test_%d' % i, float(i), i + 0.5, []) for i in range(5)])
+        self.write_lines(SegmentedSink(self.directory, max_tests=2), lines)
+        segments = read_manifest(self.directory)
+        self.assertEqual([2, 2, 1], [s.tests for s in segments])
+        self.assertEqual(
+            [('a.B.test_0', 'a.B.test_1'),
+             ('a.B.test_2', 'a.B.test_3'),
+             ('a.B.test_4', 'a.B.test_4')],
+            [(s.min_test, s.max_test) for s in segments])
+        self.assertEqual(
+            [(0.0, 1.5), (2.0, 3.5), (4.0, 4.5)],
+            [(s.start_time, s.end_time) for s in segments])
+        self.assertEqual(
+            [line + '\n' for line in lines],
+            list(iter_log_lines(self.directory)))
+
+    def test_rolls_over_by_size(self):
+        lines = make_lines(*[
+            ('a.B.test_%d' % i, float(i), i + 0.5, []) for i in range(4)])
+        size = sum(len(line) + 1 for line in lines[:2])
+        self.write_lines(SegmentedSink(self.directory, max_bytes=size), lines)
+        segments = read_manifest(self.directory)
+        self.assertEqual([1, 1, 1, 1], [s.tests for s in segments])
+        self.assertEqual([size] * 4, [s.bytes for s in segments])
+
+    def test_never_splits_a_test(self):
+        first, second = [
+            [json.dumps(thaw(x)) for x in make_test_messages(
+                task_uuid, test, 0.0, 1.0)]
+            for task_uuid, test in [('x', 'a.test_a'), ('y', 'a.test_b')]]
+        # The second test starts before the first finishes.
+        lines = [first[0], second[0], first[1], second[1]]
+        self.write_lines(
+            SegmentedSink(self.directory, max_bytes=1, max_tests=1), lines)
+        [segment] = read_manifest(self.directory)
+        self.assertEqual(2, segment.tests)
+
+    def test_empty(self):
+        SegmentedSink(self.directory).close()
+        [segment] = read_manifest(self.directory)
+        self.assertEqual(0, segment.bytes)
+        self.assertIs(None, segment.min_test)
+
+    def test_manifest_written_as_segments_start(self):
+        lines = make_lines(*[
+            ('a.B.test_%d' % i, float(i), i + 0.5, []) for i in range(3)])
+        sink = SegmentedSink(self.directory, max_tests=2)
+        for line in lines:
+            sink.write(line + '\n')
+        # The run dies: its files are closed, but the sink never is.
+        sink._file.close()
+        segments = read_manifest(self.directory)
+        self.assertEqual(
+            [True, False], [segment.finished for segment in segments])
+        self.assertEqual(
+            [line + '\n' for line in lines[-2:]],
+            list(iter_log_lines(self.directory, test_prefix='a.B.test_2')))
+
+    def test_manifest_is_json(self):
+        lines = make_lines(('a.B.test_a', 1.0, 2.0, []))
+        self.write_lines(SegmentedSink(self.directory), lines)
+        with open(os.path.join(self.directory, 'manifest.json')) as f:
+            manifest = json.load(f)
+        self.assertEqual(
+            ['segment-00000.log'], [s['path'] for s in manifest['segments']])
+
+    def test_open_outputs(self):
+        [sink] = _open_outputs({
+            SEGMENTS_ENVIRONMENT_VARIABLE: self.directory,
+            SEGMENT_TESTS_ENVIRONMENT_VARIABLE: '10',
+        })
+        self.addCleanup(sink.close)
+        self.assertIsInstance(sink, SegmentedSink)
+        self.assertEqual(10, sink._max_tests)
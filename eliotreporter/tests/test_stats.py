@@ -0,0 +1,143 @@
+# Copyright (c) 2015 Jonathan M. Lange <jml@mumak.net>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from pyrsistent import m
+import unittest2 as unittest
+
+from .._stats import (
+    CLASS,
+    MODULE,
+    get_durations,
+    histogram,
+    percentiles,
+    rollup,
+)
+
+
+def make_test_action(task_uuid, test, start_time, duration):
+    return [
+        m(task_uuid=task_uuid, task_level=[1], action_type=u'trial:test',
+          action_status=u'started', test=test, timestamp=start_time),
+        m(task_uuid=task_uuid, task_level=[2], action_type=u'trial:test',
+          action_status=u'succeeded', timestamp=start_time + duration),
+    ]
+
+
+def make_run(*tests):
+    entries = []
+    for i, (test, duration) in enumerate(tests):
+        entries.extend(make_test_action(str(i), test, 100.0 + i, duration))
+    return entries
+
+
+class TestDurations(unittest.TestCase):
+
+    def test_durations(self):
+        entries = make_run(('a.B.test_c', 0.5), ('a.B.test_d', 2.0))
+        durations = get_durations(entries)
+        self.assertEqual([u'a.B.test_c', u'a.B.test_d'],
+                         list(durations.tests()))
+        self.assertEqual([100.0, 101.0], list(durations.start_times))
+        self.assertEqual([0.5, 2.0], list(durations.durations))
+
+    def test_interleaved_and_unrelated_messages(self):
+        first, second = (
+            make_test_action('x', 'a.B.test_c', 10.0, 3.0),
+            make_test_action('y', 'a.B.test_d', 11.0, 1.0),
+        )
+        entries = [
+            first[0],
+            m(task_uuid='x', task_level=[2, 1], message_type=u'noise'),
+            second[0],
+            second[1],
+            first[1],
+        ]
+        durations = get_durations(entries)
+        self.assertEqual([u'a.B.test_d', u'a.B.test_c'],
+                         list(durations.tests()))
+        self.assertEqual([1.0, 3.0], list(durations.durations))
+
+    def test_unfinished_test(self):
+        [start, end] = make_test_action('x', 'a.B.test_c', 10.0, 3.0)
+        durations = get_durations([start])
+        self.assertEqual([], list(durations.tests()))
+        self.assertEqual([], list(durations.durations))
+
+    def test_repeated_test(self):
+        durations = get_durations(
+            make_run(('a.B.test_c', 0.5), ('a.B.test_d', 2.0),
+                     ('a.B.test_c', 1.0)))
+        self.assertEqual([u'a.B.test_c', u'a.B.test_d'],
+                         list(durations.names))
+        self.assertEqual([0, 1, 0], list(durations.codes))
+
+    def test_missing_timestamp(self):
+        [start, end] = make_test_action('x', 'a.B.test_c', 10.0, 3.0)
+        durations = get_durations([start, end.remove('timestamp')])
+        self.assertEqual([], list(durations.tests()))
+        self.assertEqual(1, durations.untimed)
+
+    def test_percentiles(self):
+        durations = get_durations(
+            make_run(*[('a.B.test_%d' % i, float(i)) for i in range(101)]))
+        self.assertEqual([50.0, 90.0], list(percentiles(durations, [50, 90])))
+
+    def test_histogram(self):
+        durations = get_durations(
+            make_run(('a.B.test_c', 0.5), ('a.B.test_d', 1.5),
+                     ('a.B.test_e', 1.6)))
+        counts, edges = histogram(durations, bins=[0, 1, 2])
+        self.assertEqual([1, 2], list(counts))
+
+
+class TestRollup(unittest.TestCase):
+
+    def make_durations(self):
+        return get_durations(make_run(
+            ('a.b.C.test_1', 1.0),
+            ('a.b.D.test_1', 2.0),
+            ('a.b.C.test_2', 3.0),
+            ('a.e.F.test_1', 4.0),
+        ))
+
+    def test_by_class(self):
+        result = rollup(self.make_durations(), CLASS)
+        self.assertEqual([u'a.b.C', u'a.b.D', u'a.e.F'], list(result.groups))
+        self.assertEqual([2, 1, 1], list(result.counts))
+        self.assertEqual([4.0, 2.0, 4.0], list(result.totals))
+        self.assertEqual([3.0, 2.0, 4.0], list(result.maximums))
+        self.assertEqual([2.0, 2.0, 4.0], list(result.means()))
+
+    def test_by_module(self):
+        result = rollup(self.make_durations(), MODULE)
+        self.assertEqual([u'a.b', u'a.e'], list(result.groups))
+        self.assertEqual([3, 1], list(result.counts))
+        self.assertEqual([6.0, 4.0], list(result.totals))
+
+    def test_unnamed_test(self):
+        entries = make_run(
+            ('a.b.C.test_1', 1.0), (None, 2.0), ('a.b.C.test_2', 3.0))
+        result = rollup(get_durations(entries), CLASS)
+        self.assertEqual([u'a.b.C'], list(result.groups))
+        self.assertEqual([2], list(result.counts))
+        self.assertEqual([4.0], list(result.totals))
+
+    def test_only_unnamed_tests(self):
+        result = rollup(get_durations(make_run((None, 2.0))))
+        self.assertEqual([], list(result.groups))
+
+    def test_empty(self):
+        result = rollup(get_durations([]))
+        self.assertEqual([], list(result.groups))
+        self.assertEqual([], list(result.totals))
@@ -0,0 +1,243 @@
+# Copyright (c) 2015 Jonathan M. Lange <jml@mumak.net>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from StringIO import StringIO
+import json
+import os
+import shutil
+import struct
+import tempfile
+import zlib
+
+from pyrsistent import m, thaw
+import unittest2 as unittest
+
+from eliotreporter import SubunitReporter
+from .. import _subunit
+from .._environment import SUBUNIT_ENVIRONMENT_VARIABLE
+from .._reporter import _open_outputs
+from .._subunit import (
+    STATUS_FAIL,
+    STATUS_INPROGRESS,
+    STATUS_SKIP,
+    STATUS_SUCCESS,
+    STATUS_UXSUCCESS,
+    STATUS_XFAIL,
+    SubunitSink,
+    _encode_number,
+    convert,
+    make_packet,
+)
+from .test_parse import make_test_messages
+from .test_reporter import make_failing_test, make_successful_test
+
+
+def _read_number(data, offset):
+    first = ord(data[offset])
+    size = (first >> 6) + 1
+    value = first & 0x3f
+    for byte in data[offset + 1:offset + size]:
+        value = (value << 8) | ord(byte)
+    return value, offset + size
+
+
+def _read_string(data, offset):
+    length, offset = _read_number(data, offset)
+    return data[offset:offset + length], offset + length
+
+
+def read_packets(data):
+    """
+    Decode a stream of subunit v2 packets, checking lengths and CRCs.
+
+    :return: A list of ``dict``, one for each packet.
+    """
+    packets = []
+    offset = 0
+    while offset < len(data):
+        start = offset
+        assert data[offset] == b'\xb3', repr(data[offset])
+        flags, = struct.unpack('>H', data[offset + 1:offset + 3])
+        assert flags & 0xf000 == 0x2000
+        length, offset = _read_number(data, offset + 3)
+        end = start + length
+        crc, = struct.unpack('>I', data[end - 4:end])
+        assert crc == zlib.crc32(data[start:end - 4]) & 0xffffffff
+        packet = {'status': flags & 0x7, 'runnable': bool(flags & 0x0100),
+                  'eof': bool(flags & 0x0010)}
+        if flags & 0x0200:
+            seconds, = struct.unpack('>I', data[offset:offset + 4])
+            nanoseconds, offset = _read_number(data, offset + 4)
+            packet['timestamp'] = seconds + nanoseconds / 1e9
+        if flags & 0x0800:
+            packet['test_id'], offset = _read_string(data, offset)
+        if flags & 0x0020:
+            packet['mime_type'], offset = _read_string(data, offset)
+        if flags & 0x0040:
+            packet['file_name'], offset = _read_string(data, offset)
+            packet['file_bytes'], offset = _read_string(data, offset)
+        assert offset == end - 4
+        packets.append(packet)
+        offset = end
+    return packets
+
+
+def serialize(messages):
+    return [json.dumps(thaw(x)) + '\n' for x in messages]
+
+
+class TestPackets(unittest.TestCase):
+
+    def test_numbers(self):
+        self.assertEqual(b'\x3f', _encode_number(63))
+        self.assertEqual(b'\x40\x40', _encode_number(64))
+        self.assertEqual(b'\x80\x40\x00', _encode_number(2 ** 14))
+        self.assertEqual(b'\xc0\x40\x00\x00', _encode_number(2 ** 22))
+        self.assertRaises(ValueError, _encode_number, 2 ** 30)
+
+    def test_status(self):
+        [packet] = read_packets(make_packet(
+            test_id=u'a.B.test_c', status=STATUS_SUCCESS,
+            timestamp=1435250867.5, runnable=True))
+        self.assertEqual(
+            {'status': STATUS_SUCCESS, 'runnable': True, 'eof': False,
+             'timestamp': 1435250867.5, 'test_id': b'a.B.test_c'},
+            packet)
+
+    def test_long_packet(self):
+        data = make_packet(
+            test_id=u'a', file_name=u'f', file_bytes=b'x' * 100000, eof=True)
+        [packet] = read_packets(data)
+        self.assertEqual(100000, len(packet['file_bytes']))
+        self.assertEqual(len(data), _read_number(data, 3)[0])
+
+
+class TestConvert(unittest.TestCase):
+
+    def convert(self, messages):
+        output = StringIO()
+        convert(serialize(messages), output)
+        return read_packets(output.getvalue())
+
+    def test_success(self):
+        packets = self.convert(
+            make_test_messages(u'a', u'a.B.test_a', 1.0, 2.5))
+        self.assertEqual(
+            [(STATUS_INPROGRESS, b'a.B.test_a', 1.0),
+             (STATUS_SUCCESS, b'a.B.test_a', 2.5)],
+            [(p['status'], p['test_id'], p['timestamp']) for p in packets])
+
+    def test_outcomes(self):
+        error = m(message_type=u'trial:test:error', exception=u'E',
+                  reason=u'boom', traceback=u'Traceback...')
+        skip = m(message_type=u'trial:test:skip', reason=u'meh')
+        xfail = m(message_type=u'trial:test:expected-failure',
+                  todo=u'later', exception=u'E', reason=u'boom',
+                  traceback=u'Traceback...')
+        uxsuccess = m(message_type=u'trial:test:unexpected-success',
+                      todo=u'later')
+        messages = (
+            make_test_messages(u'a', u'test_a', 1.0, 2.0, error) +
+            make_test_messages(u'b', u'test_b', 1.0, 2.0, skip) +
+            make_test_messages(u'c', u'test_c', 1.0, 2.0, xfail) +
+            make_test_messages(u'd', u'test_d', 1.0, 2.0, uxsuccess)
+        )
+        packets = self.convert(messages)
+        final = [p for p in packets if p['runnable'] and
+                 p['status'] != STATUS_INPROGRESS]
+        self.assertEqual(
+            [STATUS_FAIL, STATUS_SKIP, STATUS_XFAIL, STATUS_UXSUCCESS],
+            [p['status'] for p in final])
+        files = dict(
+            ((p['test_id'], p['file_name']), p) for p in packets
+            if 'file_name' in p)
+        traceback = files[(b'test_a', b'traceback')]
+        self.assertEqual(b'Traceback...\nE: boom\n', traceback['file_bytes'])
+        self.assertEqual(
+            b'text/x-traceback; charset=utf8', traceback['mime_type'])
+        self.assertTrue(traceback['eof'])
+        self.assertEqual(b'meh', files[(b'test_b', b'reason')]['file_bytes'])
+        self.assertEqual(b'later', files[(b'test_c', b'todo')]['file_bytes'])
+        self.assertIn((b'test_c', b'traceback'), files)
+        self.assertEqual(b'later', files[(b'test_d', b'todo')]['file_bytes'])
+
+    def test_unique_file_names(self):
+        failure = m(message_type=u'trial:test:failure', exception=u'F',
+                    reason=u'1 != 2', traceback=u'')
+        packets = self.convert(make_test_messages(
+            u'a', u'test_a', 1.0, 2.0, failure, failure))
+        self.assertEqual(
+            [b'traceback', b'traceback-2'],
+            [p['file_name'] for p in packets if 'file_name' in p])
+
+    def test_large_attachment_chunked(self):
+        self.patch_chunk_size(10)
+        failure = m(message_type=u'trial:test:failure', exception=u'F',
+                    reason=u'x' * 35, traceback=u'')
+        packets = self.convert(make_test_messages(
+            u'a', u'test_a', 1.0, 2.0, failure))
+        chunks = [p for p in packets if 'file_name' in p]
+        self.assertEqual(4, len(chunks))
+        self.assertEqual(
+            [True, False, False, False], ['mime_type' in p for p in chunks])
+        self.assertEqual(
+            [False, False, False, True], [p['eof'] for p in chunks])
+        self.assertEqual(
+            b'F: ' + b'x' * 35 + b'\n',
+            b''.join(p['file_bytes'] for p in chunks))
+
+    def patch_chunk_size(self, size):
+        original = _subunit._CHUNK_SIZE
+        _subunit._CHUNK_SIZE = size
+        self.addCleanup(setattr, _subunit, '_CHUNK_SIZE', original)
+
+    def test_ignores_other_messages(self):
+        noise = m(task_uuid=u'x', task_level=[1], message_type=u'other')
+        packets = self.convert(
+            [noise] + make_test_messages(u'a', u'test_a', 1.0, 2.0))
+        self.assertEqual(2, len(packets))
+
+
+class TestSubunitOutput(unittest.TestCase):
+
+    def test_reporter(self):
+        stream = StringIO()
+        reporter = SubunitReporter(stream, None, None, None)
+        self.addCleanup(reporter.done)
+        make_successful_test().run(reporter)
+        make_failing_test('1 != 2').run(reporter)
+        reporter.done()
+        packets = read_packets(stream.getvalue())
+        self.assertEqual(
+            [STATUS_INPROGRESS, STATUS_SUCCESS, STATUS_INPROGRESS,
+             STATUS_FAIL],
+            [p['status'] for p in packets if p['runnable']])
+        [traceback] = [p for p in packets if 'file_name' in p]
+        self.assertIn(b'1 != 2', traceback['file_bytes'])
+
+    def test_sink(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'out.subunit')
+        [sink] = _open_outputs({SUBUNIT_ENVIRONMENT_VARIABLE: path})
+        self.assertIsInstance(sink, SubunitSink)
+        for line in serialize(
+                make_test_messages(u'a', u'test_a', 1.0, 2.0)):
+            sink.write(line)
+        sink.close()
+        with open(path, 'rb') as f:
+            packets = read_packets(f.read())
+        self.assertEqual(
+            [STATUS_INPROGRESS, STATUS_SUCCESS],
+            [p['status'] for p in packets])
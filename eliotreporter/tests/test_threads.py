@@ -0,0 +1,178 @@
+# Copyright (c) 2015 Jonathan M. Lange <jml@mumak.net>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import defaultdict
+import json
+import threading
+import time
+
+from eliot import Message
+import unittest2 as unittest
+
+from .._threads import ThreadMerger, get_ident
+from .test_reporter import make_reporter, make_test
+
+
+def run_in_thread(function, *args):
+    thread = threading.Thread(target=function, args=args)
+    thread.start()
+    thread.join()
+
+
+class TestThreadMerger(unittest.TestCase):
+
+    def setUp(self):
+        super(TestThreadMerger, self).setUp()
+        self.handled = []
+        self.merger = ThreadMerger(
+            lambda message: self.handled.append((get_ident(), message)))
+
+    def test_owner_handled_now(self):
+        self.merger.write(1)
+        self.assertEqual([(get_ident(), 1)], self.handled)
+
+    def test_other_threads_queued(self):
+        def log():
+            self.merger.write(1)
+            self.merger.write(2)
+        run_in_thread(log)
+        self.assertEqual([], self.handled)
+        self.merger.write(3)
+        self.assertEqual(
+            [(get_ident(), 1), (get_ident(), 2), (get_ident(), 3)],
+            self.handled)
+
+    def test_drain(self):
+        run_in_thread(self.merger.write, 1)
+        self.merger.drain()
+        self.assertEqual([(get_ident(), 1)], self.handled)
+
+    def test_finished_threads_forgotten(self):
+        for i in range(3):
+            run_in_thread(self.merger.write, i)
+        self.merger.drain()
+        self.assertEqual([0, 1, 2], [m for _, m in self.handled])
+        self.assertEqual([], self.merger._queues)
+
+    def test_close(self):
+        run_in_thread(self.merger.write, 1)
+        self.merger.close()
+        self.assertEqual([(get_ident(), 1)], self.handled)
+        run_in_thread(self.merger.write, 2)
+        self.merger.drain()
+        self.assertEqual([(get_ident(), 1)], self.handled)
+        self.assertEqual([], self.merger._queues)
+
+
+class TornStream(object):
+    """
+    A stream that writes each piece of data in two halves, giving other
+    threads every chance to write in between.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.writers = set()
+
+    def write(self, data):
+        self.writers.add(get_ident())
+        middle = len(data) // 2
+        self.chunks.append(data[:middle])
+        time.sleep(0)
+        self.chunks.append(data[middle:])
+
+    def getvalue(self):
+        return ''.join(self.chunks)
+
+
+class TestReporterThreads(unittest.TestCase):
+
+    THREADS = 16
+    MESSAGES = 300
+
+    def test_stress(self):
+        stream = TornStream()
+        reporter = make_reporter(stream)
+        start = threading.Event()
+
+        def hammer(thread):
+            start.wait()
+            for i in range(self.MESSAGES):
+                Message.log(
+                    message_type=u'stress', thread=thread, i=i,
+                    payload=u'x' * (i % 200))
+
+        threads = [
+            threading.Thread(target=hammer, args=(i,))
+            for i in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        start.set()
+        owner = 0
+        while any(thread.is_alive() for thread in threads):
+            Message.log(message_type=u'stress', thread=u'owner', i=owner)
+            owner += 1
+        for thread in threads:
+            thread.join()
+        reporter.done()
+
+        self.assertEqual(set([get_ident()]), stream.writers)
+        seen = defaultdict(list)
+        for line in stream.getvalue().splitlines():
+            message = json.loads(line)
+            seen[message['thread']].append(message['i'])
+        for thread in range(self.THREADS):
+            self.assertEqual(range(self.MESSAGES), seen[thread])
+        self.assertEqual(range(owner), seen[u'owner'])
+
+    def test_logged_just_before_done(self):
+        stream = TornStream()
+        reporter = make_reporter(stream)
+        logged = threading.Event()
+        finish = threading.Event()
+
+        def log():
+            Message.log(message_type=u'before-done')
+            logged.set()
+            finish.wait()
+            Message.log(message_type=u'after-done')
+
+        Message.log(message_type=u'owner')
+        thread = threading.Thread(target=log)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(finish.set)
+        logged.wait()
+        reporter.done()
+        finish.set()
+        thread.join()
+        self.assertEqual(
+            [u'owner', u'before-done'],
+            [json.loads(line)['message_type']
+             for line in stream.getvalue().splitlines()])
+
+    def test_inside_test(self):
+        stream = TornStream()
+        reporter = make_reporter(stream)
+        self.addCleanup(reporter.done)
+
+        def log_from_thread(test):
+            run_in_thread(lambda: Message.log(message_type=u'from-thread'))
+
+        make_test(None, log_from_thread).run(reporter)
+        messages = [json.loads(line)
+                    for line in stream.getvalue().splitlines()]
+        self.assertEqual(
+            [u'trial:test', u'from-thread', u'trial:test'],
+            [m.get('action_type', m.get('message_type')) for m in messages])
@@ -30,12 +30,27 @@ setup(
         'Twisted',
         'zope.interface',
     ],
+    extras_require={
+        'stats': ['numpy'],
+    },
     tests_require=[
+        'numpy',
         'unittest2',
     ],
     entry_points={
         'console_scripts': [
+            'trial-eliot-cluster = eliotreporter._cluster:main',
+            'trial-eliot-diff = eliotreporter._diff:main',
+            'trial-eliot-flame = eliotreporter._flame:main',
+            'trial-eliot-flaky = eliotreporter._flaky:main',
+            'trial-eliot-junit = eliotreporter._junit:main',
+            'trial-eliot-live = eliotreporter._live:main',
+            'trial-eliot-memory = eliotreporter._memory:main',
             'trial-eliot-parse = eliotreporter._parse:main',
+            'trial-eliot-phases = eliotreporter._phases:main',
+            'trial-eliot-regress = eliotreporter._regress:main',
+            'trial-eliot-rerun = eliotreporter._rerun:main',
+            'trial-eliot-subunit = eliotreporter._subunit:main',
         ],
     },
     zip_safe=False,
@@ -12,6 +12,46 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import eliotreporter
+"""
+Trial plugin for the Eliot reporter.
 
-EliotReporter = eliotreporter.eliot_plugin
+Trial imports every plugin module whenever it looks for reporters, e.g. for
+``trial --help``, so this deliberately doesn't import ``eliotreporter``.
+Trial imports ``module`` and looks up ``klass`` only when the reporter is
+actually used.
+"""
+
+from twisted.plugin import IPlugin
+from twisted.trial.itrial import IReporter
+from zope.interface import implementer
+
+
+@implementer(IPlugin, IReporter)
+class _Reporter(object):
+
+    def __init__(self, name, module, description, longOpt, shortOpt, klass):
+        self.name = name
+        self.module = module
+        self.description = description
+        self.longOpt = longOpt
+        self.shortOpt = shortOpt
+        self.klass = klass
+
+
+EliotReporter = _Reporter(
+    name="Eliot reporter",
+    description="Output all test results as eliot logs",
+    longOpt="eliot",
+    shortOpt=None,
+    module="eliotreporter",
+    klass="EliotReporter",
+)
+
+EliotSubunitReporter = _Reporter(
+    name="Eliot subunit reporter",
+    description="Output test results as subunit v2",
+    longOpt="eliot-subunit",
+    shortOpt=None,
+    module="eliotreporter",
+    klass="SubunitReporter",
+)